@@ -29,6 +29,26 @@ def create_app(config_name="default"):
     # Initialize extensions
     init_extensions(app)
 
+    # Bind prompt chains to the configured LLM backend
+    from app.utils.chatbot import init_llm
+
+    init_llm(app.config)
+
+    # Start the background meal plan workers
+    from app.utils.job_queue import init_job_queue
+
+    init_job_queue(app)
+
+    # Background chat titles from local keyword extraction
+    from app.utils.chat_titler import init_chat_titler
+
+    init_chat_titler(app)
+
+    # Offline profile archetype clustering (`flask archetypes build`)
+    from app.utils.archetypes import archetypes_cli
+
+    app.cli.add_command(archetypes_cli)
+
     migrate = Migrate(app, db)
 
     # Register blueprints
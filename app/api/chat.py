@@ -2,12 +2,17 @@
 Chat routes blueprint.
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.user import User
+from app.models.user_detail import UserDetail
 from app.models.chat import Chat, Message, SenderType
 from app.extensions import db
-from app.utils.chatbot import chat as chat_with_ai
+from app.utils.chatbot import chat as chat_with_ai, chat_stream
+from app.utils.streaming import STREAM_HEADERS, format_sse, iterate_async
+from app.utils.memory import load_memory, schedule_fold
+from app.utils.chat_titler import schedule_chat_title
+from app.utils.deadline import Budget, budget_context, budget_scope
 import uuid
 from sqlalchemy import func
 
@@ -164,6 +169,9 @@ async def send_message(chat_id):
         
         if not user_message_content:
             return jsonify({"msg": "Message content is required"}), 400
+
+        # Load the summary and recent window before the new message is added
+        memory = load_memory(chat)
         
         # Create user message with constructor parameters
         user_message = Message(
@@ -175,11 +183,12 @@ async def send_message(chat_id):
         db.session.add(user_message)
         
         # Get user details for context
-        user_details = user.user_details[0] if hasattr(user, 'user_details') and user.user_details else None
+        user_details = UserDetail.query.filter_by(user_id=user.id).first()
         user_details_dict = user_details.to_dict() if user_details else {}
         
-        # Get AI response
-        ai_response_content = await chat_with_ai(user_message_content, user_details_dict)
+        # Get AI response within the endpoint's time budget
+        with budget_scope(current_app.config.get("CHAT_DEADLINE_SECONDS")) as budget:
+            ai_response_content = await chat_with_ai(user_message_content, user_details_dict, user.id, memory.render())
         
         # Create AI message with constructor parameters
         ai_message = Message(
@@ -194,16 +203,102 @@ async def send_message(chat_id):
         chat.updated_at = func.now()
         
         db.session.commit()
+
+        # Replace a placeholder title in the background, after the exchange is stored
+        schedule_chat_title(chat.id, chat.title, user_message_content)
+
+        # Fold messages that fell out of the window into the rolling summary, off the request path
+        schedule_fold(chat.id)
         
         return jsonify({
             "user_message": user_message.to_dict(),
-            "ai_message": ai_message.to_dict()
+            "ai_message": ai_message.to_dict(),
+            "degraded": budget.is_degraded
         }), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": "Failed to send message", "error": str(e)}), 500
 
 
+@chat_bp.route('/send-message/<chat_id>/stream', methods=['POST'])
+@jwt_required()
+def send_message_stream(chat_id):
+    """Send a message in a chat and stream the AI response as Server-Sent Events."""
+    try:
+        current_user_email = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_email).first()
+        
+        if not user:
+            return jsonify({"msg": "User not found"}), 401
+        
+        chat = Chat.query.filter_by(id=chat_id, user_id=user.id).first()
+        
+        if not chat:
+            return jsonify({"msg": "Chat not found"}), 404
+        
+        data = request.get_json() or {}
+        user_message_content = data.get('message')
+        
+        if not user_message_content:
+            return jsonify({"msg": "Message content is required"}), 400
+        
+        # Load the summary and recent window before the new message is added
+        memory = load_memory(chat)
+        history = memory.render()
+
+        # Persist the user message before streaming so it survives a disconnect
+        user_message = Message(
+            chat_id=chat.id,
+            content=user_message_content,
+            sent_by=SenderType.USER
+        )
+        db.session.add(user_message)
+        db.session.commit()
+        user_message_dict = user_message.to_dict()
+        
+        user_details = UserDetail.query.filter_by(user_id=user.id).first()
+        user_details_dict = user_details.to_dict() if user_details else {}
+        user_id = user.id
+        chat_title = chat.title
+        budget = Budget(current_app.config.get("CHAT_DEADLINE_SECONDS"))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Failed to send message", "error": str(e)}), 500
+
+    def generate():
+        # The view's session is closed once streaming starts, so rows are re-read here
+        yield format_sse({"user_message": user_message_dict}, event="start")
+        chunks = []
+        try:
+            for chunk in iterate_async(
+                lambda: chat_stream(user_message_content, user_details_dict, user_id, history),
+                budget_context(budget),
+            ):
+                chunks.append(chunk)
+                yield format_sse({"text": chunk}, event="token")
+
+            # Persist the complete AI message once the stream has finished
+            ai_message = Message(
+                chat_id=chat_id,
+                content="".join(chunks),
+                sent_by=SenderType.AI
+            )
+            db.session.add(ai_message)
+            Chat.query.filter_by(id=chat_id).update({"updated_at": func.now()})
+            db.session.commit()
+
+            yield format_sse({"ai_message": ai_message.to_dict()}, event="done")
+            schedule_chat_title(chat_id, chat_title, user_message_content)
+
+            # Fold older messages in the background once the client has its answer
+            schedule_fold(chat_id)
+        except Exception as e:
+            db.session.rollback()
+            yield format_sse({"msg": "Failed to send message", "error": str(e)}, event="error")
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=STREAM_HEADERS)
+
+
 @chat_bp.route('/rename-chat', methods=['PUT'])
 @jwt_required()
 def rename_chat():
@@ -3,7 +3,7 @@ Chatbot routes blueprint.
 """
 
 import json
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
@@ -12,7 +12,18 @@ from app.models.user_detail import UserDetail
 from app.models.meal_plan import MealPlan
 from app.extensions import db
 from app.utils.validators import validate_numeric_string
-from app.utils.chatbot import chat, get_meal_plan_llm
+from app.utils.chatbot import chat, chat_stream, get_day_batcher, get_meal_plan_llm, MEAL_PLAN_MODES
+from app.utils.streaming import STREAM_HEADERS, format_sse, iterate_async
+from app.api.meal_plan import stream_meal_plan, enqueue_meal_plan, job_accepted, wants_background, STREAM_FORMATS
+from app.utils.job_queue import find_pending_job
+from app.utils.llm_cache import get_llm_cache, invalidate_user_cache
+from app.utils.semantic_cache import get_semantic_cache
+from app.utils.single_flight import get_single_flight
+from app.utils.archetypes import get_archetype_index
+from app.utils.intent_router import get_intent_router
+from app.utils.model_router import get_model_router
+from app.utils.prompts import registry as prompt_registry
+from app.utils.deadline import Budget, budget_context, budget_scope, latency
 
 # Create blueprint
 chatbot_bp = Blueprint("chatbot", __name__)
@@ -43,12 +54,56 @@ async def chats():
             return jsonify({"msg": "User details not found please add details."}), 404
 
         user_details_dict = user_details.to_dict()
-        response = await chat(user_input, user_details_dict)
-        return jsonify({"msg": "Chat processed successfully", "response": response})
+        with budget_scope(current_app.config.get("CHAT_DEADLINE_SECONDS")) as budget:
+            response = await chat(user_input, user_details_dict, user.id)
+        return jsonify({"msg": "Chat processed successfully", "response": response, "degraded": budget.is_degraded})
     except Exception as e:
         return jsonify({"msg": "Chat processing failed", "error": str(e)}), 500
 
 
+@chatbot_bp.route("/chat/stream", methods=["POST"])
+@jwt_required()
+def chats_stream():
+    """Handle chat requests, streaming the reply as Server-Sent Events."""
+    try:
+        data = request.json
+        if not data:
+            return jsonify({"msg": "No data provided"}), 400
+
+        user_input = data.get("input")
+        if not user_input or not isinstance(user_input, str):
+            return jsonify({"msg": "Valid input text is required"}), 400
+
+        current_user = get_jwt_identity()
+        user = User.query.filter_by(email=current_user).first()
+
+        if not user:
+            return jsonify({"msg": "User not found"}), 401
+
+        user_details = UserDetail.query.filter_by(user_id=user.id).first()
+
+        if not user_details:
+            return jsonify({"msg": "User details not found please add details."}), 404
+
+        user_details_dict = user_details.to_dict()
+        user_id = user.id
+        budget = Budget(current_app.config.get("CHAT_DEADLINE_SECONDS"))
+    except Exception as e:
+        return jsonify({"msg": "Chat processing failed", "error": str(e)}), 500
+
+    def generate():
+        chunks = []
+        try:
+            for chunk in iterate_async(lambda: chat_stream(user_input, user_details_dict, user_id), budget_context(budget)):
+                chunks.append(chunk)
+                yield format_sse({"text": chunk}, event="token")
+            yield format_sse({"msg": "Chat processed successfully", "response": "".join(chunks)}, event="done")
+        except Exception as e:
+            yield format_sse({"msg": "Chat processing failed", "error": str(e)}, event="error")
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=STREAM_HEADERS)
+
+
 @chatbot_bp.route("/meal-planner", methods=["GET", "POST"])
 @jwt_required()
 async def meal_planner():
@@ -66,25 +121,39 @@ async def meal_planner():
         # For GET requests, try to return existing meal plan
         if request.method == "GET":
             existing_plan = MealPlan.query.filter_by(user_id=user.id, is_active=True).order_by(MealPlan.created_at.desc()).first()
+            pending_job = find_pending_job(user.id)
             if existing_plan:
+                # A stale plan is still served while its replacement is generated
                 return jsonify({
                     "msg": "Retrieved existing meal plan",
                     "data": existing_plan.to_dict(),
+                    "regeneration_job_id": pending_job.id if pending_job else None,
                 })
+            if pending_job:
+                return job_accepted(pending_job, "Meal plan is being generated")
 
         # For POST requests, check for user message
         user_message = None
+        mode = None
         if request.method == "POST":
             data = request.json or {}
             user_message = data.get("message")
+            mode = data.get("mode")
             
             # Validate message if provided
             if user_message is not None and not isinstance(user_message, str):
                 return jsonify({"msg": "Message must be a valid string"}), 400
 
+            if mode is not None and mode not in MEAL_PLAN_MODES:
+                return jsonify({"msg": f"Mode must be one of: {', '.join(MEAL_PLAN_MODES)}"}), 400
+
+            if wants_background():
+                return enqueue_meal_plan(user.id, user_message, mode)
+
         # Generate a new meal plan
         user_details_dict = user_details.to_dict()
-        meal_plan_data = await get_meal_plan_llm(user_details_dict, user_message)
+        with budget_scope(current_app.config.get("MEAL_PLAN_DEADLINE_SECONDS")) as budget:
+            meal_plan_data = await get_meal_plan_llm(user_details_dict, user_message, mode, user.id)
 
         if isinstance(meal_plan_data, dict) and "error" in meal_plan_data:
             return (
@@ -107,8 +176,97 @@ async def meal_planner():
             "msg": "Meal plan generated successfully", 
             "data": meal_plan_data,
             "plan_id": new_meal_plan.id,
-            "created_at": new_meal_plan.created_at.isoformat() if new_meal_plan.created_at else None
+            "created_at": new_meal_plan.created_at.isoformat() if new_meal_plan.created_at else None,
+            "degraded": budget.is_degraded,
+            "degraded_reasons": budget.degraded
         })
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": "Meal planning failed", "error": str(e)}), 500
+
+
+@chatbot_bp.route("/meal-planner/stream", methods=["POST"])
+@jwt_required()
+def meal_planner_stream():
+    """Generate a meal plan, streaming each day as it is generated."""
+    try:
+        current_user_email = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_email).first()
+        if not user:
+            return jsonify({"msg": "User not found"}), 401
+
+        user_details = UserDetail.query.filter_by(user_id=user.id).first()
+        if not user_details:
+            return jsonify({"msg": "User details not found please add details."}), 404
+
+        data = request.json or {}
+        user_message = data.get("message")
+        mode = data.get("mode")
+
+        if user_message is not None and not isinstance(user_message, str):
+            return jsonify({"msg": "Message must be a valid string"}), 400
+
+        if mode is not None and mode not in MEAL_PLAN_MODES:
+            return jsonify({"msg": f"Mode must be one of: {', '.join(MEAL_PLAN_MODES)}"}), 400
+
+        stream_format = request.args.get("format", "sse")
+        if stream_format not in STREAM_FORMATS:
+            return jsonify({"msg": f"Format must be one of: {', '.join(STREAM_FORMATS)}"}), 400
+
+        return stream_meal_plan(user.id, user_details.to_dict(), user_message, mode, stream_format)
+    except Exception as e:
+        return jsonify({"msg": "Meal planning failed", "error": str(e)}), 500
+
+
+@chatbot_bp.route("/cache", methods=["GET"])
+@jwt_required()
+def cache_stats():
+    """Report LLM response cache hit/miss counters for this worker."""
+    cache = get_llm_cache()
+    semantic_cache = get_semantic_cache()
+    flights = get_single_flight()
+    archetypes = get_archetype_index()
+    router = get_intent_router()
+    return jsonify({
+        "msg": "LLM cache stats",
+        "enabled": cache is not None,
+        "stats": cache.stats() if cache is not None else None,
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+        "single_flight": flights.stats() if flights is not None else None,
+        "archetypes": archetypes.stats() if archetypes is not None else None,
+        "intent_router": router.stats() if router is not None else None,
+        "prompt_versions": prompt_registry.versions(),
+    }), 200
+
+
+@chatbot_bp.route("/upstream", methods=["GET"])
+@jwt_required()
+def upstream_stats():
+    """Report LLM rate limit, retry, circuit breaker, batching and model tier state."""
+    guard = getattr(prompt_registry.llm, "guard", None)
+    batcher = get_day_batcher()
+    router = get_model_router()
+    return jsonify({
+        "msg": "LLM upstream stats",
+        "enabled": guard is not None,
+        "stats": guard.stats() if guard is not None else None,
+        "latency": latency.stats(),
+        "batching": batcher.stats() if batcher is not None else None,
+        "model_routing": router.stats() if router is not None else None,
+    }), 200
+
+
+@chatbot_bp.route("/cache", methods=["DELETE"])
+@jwt_required()
+def clear_user_cache():
+    """Drop cached LLM responses generated for the current user."""
+    try:
+        current_user_email = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_email).first()
+        if not user:
+            return jsonify({"msg": "User not found"}), 401
+
+        removed = invalidate_user_cache(user.id)
+        return jsonify({"msg": "Cache cleared", "removed": removed}), 200
+    except Exception as e:
+        return jsonify({"msg": "Failed to clear cache", "error": str(e)}), 500
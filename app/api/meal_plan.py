@@ -2,19 +2,154 @@
 Meal plan routes blueprint.
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, url_for, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.user import User
 from app.models.user_detail import UserDetail
 from app.models.meal_plan import MealPlan
+from app.models.meal_plan_job import MealPlanJob, JobStatus
 from app.extensions import db
-from app.utils.chatbot import get_meal_plan_llm
+from app.utils.chatbot import get_meal_plan_llm, iter_meal_plan_days, regenerate_meal_plan, MEAL_PLAN_MODES, MEAL_SLOTS, WEEK_DAYS
+from app.utils.streaming import STREAM_HEADERS, format_ndjson, format_sse, iterate_async
+from app.utils.job_queue import enqueue_meal_plan_job
+from app.utils.nutrition import annotate_plan
+from app.utils.deadline import Budget, budget_context, budget_scope
 from sqlalchemy import desc
 from pydantic import BaseModel
 
 # Create blueprint
 meal_plan_bp = Blueprint('meal_plan', __name__)
 
+# Output formats for streamed meal plan generation
+STREAM_FORMATS = ("sse", "ndjson")
+
+
+def wants_background():
+    """Whether the client asked for the plan to be generated as a background job (?async=true)."""
+    return request.args.get("async", "false").lower() == "true"
+
+
+def enqueue_meal_plan(user_id, user_message=None, mode=None):
+    """
+    Queue a meal plan job and build the 202 response pointing at its status.
+
+    Args:
+        user_id: Id of the user the plan is for
+        user_message: Optional message from user with specific meal preferences
+        mode: Generation mode, defaults to MEAL_PLAN_GENERATION_MODE
+
+    Returns:
+        A (response, status) tuple
+    """
+    return job_accepted(enqueue_meal_plan_job(user_id, user_message, mode))
+
+
+def job_accepted(job, msg="Meal plan job queued"):
+    """Build the 202 response pointing at a meal plan job's status."""
+    status_url = url_for("meal_plan.get_meal_plan_job", job_id=job.id)
+    return jsonify({
+        "msg": msg,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": status_url
+    }), 202, {"Location": status_url}
+
+
+def parse_regeneration_targets(data):
+    """
+    Read the days and meal slots to regenerate from a request body.
+
+    "days" lists whole days to regenerate; "meals" maps a day to the slots to
+    regenerate, e.g. {"Tuesday": ["Dinner"]}.
+
+    Returns:
+        A (targets, error) tuple; targets maps day name to slots
+    """
+    days = data.get("days") or []
+    meals = data.get("meals") or {}
+    if not isinstance(days, list) or not isinstance(meals, dict):
+        return None, "days must be a list and meals an object"
+
+    targets = {}
+    for day in days:
+        if day not in WEEK_DAYS:
+            return None, f"Unknown day: {day}"
+        targets[day] = list(MEAL_SLOTS)
+    for day, slots in meals.items():
+        if day not in WEEK_DAYS:
+            return None, f"Unknown day: {day}"
+        if not isinstance(slots, list) or not slots or any(slot not in MEAL_SLOTS for slot in slots):
+            return None, f"Meals for {day} must be a non-empty list of: {', '.join(MEAL_SLOTS)}"
+        chosen = set(targets.get(day, [])) | set(slots)
+        targets[day] = [slot for slot in MEAL_SLOTS if slot in chosen]
+
+    if not targets:
+        return None, "Choose at least one day or meal to regenerate"
+    return targets, None
+
+
+def stream_meal_plan(user_id, user_details_dict, user_message=None, mode=None, stream_format="sse"):
+    """
+    Stream a meal plan as each day is generated, then persist it.
+
+    Every finished day is sent as {"Monday": {...}}; the final event carries
+    the id of the saved MealPlan and its nutrition estimates. SSE events are named "day", "done" and
+    "error"; NDJSON records carry the same payloads under an "event" key.
+
+    Args:
+        user_id: Id of the user the plan belongs to
+        user_details_dict: Dictionary containing user health data
+        user_message: Optional message from user with specific meal preferences
+        mode: Generation mode, defaults to MEAL_PLAN_GENERATION_MODE
+        stream_format: "sse" or "ndjson"
+
+    Returns:
+        A streaming Flask response
+    """
+    budget = Budget(current_app.config.get("MEAL_PLAN_DEADLINE_SECONDS"))
+
+    def encode(event, data):
+        if stream_format == "ndjson":
+            return format_ndjson({"event": event, **data})
+        return format_sse(data, event=event)
+
+    def generate():
+        meal_plan_data = {}
+        try:
+            for day, day_meals in iterate_async(
+                lambda: iter_meal_plan_days(user_details_dict, user_message, mode, user_id),
+                budget_context(budget),
+            ):
+                meal_plan_data[day] = day_meals
+                yield encode("day", {day: day_meals})
+
+            meal_plan_data = annotate_plan({day: meal_plan_data[day] for day in WEEK_DAYS})
+
+            # Deactivate previous meal plans
+            MealPlan.query.filter_by(user_id=user_id, is_active=True).update({"is_active": False})
+
+            new_meal_plan = MealPlan(
+                user_id=user_id,
+                plan_data=meal_plan_data
+            )
+            db.session.add(new_meal_plan)
+            db.session.commit()
+
+            yield encode("done", {
+                "msg": "Meal plan generated successfully",
+                "plan_id": new_meal_plan.id,
+                "created_at": new_meal_plan.created_at.isoformat() if new_meal_plan.created_at else None,
+                "nutrition": meal_plan_data.get("nutrition"),
+                "degraded": budget.is_degraded,
+                "degraded_reasons": budget.degraded
+            })
+        except Exception as e:
+            db.session.rollback()
+            yield encode("error", {"msg": "Meal planning failed", "error": str(e)})
+
+    mimetype = "application/x-ndjson" if stream_format == "ndjson" else "text/event-stream"
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=STREAM_HEADERS)
+
 
 @meal_plan_bp.route('/meal-plans', methods=['GET'])
 @jwt_required()
@@ -103,10 +238,18 @@ async def create_custom_meal_plan():
         
         if not user_message or not isinstance(user_message, str):
             return jsonify({"msg": "Valid preferences string is required"}), 400
+
+        mode = data.get("mode")
+        if mode is not None and mode not in MEAL_PLAN_MODES:
+            return jsonify({"msg": f"Mode must be one of: {', '.join(MEAL_PLAN_MODES)}"}), 400
         
+        if wants_background():
+            return enqueue_meal_plan(user.id, user_message, mode)
+
         # Generate a custom meal plan
         user_details_dict = user_details.to_dict()
-        meal_plan_data = await get_meal_plan_llm(user_details_dict, user_message)
+        with budget_scope(current_app.config.get("MEAL_PLAN_DEADLINE_SECONDS")) as budget:
+            meal_plan_data = await get_meal_plan_llm(user_details_dict, user_message, mode, user.id)
         
         if isinstance(meal_plan_data, dict) and "error" in meal_plan_data:
             return jsonify({"msg": "Meal planning failed", "error": meal_plan_data["error"]}), 500
@@ -134,13 +277,143 @@ async def create_custom_meal_plan():
         
         return jsonify({
             "msg": "Custom meal plan created successfully",
-            "data": new_meal_plan.to_dict()
+            "data": new_meal_plan.to_dict(),
+            "degraded": budget.is_degraded,
+            "degraded_reasons": budget.degraded
         }), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": "Failed to create custom meal plan", "error": str(e)}), 500
 
 
+@meal_plan_bp.route('/meal-plans/create/stream', methods=['POST'])
+@jwt_required()
+def create_custom_meal_plan_stream():
+    """Create a custom meal plan, streaming each day as it is generated."""
+    try:
+        current_user_email = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_email).first()
+        
+        if not user:
+            return jsonify({"msg": "User not found"}), 401
+        
+        user_details = UserDetail.query.filter_by(user_id=user.id).first()
+        if not user_details:
+            return jsonify({"msg": "User details not found, please add details"}), 404
+        
+        data = request.json or {}
+        user_message = data.get("preferences")
+        
+        if not user_message or not isinstance(user_message, str):
+            return jsonify({"msg": "Valid preferences string is required"}), 400
+
+        mode = data.get("mode")
+        if mode is not None and mode not in MEAL_PLAN_MODES:
+            return jsonify({"msg": f"Mode must be one of: {', '.join(MEAL_PLAN_MODES)}"}), 400
+
+        stream_format = request.args.get("format", "sse")
+        if stream_format not in STREAM_FORMATS:
+            return jsonify({"msg": f"Format must be one of: {', '.join(STREAM_FORMATS)}"}), 400
+
+        return stream_meal_plan(user.id, user_details.to_dict(), user_message, mode, stream_format)
+    except Exception as e:
+        return jsonify({"msg": "Failed to create custom meal plan", "error": str(e)}), 500
+
+
+@meal_plan_bp.route('/meal-plans/<plan_id>/regenerate', methods=['POST'])
+@jwt_required()
+async def regenerate_meal_plan_parts(plan_id):
+    """Regenerate chosen days or meals of a meal plan and keep everything else."""
+    try:
+        current_user_email = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_email).first()
+        
+        if not user:
+            return jsonify({"msg": "User not found"}), 401
+        
+        meal_plan = MealPlan.query.filter_by(id=plan_id, user_id=user.id).first()
+        
+        if not meal_plan:
+            return jsonify({"msg": "Meal plan not found"}), 404
+        
+        user_details = UserDetail.query.filter_by(user_id=user.id).first()
+        if not user_details:
+            return jsonify({"msg": "User details not found, please add details"}), 404
+        
+        data = request.json or {}
+        targets, error = parse_regeneration_targets(data)
+        if error:
+            return jsonify({"msg": error}), 400
+
+        user_message = data.get("message")
+        if user_message is not None and not isinstance(user_message, str):
+            return jsonify({"msg": "Message must be a valid string"}), 400
+
+        in_place = data.get("in_place", False)
+        if not isinstance(in_place, bool):
+            return jsonify({"msg": "in_place must be a boolean"}), 400
+
+        with budget_scope(current_app.config.get("MEAL_PLAN_DEADLINE_SECONDS")) as budget:
+            new_plan_data = await regenerate_meal_plan(meal_plan.plan_data or {}, targets, user_details.to_dict(), user_message)
+
+        if in_place:
+            meal_plan.plan_data = new_plan_data
+            # Regenerated against the current details
+            meal_plan.stale_since = None
+            meal_plan.stale_reason = None
+            saved_plan = meal_plan
+        else:
+            # Keep the original and save the result as a new, active version
+            MealPlan.query.filter_by(user_id=user.id, is_active=True).update({"is_active": False})
+            saved_plan = MealPlan(
+                user_id=user.id,
+                plan_data=new_plan_data
+            )
+            db.session.add(saved_plan)
+        db.session.commit()
+        
+        return jsonify({
+            "msg": "Meal plan regenerated successfully",
+            "meal_plan": saved_plan.to_dict(),
+            "previous_plan_id": None if in_place else meal_plan.id,
+            "regenerated": targets,
+            "degraded": budget.is_degraded,
+            "degraded_reasons": budget.degraded
+        }), 200 if in_place else 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": "Failed to regenerate meal plan", "error": str(e)}), 500
+
+
+@meal_plan_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_meal_plan_job(job_id):
+    """Get the status of a background meal plan job, with the plan once it is ready."""
+    try:
+        current_user_email = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_email).first()
+        
+        if not user:
+            return jsonify({"msg": "User not found"}), 401
+        
+        job = MealPlanJob.query.filter_by(id=job_id, user_id=user.id).first()
+        
+        if not job:
+            return jsonify({"msg": "Meal plan job not found"}), 404
+        
+        response = {
+            "msg": "Meal plan job retrieved successfully",
+            "job": job.to_dict()
+        }
+        if job.status == JobStatus.SUCCEEDED and job.plan_id:
+            meal_plan = MealPlan.query.filter_by(id=job.plan_id).first()
+            response["meal_plan"] = meal_plan.to_dict() if meal_plan else None
+        
+        return jsonify(response), 200
+    except Exception as e:
+        return jsonify({"msg": "Failed to retrieve meal plan job", "error": str(e)}), 500
+
+
 @meal_plan_bp.route('/meal-plans/<plan_id>/activate', methods=['PUT'])
 @jwt_required()
 def activate_meal_plan(plan_id):
@@ -1,17 +1,52 @@
 """
 User routes blueprint.
 """
+import sys
+from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import current_user, jwt_required, get_jwt_identity
+from sqlalchemy import func
 from app.models.user import User
 from app.models.user_detail import UserDetail
+from app.models.meal_plan import MealPlan
 from app.extensions import db
 from app.utils.validators import validate_numeric_string
+from app.utils.llm_cache import invalidate_user_cache
+from app.utils.job_queue import schedule_meal_plan_refresh
+from app.utils.profile import changed_fields
 
 
 # Create blueprint
 user_bp = Blueprint('user', __name__)
 
+
+def refresh_meal_plan(user_id, changed=None):
+    """
+    Mark the user's active meal plan stale and queue a speculative regeneration.
+
+    Failures are logged and never fail the details request itself.
+
+    Args:
+        user_id: Id of the user whose details were added or updated
+        changed: Meal-plan relevant fields that changed; None for new details
+
+    Returns:
+        The queued MealPlanJob, or None
+    """
+    try:
+        if changed:
+            MealPlan.query.filter_by(user_id=user_id, is_active=True).update({
+                # Keep the time the plan first went stale
+                "stale_since": func.coalesce(MealPlan.stale_since, datetime.now()),
+                "stale_reason": f"Changed: {', '.join(changed)}"[:255],
+            }, synchronize_session=False)
+            db.session.commit()
+        return schedule_meal_plan_refresh(user_id)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Meal plan refresh failed for user {user_id}: {str(e)}", file=sys.stderr)
+        return None
+
 @user_bp.route('/user-details', methods=['POST'])
 @jwt_required()
 def add_user_details():
@@ -91,8 +126,11 @@ def add_user_details():
         
         db.session.add(user_details)
         db.session.commit()
+
+        # Have a plan ready before the first meal planner visit
+        job = refresh_meal_plan(user.id)
         
-        return jsonify({"msg": "User details added successfully"}), 201
+        return jsonify({"msg": "User details added successfully", "meal_plan_job_id": job.id if job else None}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": "Failed to add user details", "error": str(e)}), 500
@@ -150,6 +188,8 @@ def update_user_details():
         if "weight" in data and not validate_numeric_string(data["weight"]):
             return jsonify({"msg": "Invalid weight value"}), 400
 
+        previous_details = user_details.to_dict()
+
         # Update fields
         user_details.age = data.get("age", user_details.age)
         user_details.height = data.get("height", user_details.height)
@@ -178,8 +218,19 @@ def update_user_details():
         user_details.fertilityTreatments = data.get("fertilityTreatments", user_details.fertilityTreatments)
 
         db.session.commit()
+
+        # Cached LLM responses were generated for the old details
+        invalidate_user_cache(user.id)
+
+        changed = changed_fields(previous_details, user_details.to_dict())
+        job = refresh_meal_plan(user.id, changed) if changed else None
         
-        return jsonify({"msg": "User details updated successfully"}), 200
+        return jsonify({
+            "msg": "User details updated successfully",
+            "meal_plan_stale": bool(changed),
+            "changed_fields": changed,
+            "meal_plan_job_id": job.id if job else None
+        }), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": "Failed to update user details", "error": str(e)}), 500
@@ -24,6 +24,9 @@ class Chat(db.Model, SerializerMixin):
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(255))
+    summary = db.Column(db.Text, nullable=True)  # Rolling summary of messages older than the memory window
+    summary_until = db.Column(db.DateTime, nullable=True)  # created_at of the last message folded into summary
+    summary_until_id = db.Column(db.String(36), nullable=True)  # id of that message, breaks created_at ties
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
 
@@ -19,6 +19,8 @@ class MealPlan(db.Model, SerializerMixin):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     is_active = db.Column(db.Boolean, default=True)  # To mark current active meal plan
+    stale_since = db.Column(db.DateTime, nullable=True)  # Set when the user's details changed after generation
+    stale_reason = db.Column(db.String(255), nullable=True)  # Details fields that changed
 
     # Relationships
     user = db.relationship('User', backref=db.backref('meal_plans', lazy=True))
@@ -39,5 +41,8 @@ class MealPlan(db.Model, SerializerMixin):
             'plan_data': self.plan_data,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'is_stale': self.stale_since is not None,
+            'stale_since': self.stale_since.isoformat() if self.stale_since else None,
+            'stale_reason': self.stale_reason
         } 
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+Meal plan job model for background meal plan generation.
+"""
+
+from datetime import datetime
+from app.extensions import db
+from sqlalchemy_serializer import SerializerMixin
+from uuid import uuid4
+from typing import Dict, Any
+
+
+class JobStatus:
+    """Lifecycle states of a meal plan job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class MealPlanJob(db.Model, SerializerMixin):
+    """A queued meal plan generation, processed by the background workers"""
+    __tablename__ = 'meal_plan_job'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
+    user_message = db.Column(db.Text, nullable=True)
+    mode = db.Column(db.String(20), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=JobStatus.QUEUED, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.now)  # Earliest time a worker may claim the job
+    locked_until = db.Column(db.DateTime, nullable=True)  # Visibility timeout of the current attempt
+    worker_id = db.Column(db.String(64), nullable=True)
+    plan_id = db.Column(db.String(36), nullable=True)  # MealPlan written by a successful run
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # Relationships
+    user = db.relationship('User', backref=db.backref('meal_plan_jobs', lazy=True))
+
+    # Serialization rules
+    serialize_rules = ('-user.password', '-user.meal_plan_jobs')
+
+    def __init__(self, user_id=None, user_message=None, mode=None, max_attempts=3):
+        """Initialize a new queued job."""
+        self.user_id = user_id
+        self.user_message = user_message
+        self.mode = mode
+        self.status = JobStatus.QUEUED
+        self.attempts = 0
+        self.max_attempts = max_attempts
+        self.available_at = datetime.now()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert job to dictionary."""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'mode': self.mode,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'plan_id': self.plan_id,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
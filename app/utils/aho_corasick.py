@@ -0,0 +1,103 @@
+"""
+Aho-Corasick multi-pattern matcher.
+
+Finds every occurrence of a fixed set of phrases in one pass over the text,
+however many phrases there are. Used to spot ingredients in generated meal
+descriptions without a regex per ingredient.
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class AhoCorasick:
+    """
+    Automaton over lowercase phrases, each mapped to a value.
+
+    Args:
+        patterns: (phrase, value) pairs; phrases are matched case-insensitively
+            and only on word boundaries
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Per node: (phrase length, value) of every phrase ending there
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        for phrase, value in patterns:
+            self._add(phrase.lower(), value)
+        self._link()
+
+    def _add(self, phrase: str, value: Any) -> None:
+        node = 0
+        for char in phrase:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][char] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = child
+        self._out[node].append((len(phrase), value))
+
+    def _link(self) -> None:
+        # Breadth-first, so a node's failure link is set before its children's
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+    def find_all(self, text: str) -> List[Tuple[int, int, Any]]:
+        """
+        Every whole-word occurrence of every phrase.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            (start, end, value) tuples, possibly overlapping
+        """
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not out[node]:
+                continue
+            end = index + 1
+            if end < len(text) and text[end].isalnum():
+                continue
+            for length, value in out[node]:
+                start = end - length
+                if start == 0 or not text[start - 1].isalnum():
+                    matches.append((start, end, value))
+        return matches
+
+    def find(self, text: str) -> List[Tuple[int, int, Any]]:
+        """
+        Leftmost-longest, non-overlapping occurrences.
+
+        "brown rice" wins over "rice" and "peanut butter" over "peanut", so
+        every stretch of text counts towards one phrase only.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            (start, end, value) tuples in text order
+        """
+        selected = []
+        covered = 0
+        for start, end, value in sorted(self.find_all(text), key=lambda match: (match[0], -match[1])):
+            if start >= covered:
+                selected.append((start, end, value))
+                covered = end
+        return selected
@@ -0,0 +1,351 @@
+"""
+Profile archetypes for sharing generated meal plans across users.
+
+UserDetail is almost entirely categorical, so thousands of users fall into
+a few hundred effective profiles. An offline job (`flask archetypes build`)
+clusters the stored profiles with k-modes and writes the archetypes to a
+JSON model file. Online, a profile is matched to its nearest archetype in a
+few microseconds. A meal plan generated without a free-text message is then
+generated once for the archetype's representative profile and reused by
+every member until it goes stale.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+
+from app.utils.llm_cache import MISS, get_llm_cache, make_cache_key
+from app.utils.profile import canonical_value
+from app.utils.settings import get_setting
+
+# Categorical profile fields compared between profiles
+CATEGORICAL_FIELDS = (
+    "periodRegularity", "periodDuration", "heavyBleeding", "severeCramps", "pcosDiagnosis",
+    "hirsutism", "hairLoss", "acneSkinIssues", "weightGain", "fatigue", "exerciseFrequency",
+    "dietType", "processedFoodConsumption", "sugarCravings", "waterIntake", "sleepHours",
+    "sleepDisturbances", "mentalHealthIssues", "stressLevels",
+)
+
+# Encoded features: the categorical fields plus banded age and BMI
+FEATURE_FIELDS = CATEGORICAL_FIELDS + ("ageBand", "bmiBand")
+
+# Fields an archetype member must match exactly; clustering never mixes them
+HARD_FIELDS = ("dietType", "pcosDiagnosis")
+
+# Free text can carry allergies and conditions an archetype knows nothing about
+FREE_TEXT_FIELDS = ("medicalHistory", "medications", "fertilityTreatments")
+
+RELOAD_CHECK_INTERVAL = 30  # Seconds between model file mtime checks
+
+
+def parse_number(value: Any) -> Optional[float]:
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def age_band(age: Any) -> str:
+    years = parse_number(age)
+    if years is None:
+        return ""
+    start = int(years) // 5 * 5
+    return f"{start}-{start + 4}"
+
+
+def bmi_band(height: Any, weight: Any) -> str:
+    height_cm, weight_kg = parse_number(height), parse_number(weight)
+    if not height_cm or not weight_kg:
+        return ""
+    bmi = weight_kg / (height_cm / 100) ** 2
+    if bmi < 18.5:
+        return "underweight"
+    if bmi < 25:
+        return "normal"
+    if bmi < 30:
+        return "overweight"
+    return "obese"
+
+
+def profile_features(user_details_dict: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+    """
+    Canonical feature values of a profile, in FEATURE_FIELDS order.
+
+    Returns:
+        The feature tuple, or None if the profile cannot share plans
+    """
+    details = user_details_dict or {}
+    if any(canonical_value(details.get(field)) for field in FREE_TEXT_FIELDS):
+        return None
+    values = tuple(canonical_value(details.get(field)) for field in CATEGORICAL_FIELDS)
+    return values + (age_band(details.get("age")), bmi_band(details.get("height"), details.get("weight")))
+
+
+def k_modes(codes: np.ndarray, weights: np.ndarray, k: int, cardinalities: Sequence[int],
+            max_iterations: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster categorical rows with k-modes.
+
+    Args:
+        codes: (rows, features) integer-coded distinct profiles
+        weights: Number of users behind each row
+        k: Number of clusters
+        cardinalities: Number of distinct values per feature
+        max_iterations: Upper bound on assignment/update rounds
+
+    Returns:
+        (labels, centroids): cluster of each row and the modal codes of each cluster
+    """
+    k = min(k, len(codes))
+    # Farthest-first seeding from the most common profile
+    chosen = [int(np.argmax(weights))]
+    nearest = (codes != codes[chosen[0]]).sum(axis=1)
+    while len(chosen) < k:
+        chosen.append(int(np.argmax(nearest * weights)))
+        nearest = np.minimum(nearest, (codes != codes[chosen[-1]]).sum(axis=1))
+    centroids = codes[chosen].copy()
+
+    labels = np.full(len(codes), -1)
+    for _ in range(max_iterations):
+        distances = (codes[:, None, :] != centroids[None, :, :]).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for cluster in range(k):
+            members = labels == cluster
+            if not members.any():
+                continue
+            for feature, cardinality in enumerate(cardinalities):
+                counts = np.bincount(codes[members, feature], weights=weights[members], minlength=cardinality)
+                centroids[cluster, feature] = counts.argmax()
+    return labels, centroids
+
+
+def build_archetypes(profiles: List[Dict[str, Any]], max_clusters: int = 300) -> Dict[str, Any]:
+    """
+    Cluster stored profiles into archetypes.
+
+    Profiles are first partitioned by HARD_FIELDS, and the cluster budget is
+    split between partitions by their number of distinct profiles.
+
+    Args:
+        profiles: UserDetail.to_dict() of every user
+        max_clusters: Upper bound on the number of archetypes
+
+    Returns:
+        The archetype model, ready to be saved as JSON
+    """
+    eligible = [(details, features) for details in profiles
+                if (features := profile_features(details)) is not None]
+    vocab = [sorted({features[i] for _, features in eligible}) for i in range(len(FEATURE_FIELDS))]
+    index = [{value: code for code, value in enumerate(values)} for values in vocab]
+    hard_columns = [FEATURE_FIELDS.index(field) for field in HARD_FIELDS]
+
+    partitions: Dict[Tuple[str, ...], List[Tuple[Dict[str, Any], Tuple[str, ...]]]] = {}
+    for details, features in eligible:
+        partitions.setdefault(tuple(features[i] for i in hard_columns), []).append((details, features))
+
+    distinct_total = len({features for _, features in eligible})
+    budget = min(max_clusters, distinct_total)
+    archetypes = []
+    for hard_key, members in sorted(partitions.items()):
+        codes = np.array([[index[i][value] for i, value in enumerate(features)] for _, features in members])
+        distinct, inverse, counts = np.unique(codes, axis=0, return_inverse=True, return_counts=True)
+        k = max(1, round(budget * len(distinct) / distinct_total))
+        labels, centroids = k_modes(distinct, counts.astype(float), k, [len(values) for values in vocab])
+        member_labels = labels[inverse.reshape(-1)]
+
+        for cluster, centroid in enumerate(centroids):
+            cluster_members = [details for (details, _), label in zip(members, member_labels) if label == cluster]
+            if not cluster_members:
+                continue
+            profile = {field: vocab[i][code] for i, (field, code) in enumerate(zip(FEATURE_FIELDS, centroid))
+                       if field in CATEGORICAL_FIELDS}
+            # Representative body measurements are the members' medians
+            for field in ("age", "height", "weight"):
+                numbers = [n for n in (parse_number(d.get(field)) for d in cluster_members) if n is not None]
+                profile[field] = str(round(float(np.median(numbers)))) if numbers else ""
+            archetypes.append({
+                "id": f"a{len(archetypes) + 1:03d}",
+                "hard": dict(zip(HARD_FIELDS, hard_key)),
+                "codes": [int(code) for code in centroid],
+                "profile": profile,
+                "members": len(cluster_members),
+            })
+
+    body = {"fields": list(FEATURE_FIELDS), "vocab": vocab, "archetypes": archetypes}
+    version = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return {"version": version, "created_at": datetime.now().isoformat(), "profiles": len(profiles),
+            "eligible": len(eligible), **body}
+
+
+class Archetype:
+    """One archetype: its id, representative profile and the model it belongs to."""
+
+    __slots__ = ("id", "profile", "members", "version", "similarity")
+
+    def __init__(self, archetype_id: str, profile: Dict[str, Any], members: int, version: str, similarity: float):
+        self.id = archetype_id
+        self.profile = profile
+        self.members = members
+        self.version = version
+        self.similarity = similarity
+
+
+class ArchetypeIndex:
+    """In-memory archetype model that maps a profile to its nearest archetype."""
+
+    def __init__(self, model: Dict[str, Any]):
+        self.version = model["version"]
+        self.fields = tuple(model["fields"])
+        if self.fields != FEATURE_FIELDS:
+            raise ValueError("Archetype model was built for different profile fields; rebuild it")
+        self.index = [{value: code for code, value in enumerate(values)} for values in model["vocab"]]
+        self.archetypes = model["archetypes"]
+        hard_columns = [FEATURE_FIELDS.index(field) for field in HARD_FIELDS]
+        self.hard_columns = hard_columns
+
+        # Archetypes grouped by their hard-field values, with a code matrix per group
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for position, archetype in enumerate(self.archetypes):
+            groups.setdefault(tuple(archetype["hard"][field] for field in HARD_FIELDS), []).append(position)
+        self.groups = {
+            key: (positions, np.array([self.archetypes[p]["codes"] for p in positions], dtype=np.int32))
+            for key, positions in groups.items()
+        }
+        self._match = lru_cache(maxsize=4096)(self._nearest)
+
+    def _nearest(self, features: Tuple[str, ...]) -> Tuple[Optional[int], float]:
+        group = self.groups.get(tuple(features[i] for i in self.hard_columns))
+        if group is None:
+            return None, 0.0
+        positions, codes = group
+        # Values never seen while clustering get code -1 and never match
+        vector = np.array([self.index[i].get(value, -1) for i, value in enumerate(features)], dtype=np.int32)
+        matches = (codes == vector).sum(axis=1)
+        best = int(matches.argmax())
+        return positions[best], float(matches[best]) / len(features)
+
+    def match(self, user_details_dict: Dict[str, Any], min_similarity: float) -> Optional[Archetype]:
+        """
+        Find the archetype of a profile.
+
+        Args:
+            user_details_dict: Dictionary containing user health data
+            min_similarity: Share of features that must equal the archetype's
+
+        Returns:
+            The archetype, or None if the profile is not close enough to any
+        """
+        features = profile_features(user_details_dict)
+        if features is None:
+            return None
+        position, similarity = self._match(features)
+        if position is None or similarity < min_similarity:
+            return None
+        archetype = self.archetypes[position]
+        return Archetype(archetype["id"], archetype["profile"], archetype["members"], self.version, similarity)
+
+    def stats(self) -> Dict[str, Any]:
+        info = self._match.cache_info()
+        return {"version": self.version, "archetypes": len(self.archetypes),
+                "assign_cache_hits": info.hits, "assign_cache_misses": info.misses}
+
+
+_index: Optional[ArchetypeIndex] = None
+_index_mtime: Optional[float] = None
+_index_checked: Optional[float] = None
+_index_lock = threading.Lock()
+
+
+def model_path() -> str:
+    return get_setting("ARCHETYPE_MODEL_PATH") or os.path.join("instance", "profile_archetypes.json")
+
+
+def get_archetype_index() -> Optional[ArchetypeIndex]:
+    """Return the loaded archetype model, reloading it when the file changes; None if there is none."""
+    global _index, _index_mtime, _index_checked
+    now = time.monotonic()
+    if _index_checked is not None and now - _index_checked < RELOAD_CHECK_INTERVAL:
+        return _index
+    with _index_lock:
+        if _index_checked is not None and now - _index_checked < RELOAD_CHECK_INTERVAL:
+            return _index
+        _index_checked = now
+        path = model_path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            _index, _index_mtime = None, None
+            return None
+        if mtime != _index_mtime:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    _index = ArchetypeIndex(json.load(f))
+                _index_mtime = mtime
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Archetype model not loaded: {str(e)}", file=sys.stderr)
+                _index = None
+    return _index
+
+
+def match_archetype(user_details_dict: Dict[str, Any]) -> Optional[Archetype]:
+    """Archetype whose shared meal plans a profile may reuse, or None."""
+    if not get_setting("ARCHETYPE_SHARING_ENABLED", True):
+        return None
+    index = get_archetype_index()
+    if index is None:
+        return None
+    return index.match(user_details_dict, float(get_setting("ARCHETYPE_MIN_SIMILARITY", 0.9)))
+
+
+def archetype_plan_key(archetype: Archetype, mode: str) -> str:
+    return make_cache_key("archetype_plan", mode, {"archetype": archetype.id, "model": archetype.version})
+
+
+def get_archetype_plan(archetype: Archetype, mode: str) -> Optional[Dict[str, Any]]:
+    """The archetype's shared meal plan, or None if there is no fresh one."""
+    cache = get_llm_cache()
+    if cache is None:
+        return None
+    plan = cache.get(archetype_plan_key(archetype, mode))
+    return None if plan is MISS else plan
+
+
+def set_archetype_plan(archetype: Archetype, mode: str, plan: Dict[str, Any]) -> None:
+    """Share a meal plan with every member of an archetype until ARCHETYPE_PLAN_TTL passes."""
+    cache = get_llm_cache()
+    if cache is not None:
+        cache.set(archetype_plan_key(archetype, mode), plan, ttl=float(get_setting("ARCHETYPE_PLAN_TTL", 604800)))
+
+
+archetypes_cli = AppGroup("archetypes", help="Profile archetype commands.")
+
+
+@archetypes_cli.command("build")
+@click.option("--max-clusters", type=int, default=None, help="Upper bound on archetypes (ARCHETYPE_MAX_CLUSTERS).")
+def build_command(max_clusters: Optional[int]) -> None:
+    """Cluster stored user profiles and write the archetype model."""
+    from app.models.user_detail import UserDetail
+
+    profiles = [details.to_dict() for details in UserDetail.query.all()]
+    model = build_archetypes(profiles, max_clusters or int(get_setting("ARCHETYPE_MAX_CLUSTERS", 300)))
+
+    path = model_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write then rename so running workers never read a half-written model
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(model, f)
+    os.replace(f"{path}.tmp", path)
+    click.echo(f"{len(model['archetypes'])} archetypes from {model['eligible']} of {model['profiles']} "
+               f"profiles written to {path} (version {model['version']})")
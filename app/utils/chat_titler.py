@@ -0,0 +1,259 @@
+"""
+Background chat titles from local keyword extraction.
+
+New chats are created as "Chat <hex>". After an exchange in a chat that
+still has that placeholder, the user's message is handed to a background
+thread, which picks its most salient words and bigrams by TF-IDF and writes
+them as the title. Document frequencies are fitted on the stored user
+messages, so words every user writes ("diet", "period") rank below the ones
+that set a conversation apart. Nothing here calls the LLM or delays the
+response.
+"""
+import math
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from app.extensions import db
+from app.models.chat import Chat, Message, SenderType
+from app.utils.settings import get_setting
+
+PLACEHOLDER_TITLE = re.compile(r"^Chat [0-9a-f]{8}$")
+TITLE_MAX_LENGTH = 100
+
+_WORD = re.compile(r"[a-z][a-z0-9'-]*[a-z0-9]|[a-z]")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves i'm i've i'd i'll it's don't doesn't can't
+isn't im ive dont cant also really still even much many lot lots get got getting make making take taking go going
+know want wanted need needs like please help tell give suggest suggestions advice tips idea ideas thing
+things something anything way ways good best better okay ok hi hello hey thanks thank yes yeah kind sort maybe
+usually always often sometimes every day days week weeks time times since ago recently lately feel feeling felt
+question questions wondering anyone someone normal
+""".split())
+
+# Words that stay upper case in a title
+ACRONYMS = {"pcos", "pcod", "ivf", "iud", "bmi", "uti", "pms", "pmdd", "hpv", "hrt", "ocp", "tsh", "b12", "d3"}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words of a message, keeping in-word apostrophes and hyphens."""
+    return _WORD.findall((text or "").lower())
+
+
+def candidate_terms(text: str) -> List[str]:
+    """Content words and bigrams of adjacent content words, in text order."""
+    terms = []
+    previous = None
+    for token in tokenize(text):
+        if token in STOPWORDS or (len(token) < 3 and token not in ACRONYMS):
+            previous = None
+            continue
+        terms.append(token)
+        if previous is not None:
+            terms.append(f"{previous} {token}")
+        previous = token
+    return terms
+
+
+class TitleModel:
+    """
+    Smoothed IDF weights over a corpus of user messages.
+
+    Args:
+        documents: Message texts; each counts a term once however often it occurs
+    """
+
+    def __init__(self, documents: Iterable[str] = ()):
+        self.document_frequency: Counter = Counter()
+        self.documents = 0
+        for document in documents:
+            self.document_frequency.update(set(candidate_terms(document)))
+            self.documents += 1
+
+    def idf(self, term: str) -> float:
+        return math.log((1 + self.documents) / (1 + self.document_frequency[term])) + 1.0
+
+    def keywords(self, text: str, max_terms: int = 4) -> List[str]:
+        """
+        Most salient terms of a message by tf * idf.
+
+        A chosen bigram covers its two words, so "iron deficiency" is not
+        followed by "iron" and "deficiency" again.
+
+        Args:
+            text: Message text
+            max_terms: Maximum number of words in the title
+
+        Returns:
+            Chosen terms in the order they first appear in the message
+        """
+        terms = candidate_terms(text)
+        if not terms:
+            return []
+        counts = Counter(terms)
+        first_seen: Dict[str, int] = {}
+        for position, term in enumerate(terms):
+            first_seen.setdefault(term, position)
+
+        # Bigrams score both words' weight, but only when they recur as a phrase in the corpus
+        scores = {}
+        for term, count in counts.items():
+            if " " in term and self.documents and self.document_frequency[term] < 2:
+                continue
+            scores[term] = count * self.idf(term) * (1.5 if " " in term else 1.0)
+
+        chosen: List[str] = []
+        words = 0
+        covered = set()
+        for term in sorted(scores, key=lambda term: (-scores[term], first_seen[term])):
+            parts = term.split(" ")
+            if covered.intersection(parts) or words + len(parts) > max_terms:
+                continue
+            chosen.append(term)
+            covered.update(parts)
+            words += len(parts)
+            if words >= max_terms:
+                break
+        return sorted(chosen, key=first_seen.get)
+
+    def title(self, text: str, max_terms: int = 4) -> Optional[str]:
+        """Title for a chat opened with `text`, or None when nothing salient is left."""
+        keywords = self.keywords(text, max_terms)
+        if not keywords:
+            return None
+        words = [word.upper() if word in ACRONYMS else word.capitalize()
+                 for keyword in keywords for word in keyword.split(" ")]
+        return " ".join(words)[:TITLE_MAX_LENGTH]
+
+
+def fit_title_model(corpus_size: int) -> TitleModel:
+    """Fit document frequencies on the most recent user messages."""
+    rows = (
+        db.session.query(Message.content)
+        .filter(Message.sent_by == SenderType.USER)
+        .order_by(Message.created_at.desc())
+        .limit(corpus_size)
+        .all()
+    )
+    return TitleModel(content for content, in rows)
+
+
+class ChatTitler:
+    """
+    Single background thread that titles chats still named by placeholder.
+
+    Args:
+        app: Flask app whose context the thread runs in
+        max_terms: Maximum number of words in a title
+        corpus_size: Number of recent user messages the model is fitted on
+        refit_interval: Seconds before the model is refitted on newer messages
+    """
+
+    def __init__(self, app, max_terms: int = 4, corpus_size: int = 5000, refit_interval: float = 3600.0):
+        self.app = app
+        self.max_terms = max_terms
+        self.corpus_size = corpus_size
+        self.refit_interval = refit_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-titler")
+        self._model: Optional[TitleModel] = None
+        self._fitted_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"scheduled": 0, "titled": 0, "skipped": 0, "errors": 0}
+
+    def schedule(self, chat_id: str, placeholder: str, text: str) -> bool:
+        """
+        Queue a title for a chat; returns at once.
+
+        Args:
+            chat_id: Id of the chat to title
+            placeholder: The chat's current title, which must still be a
+                placeholder when the title is written
+            text: User message to take the title from
+
+        Returns:
+            True if a title was queued
+        """
+        if not text or not PLACEHOLDER_TITLE.match(placeholder or ""):
+            return False
+        with self._lock:
+            self._stats["scheduled"] += 1
+        self._executor.submit(self._run, chat_id, placeholder, text)
+        return True
+
+    def model(self) -> TitleModel:
+        """The fitted model, refitted once it is older than refit_interval."""
+        if self._model is None or time.monotonic() - self._fitted_at > self.refit_interval:
+            self._model = fit_title_model(self.corpus_size)
+            self._fitted_at = time.monotonic()
+        return self._model
+
+    def _run(self, chat_id: str, placeholder: str, text: str) -> None:
+        outcome = "skipped"
+        try:
+            with self.app.app_context():
+                title = self.model().title(text, self.max_terms)
+                if title:
+                    # Conditional on the placeholder, so a rename in the meantime wins
+                    updated = Chat.query.filter_by(id=chat_id, title=placeholder).update(
+                        {"title": title, "updated_at": Chat.updated_at}, synchronize_session=False
+                    )
+                    db.session.commit()
+                    outcome = "titled" if updated else "skipped"
+        except Exception as e:
+            outcome = "errors"
+            print(f"ERROR titling chat {chat_id}: {str(e)}", file=sys.stderr)
+            print(traceback.format_exc(), file=sys.stderr)
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_titler: Optional[ChatTitler] = None
+
+
+def init_chat_titler(app) -> Optional[ChatTitler]:
+    """Create this process's titler when CHAT_AUTO_TITLE_ENABLED is set."""
+    global _titler
+    if not app.config.get("CHAT_AUTO_TITLE_ENABLED", True) or _titler is not None:
+        return _titler
+    _titler = ChatTitler(
+        app,
+        max_terms=int(app.config.get("CHAT_TITLE_MAX_TERMS", 4)),
+        corpus_size=int(app.config.get("CHAT_TITLE_CORPUS_SIZE", 5000)),
+        refit_interval=float(app.config.get("CHAT_TITLE_REFIT_INTERVAL", 3600)),
+    )
+    return _titler
+
+
+def schedule_chat_title(chat_id: str, placeholder: str, text: str) -> bool:
+    """
+    Title a chat in the background if it still has its placeholder title.
+
+    Args:
+        chat_id: Id of the chat
+        placeholder: The chat's title as read by the request
+        text: The user's message
+
+    Returns:
+        True if a title was queued
+    """
+    if _titler is None or not get_setting("CHAT_AUTO_TITLE_ENABLED", True):
+        return False
+    return _titler.schedule(chat_id, placeholder, text)
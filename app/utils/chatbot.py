@@ -4,61 +4,193 @@ Chatbot routes blueprint.
 
 import os
 import sys
+import json
+import asyncio
 import traceback
-from pydantic import BaseModel, SecretStr
-from langchain_groq import ChatGroq
+from pydantic import BaseModel
 from langchain.schema import HumanMessage, SystemMessage
-from langchain.prompts import PromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-import json
 from typing import List, Dict, Any, Union, Optional
 
-# Initialize Groq Chat Model with correct parameters
-llm = ChatGroq(
-    api_key=SecretStr("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"),
-    # model="deepseek-r1-distill-llama-70b",
-    model="llama3-8b-8192",
-)
+from app.utils.archetypes import get_archetype_plan, match_archetype, set_archetype_plan
+from app.utils.concurrency import ConcurrencyLimiter
+from app.utils.deadline import call_with_deadline, current_budget, mark_degraded, stream_with_deadline
+from app.utils.diet_validator import describe_violations, forbidden_groups, validator as diet_validator
+from app.utils.intent_router import route_intent
+from app.utils.llm_backends import create_llm
+from app.utils.json_stream import JsonObjectExtractor, extract_json_object, loads_tolerant
+from app.utils.llm_cache import MISS, get_llm_cache, make_cache_key
+from app.utils.profile import profile_digest
+from app.utils.meal_catalog import get_meal_catalog
+from app.utils.micro_batch import BatchItemError, MicroBatcher
+from app.utils.model_router import init_model_router, invoke_prompt, stream_prompt
+from app.utils.nutrition import annotate_plan
+from app.utils.prompts import RegisteredPrompt, registry as prompts
+from app.utils.semantic_cache import get_semantic_cache
+from app.utils.settings import get_setting
+from app.utils.single_flight import coalesce
+
+llm = None
+
+
+def init_llm(config) -> None:
+    """
+    Create the chat model selected by LLM_BACKEND and bind every prompt chain to it.
+
+    The bound model is the fast tier of the model router, which may send
+    complex chat questions to LLM_LARGE_MODEL instead.
+
+    Args:
+        config: Flask config or any mapping with the LLM_* keys
+    """
+    global llm
+    llm = create_llm(config)
+    prompts.bind(llm)
+    init_model_router(config)
+
+
+# Default to the environment until the app factory applies its config
+init_llm(os.environ)
+
+# Days of the week in plan order
+WEEK_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# History placeholder for chats without earlier messages
+NO_HISTORY = "No previous conversation."
+
+# Supported meal plan generation modes
+MEAL_PLAN_MODES = ("per_day", "single_shot", "catalog", "auto")
+
+# Process-wide cap on concurrent day generations, shared by all requests
+_day_limiter = ConcurrencyLimiter(7)
+
+
+def get_day_limiter() -> ConcurrencyLimiter:
+    """Return the shared day-generation limiter sized from config."""
+    limit = int(get_setting("MEAL_PLAN_MAX_CONCURRENCY", _day_limiter.limit))
+    if limit != _day_limiter.limit:
+        _day_limiter.resize(limit)
+    return _day_limiter
+
+
+def prompt_key(prompt: RegisteredPrompt, inputs: Dict[str, Any]) -> str:
+    """Identity of a prompt call: prompt version, model and inputs."""
+    return make_cache_key(prompt.version, prompts.llm.model_name, inputs)
+
+
+def cache_lookup(prompt: RegisteredPrompt, inputs: Dict[str, Any]):
+    """
+    Look up a cached response for a prompt.
+
+    Returns:
+        A (cache, key, value) tuple; value is MISS when nothing is cached
+        and cache is None when caching is disabled
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return None, None, MISS
+    key = prompt_key(prompt, inputs)
+    return cache, key, cache.get(key)
+
 
 # Request model
 class ChatRequest(BaseModel):
     user_input: str
 
-async def chat(input, user_details_dict):
-    """Chat with the AI using user input and details."""
-    try:
-        # Define System Instructions
-        # Create prompt template for chat
-        prompt_template_chat = PromptTemplate(
-            input_variables=["user_input", "user_details"],
-            template="""You are an AI menstrual health assistant for women. Provide expert advice on health, diet, and well-being based on the user's input and details:
-            
-            User Input: {user_input}
-            User Details: {user_details}
+def chat_cache_lookup(chat_prompt: RegisteredPrompt, inputs: Dict[str, Any], input: str, user_details_dict: Dict[str, Any]):
+    """
+    Look a chat reply up in the exact and semantic caches.
 
-            Ask questions to the user to get more information about their menstrual health.
-            If the user is not comfortable with answering a question, ask them to skip it.
+    Returns:
+        A (store, answer) tuple; answer is None on a miss and store(answer)
+        records a freshly generated reply in both caches
+    """
+    cache, cache_key, cached = cache_lookup(chat_prompt, inputs)
+    if cached is not MISS:
+        return None, cached
 
-            Tailor the response to the user's details.
-            If the user is not pregnant, do not mention pregnancy or childbirth.
-            If the user is pregnant, do not mention menstruation.
+    # Paraphrases of earlier questions from similar profiles; answers that
+    # depend on earlier turns are not interchangeable
+    semantic_cache = get_semantic_cache() if inputs.get("history") == NO_HISTORY else None
+    if semantic_cache is not None:
+        answer = semantic_cache.lookup(input, user_details_dict, get_setting("SEMANTIC_CACHE_THRESHOLD"))
+        if answer is not None:
+            return None, answer
 
-            At last always prescribe to the user to consult a doctor if they have any serious concerns.
+    def store(answer: str, user_id: Optional[str] = None) -> None:
+        if cache is not None:
+            cache.set(cache_key, answer, scope=user_id)
+        if semantic_cache is not None:
+            semantic_cache.add(input, user_details_dict, answer, scope=str(user_id) if user_id else None)
+
+    return store, None
 
-            """
-        )
 
-        chat_chain = prompt_template_chat | llm
+async def chat(input, user_details_dict, user_id=None, history=None):
+    """Chat with the AI using user input, details and optional conversation history."""
+    try:
+        reply = route_intent(input, user_details_dict, history)
+        if reply is not None:
+            return reply
 
-        response = await chat_chain.ainvoke({"user_input": input, "user_details": json.dumps(user_details_dict)})
+        chat_prompt = prompts.get("chat")
+
+        inputs = {"history": history or NO_HISTORY, "user_input": input, "user_details": profile_digest(user_details_dict)}
+        store, answer = chat_cache_lookup(chat_prompt, inputs, input, user_details_dict)
+        if answer is not None:
+            return answer
+
+        response = await call_with_deadline(
+            chat_prompt.name, lambda: invoke_prompt(chat_prompt, inputs, input, user_details_dict)
+        )
+        store(response.content, user_id)
         return response.content
     except Exception as e:
+        mark_degraded(f"chat: {str(e)}")
         error_traceback = traceback.format_exc()
         print(f"ERROR in chat function: {str(e)}", file=sys.stderr)
         print(f"Traceback: {error_traceback}", file=sys.stderr)
         return f"An error occurred: {str(e)}"
 
 
+async def chat_stream(input, user_details_dict, user_id=None, history=None):
+    """
+    Stream a chat reply token by token.
+
+    Cached and locally routed replies are yielded as a single chunk. The reply is only cached
+    once the stream completes; closing the generator early cancels the
+    upstream request.
+
+    Args:
+        input: The user's message
+        user_details_dict: Dictionary containing user health data
+        user_id: Optional id of the user, used to scope cached responses
+        history: Optional rendered conversation memory
+
+    Yields:
+        Text chunks of the reply
+    """
+    reply = route_intent(input, user_details_dict, history)
+    if reply is not None:
+        yield reply
+        return
+
+    chat_prompt = prompts.get("chat")
+
+    inputs = {"history": history or NO_HISTORY, "user_input": input, "user_details": profile_digest(user_details_dict)}
+    store, answer = chat_cache_lookup(chat_prompt, inputs, input, user_details_dict)
+    if answer is not None:
+        yield answer
+        return
+
+    chunks = []
+    async for chunk in stream_with_deadline(stream_prompt(chat_prompt, inputs, input, user_details_dict)):
+        if chunk.content:
+            chunks.append(chunk.content)
+            yield chunk.content
+
+    store("".join(chunks), user_id)
+
+
 # Define meal models - simplified to basic dictionary structure
 class DayMeals(BaseModel):
     """Meals for a single day"""
@@ -67,6 +199,10 @@ class DayMeals(BaseModel):
     Dinner: str
 
 
+# Meal slots of a day, in plan order
+MEAL_SLOTS = tuple(DayMeals.model_fields)
+
+
 class MealPlan(BaseModel):
     """A complete weekly meal plan"""
     Monday: DayMeals
@@ -78,7 +214,116 @@ class MealPlan(BaseModel):
     Sunday: DayMeals
 
 
-async def generate_day_meal(day_name: str, user_details_dict: Dict[str, Any], user_message: Optional[str] = None) -> Dict[str, str]:
+async def stream_json_object(prompt: RegisteredPrompt, inputs: Dict[str, Any], validate):
+    """
+    Stream a prompt's reply and return the first JSON object that validates.
+
+    Stray prose, code fences, trailing commas and single quotes are
+    tolerated. The upstream stream is closed as soon as a valid object has
+    arrived, so trailing tokens are never generated.
+
+    Args:
+        prompt: Registered prompt whose chain returns text
+        inputs: Prompt input variables
+        validate: Callable returning the validated value or raising ValueError
+
+    Returns:
+        The validated value
+    """
+    extractor = JsonObjectExtractor()
+    stream = stream_prompt(prompt, inputs)
+    try:
+        async for chunk in stream:
+            for candidate in extractor.feed(chunk.content):
+                try:
+                    return validate(loads_tolerant(candidate))
+                except ValueError:
+                    # Keep reading: a later object in the reply may be the right one
+                    continue
+    finally:
+        await stream.aclose()
+
+    # The reply ended inside an object: close it and try once more
+    pending = extractor.pending()
+    if pending is not None:
+        return validate(loads_tolerant(pending, close=True))
+    raise ValueError(f"No valid JSON object in {prompt.name} output")
+
+
+def validate_day_meals(value: Any) -> Dict[str, str]:
+    return DayMeals.model_validate(value).model_dump()
+
+
+def validate_week_object(value: Any) -> Dict[str, Any]:
+    # Days are validated one by one so a partial week can still be used
+    if not isinstance(value, dict):
+        raise ValueError("Generated week plan is not a JSON object")
+    return value
+
+
+def format_batch_request(request_id: str, inputs: Dict[str, Any]) -> str:
+    return (f"[{request_id}] Day: {inputs['day']}\n"
+            f"User details: {inputs['user_details']}\n"
+            f"Additional preferences: {inputs['user_message']}")
+
+
+async def run_day_meal_batch(batch_inputs: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Generate several day-meal requests in one LLM call.
+
+    Args:
+        batch_inputs: day_meal prompt inputs of every request in the batch
+
+    Returns:
+        Validated day meals per request, in order, or the ValueError of a
+        request whose answer was missing or malformed
+    """
+    batch_prompt = prompts.get("day_meal_batch")
+    request_ids = [f"r{i + 1}" for i in range(len(batch_inputs))]
+    requests_text = "\n\n".join(
+        format_batch_request(request_id, inputs) for request_id, inputs in zip(request_ids, batch_inputs)
+    )
+    reply = await invoke_prompt(batch_prompt, {"requests": requests_text})
+    answers = extract_json_object(reply.content)
+    if not isinstance(answers, dict):
+        raise ValueError("Batched day meal reply is not a JSON object")
+
+    results = []
+    for request_id in request_ids:
+        try:
+            results.append(validate_day_meals(answers.get(request_id)))
+        except ValueError as e:
+            results.append(ValueError(f"{request_id}: {str(e).splitlines()[0]}"))
+    return results
+
+
+# Process-wide micro-batcher for day-meal calls, shared by all requests
+_day_batcher = MicroBatcher(run_day_meal_batch)
+
+
+def get_day_batcher() -> Optional[MicroBatcher]:
+    """Return the shared day-meal micro-batcher sized from config, or None when batching is disabled."""
+    if not get_setting("DAY_MEAL_BATCH_ENABLED", False):
+        return None
+    max_items = int(get_setting("DAY_MEAL_BATCH_MAX_ITEMS", _day_batcher.max_items))
+    max_wait = float(get_setting("DAY_MEAL_BATCH_MAX_WAIT_MS", _day_batcher.max_wait * 1000)) / 1000
+    if (max_items, max_wait) != (_day_batcher.max_items, _day_batcher.max_wait):
+        _day_batcher.configure(max_items, max_wait)
+    return _day_batcher
+
+
+async def fetch_day_meal(meal_prompt: RegisteredPrompt, inputs: Dict[str, Any]) -> Dict[str, str]:
+    """Get one day's meals, through the micro-batcher when enabled and individually otherwise."""
+    batcher = get_day_batcher()
+    if batcher is not None:
+        try:
+            return await batcher.submit(inputs)
+        except BatchItemError as e:
+            print(f"Day meal not batched ({str(e)}), calling individually", file=sys.stderr)
+    return await stream_json_object(meal_prompt, inputs, validate_day_meals)
+
+
+async def generate_day_meal(day_name: str, user_details_dict: Dict[str, Any], user_message: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, str]:
     """
     Generate a meal plan for a specific day based on user details.
     
@@ -86,6 +331,7 @@ async def generate_day_meal(day_name: str, user_details_dict: Dict[str, Any], us
         day_name: The day of the week to generate meals for
         user_details_dict: Dictionary containing user health data
         user_message: Optional message from user with specific meal preferences
+        user_id: Optional id of the user, used to scope cached responses
     
     Returns:
         A dictionary containing breakfast, lunch, and dinner meals
@@ -93,54 +339,42 @@ async def generate_day_meal(day_name: str, user_details_dict: Dict[str, Any], us
     try:
         print(f"Generating meals for {day_name}...")
         
-        # Create a parser for structured output
-        parser = JsonOutputParser()
+        meal_prompt = prompts.get("day_meal")
         
-        # Define the system prompt template
-        prompt_template = PromptTemplate(
-            input_variables=["day", "user_details", "user_message"],
-            template="""You are a nutrition expert specializing in women's health. Create a healthy meal plan for {day} considering these user details:
-
-{user_details}
+        inputs = {
+            "day": day_name,
+            "user_details": profile_digest(user_details_dict),
+            "user_message": user_message if user_message else "No specific preferences provided."
+        }
+        cache, cache_key, cached = cache_lookup(meal_prompt, inputs)
+        if cached is not MISS:
+            return cached
 
-Additional preferences: {user_message}
+        async def invoke():
+            # Another worker may have stored the answer while we waited for its lease
+            if cache is not None:
+                stored = cache.get(cache_key)
+                if stored is not MISS:
+                    return stored
 
-Consider the following when creating meals:
-- If the user is in their menstrual phase, include iron-rich foods
-- If the user is pregnant, focus on folate, calcium, and protein
-- If the user has any food allergies or restrictions, avoid those ingredients
-- Include a good balance of proteins, healthy fats, and complex carbohydrates
-- Keep meals practical and relatively easy to prepare
+            # Stream the precompiled chain within the request's time budget,
+            # stopping at the first object with Breakfast, Lunch and Dinner
+            result = await call_with_deadline(meal_prompt.name, lambda: fetch_day_meal(meal_prompt, inputs))
+            # Cached days have already been checked against the profile's constraints
+            result = await enforce_diet(day_name, result, user_details_dict, user_message)
 
-Return a JSON object with the following structure:
-{{"Breakfast": "detailed breakfast description", 
-  "Lunch": "detailed lunch description", 
-  "Dinner": "detailed dinner description"}}
+            if cache is not None:
+                cache.set(cache_key, result, scope=user_id)
+            return result
 
-  ONLY RETURN THE JSON OBJECT, NO OTHER TEXT.
-"""
-        )
-        
-        # Create the chain
-        meal_chain = prompt_template | llm | parser
-        
-        # Invoke the chain
-        result = await meal_chain.ainvoke({
-            "day": day_name,
-            "user_details": json.dumps(user_details_dict),
-            "user_message": user_message if user_message else "No specific preferences provided."
-        })
-        
-        # Ensure the result has the expected structure
-        if not all(key in result for key in ["Breakfast", "Lunch", "Dinner"]):
-            raise ValueError("Generated meal plan missing required meal types")
-        
-        return result
+        # Concurrent identical day requests share one upstream call
+        return await coalesce(f"day_meal:{prompt_key(meal_prompt, inputs)}", invoke)
         
     except Exception as e:
         error_traceback = traceback.format_exc()
         print(f"ERROR generating {day_name} meals: {str(e)}", file=sys.stderr)
         print(f"Traceback: {error_traceback}", file=sys.stderr)
+        mark_degraded(f"{day_name}: fallback meals")
         
         # Return a fallback meal plan in case of error
         return {
@@ -150,49 +384,371 @@ Return a JSON object with the following structure:
         }
 
 
-async def get_meal_plan_llm(user_details_dict: Dict[str, Any], user_message: Optional[str] = None) -> Dict[str, Any]:
+async def generate_week_meals(user_details_dict: Dict[str, Any], user_message: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, Dict[str, str]]:
     """
-    Generate a meal plan step by step, one day at a time.
+    Generate the whole week in a single LLM call.
+
+    Each day in the response is validated against DayMeals. Days that are
+    missing or malformed are left out so the caller can repair them one by one.
+
+    Args:
+        user_details_dict: Dictionary containing user health data
+        user_message: Optional message from user with specific meal preferences
+        user_id: Optional id of the user, used to scope cached responses
+
+    Returns:
+        A dictionary of the valid days only, keyed by day name
+    """
+    try:
+        print("Generating the whole week in one call...")
+
+        week_prompt = prompts.get("week_meal")
+
+        inputs = {
+            "user_details": profile_digest(user_details_dict),
+            "user_message": user_message if user_message else "No specific preferences provided."
+        }
+        cache, cache_key, cached = cache_lookup(week_prompt, inputs)
+        if cached is not MISS:
+            return cached
+
+        async with get_day_limiter():
+            result = await call_with_deadline(
+                week_prompt.name, lambda: stream_json_object(week_prompt, inputs, validate_week_object)
+            )
+
+        week = {}
+        for day in WEEK_DAYS:
+            try:
+                week[day] = DayMeals.model_validate(result.get(day)).model_dump()
+            except Exception as e:
+                print(f"Week plan has invalid {day}: {str(e)}", file=sys.stderr)
+
+        checked = await asyncio.gather(*(
+            enforce_diet(day, day_meals, user_details_dict, user_message, acquire_slot=True)
+            for day, day_meals in week.items()
+        ))
+        week = dict(zip(week, checked))
+
+        # Only complete weeks are cached; partial ones are repaired per day
+        if cache is not None and len(week) == len(WEEK_DAYS):
+            cache.set(cache_key, week, scope=user_id)
+
+        return week
+
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"ERROR generating week meals: {str(e)}", file=sys.stderr)
+        print(f"Traceback: {error_traceback}", file=sys.stderr)
+        return {}
+
+
+async def generate_day_limited(day: str, user_details_dict: Dict[str, Any], user_message: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, str]:
+    """Generate one day while holding a slot of the shared day limiter."""
+    async with get_day_limiter():
+        print(f"Step: Generating {day}'s meals...")
+        day_meals = await generate_day_meal(day, user_details_dict, user_message, user_id)
+        print(f"Completed step: {day} added to meal plan")
+        return day_meals
+
+
+async def regenerate_day_meal(day_name: str, current_meals: Optional[Dict[str, str]], slots: List[str], user_details_dict: Dict[str, Any], user_message: Optional[str] = None) -> Dict[str, str]:
+    """
+    Replace some meals of one day with a single LLM call, keeping the others.
+
+    Revisions are never served from the cache: asking again should give
+    something new. On failure the current meals are kept. The caller holds a
+    slot of the shared day limiter.
+
+    Args:
+        day_name: The day of the week to revise
+        current_meals: The day's current meals, or None to generate the whole day
+        slots: Meal slots to replace (a subset of MEAL_SLOTS)
+        user_details_dict: Dictionary containing user health data
+        user_message: Optional message from user with specific meal preferences
+
+    Returns:
+        The day's meals with only the requested slots changed
+    """
+    if not isinstance(current_meals, dict) or any(slot not in current_meals for slot in MEAL_SLOTS):
+        current_meals, slots = {}, list(MEAL_SLOTS)
+    try:
+        revision_prompt = prompts.get("day_meal_revision")
+        inputs = {
+            "day": day_name,
+            "user_details": profile_digest(user_details_dict),
+            "user_message": user_message if user_message else "No specific preferences provided.",
+            "current_meals": json.dumps(current_meals) if current_meals else "None yet.",
+            "replace": " and ".join(slots) if len(slots) < len(MEAL_SLOTS) else "all meals",
+        }
+        revised = await call_with_deadline(
+            revision_prompt.name, lambda: stream_json_object(revision_prompt, inputs, validate_day_meals)
+        )
+        # Unchanged slots keep their exact text, whatever the model echoed back
+        return {slot: revised[slot] if slot in slots else current_meals[slot] for slot in MEAL_SLOTS}
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"ERROR revising {day_name} meals: {str(e)}", file=sys.stderr)
+        print(f"Traceback: {error_traceback}", file=sys.stderr)
+        if len(current_meals) == len(MEAL_SLOTS):
+            mark_degraded(f"{day_name}: kept current meals")
+            return dict(current_meals)
+        mark_degraded(f"{day_name}: fallback meals")
+        return {
+            "Breakfast": f"Simple nutritious breakfast for {day_name}.",
+            "Lunch": f"Balanced lunch with protein and vegetables for {day_name}.",
+            "Dinner": f"Healthy dinner with lean protein and whole grains for {day_name}."
+        }
+
+
+async def enforce_diet(day_name: str, day_meals: Dict[str, str], user_details_dict: Dict[str, Any], user_message: Optional[str] = None, acquire_slot: bool = False) -> Dict[str, str]:
+    """
+    Check a day against the profile's diet, allergies and medications, repairing only the offending meals.
+
+    Offending slots are re-requested with the revision prompt, naming the
+    ingredients to avoid, up to DIET_REPAIR_ATTEMPTS times. Slots that still
+    conflict are replaced with a compliant meal from the local catalog.
+
+    Args:
+        day_name: The day of the week being checked
+        day_meals: The day's generated meals
+        user_details_dict: Dictionary containing user health data
+        user_message: Optional message from user with specific meal preferences
+        acquire_slot: Take a slot of the shared day limiter for repairs; False
+            when the caller already holds one
+
+    Returns:
+        The day's meals, with conflicting slots repaired
+    """
+    if not get_setting("DIET_VALIDATION_ENABLED", True):
+        return day_meals
+    forbidden = forbidden_groups(user_details_dict)
+    violations = diet_validator.check_day(day_meals, forbidden)
+    if not violations:
+        return day_meals
+
+    for _ in range(int(get_setting("DIET_REPAIR_ATTEMPTS", 1))):
+        print(f"{day_name} conflicts with diet constraints in {', '.join(violations)}; repairing", file=sys.stderr)
+        instruction = describe_violations(violations)
+        message = f"{user_message} {instruction}" if user_message else instruction
+        if acquire_slot:
+            async with get_day_limiter():
+                day_meals = await regenerate_day_meal(day_name, day_meals, list(violations), user_details_dict, message)
+        else:
+            day_meals = await regenerate_day_meal(day_name, day_meals, list(violations), user_details_dict, message)
+        violations = diet_validator.check_day(day_meals, forbidden)
+        if not violations:
+            return day_meals
+
+    try:
+        week = get_meal_catalog().build_week(user_details_dict, extra_text=user_message)
+    except ValueError as e:
+        mark_degraded(f"{day_name}: meals may conflict with diet ({str(e)})")
+        return day_meals
+    print(f"Replacing {day_name} {', '.join(violations)} with catalog meals", file=sys.stderr)
+    return {slot: week[day_name][slot] if slot in violations else day_meals[slot] for slot in MEAL_SLOTS}
+
+
+async def regenerate_meal_plan(plan_data: Dict[str, Any], targets: Dict[str, List[str]], user_details_dict: Dict[str, Any], user_message: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Regenerate chosen days or meal slots of a plan, one LLM call per changed day.
+
+    Args:
+        plan_data: The existing plan, keyed by day name
+        targets: Meal slots to replace, keyed by day name
+        user_details_dict: Dictionary containing user health data
+        user_message: Optional message from user with specific meal preferences
+
+    Returns:
+        A new plan dictionary in weekday order, with refreshed nutrition
+        estimates; days not targeted are copied unchanged
+    """
+    days = [day for day in WEEK_DAYS if targets.get(day)]
+
+    async def revise(day: str) -> Dict[str, str]:
+        async with get_day_limiter():
+            day_meals = await regenerate_day_meal(day, plan_data.get(day), targets[day], user_details_dict, user_message)
+            return await enforce_diet(day, day_meals, user_details_dict, user_message)
+
+    revised = await asyncio.gather(*(revise(day) for day in days))
+    new_plan = {day: dict(plan_data[day]) for day in WEEK_DAYS if day in plan_data}
+    new_plan.update(zip(days, revised))
+    return annotate_plan({day: new_plan[day] for day in WEEK_DAYS if day in new_plan})
+
+
+def resolve_meal_plan_mode(mode: Optional[str], user_message: Optional[str] = None) -> str:
+    """
+    Pick the generation mode for a request.
+
+    "auto" uses the local meal catalog when there is no free-text preference
+    to honour, and per-day LLM generation otherwise. The catalog cannot
+    follow free-text preferences, so an explicit "catalog" request with a
+    message is generated per day as well.
+
+    Args:
+        mode: Requested mode, defaults to MEAL_PLAN_GENERATION_MODE
+        user_message: Optional message from user with specific meal preferences
+
+    Returns:
+        One of "per_day", "single_shot" or "catalog"
+    """
+    mode = mode or get_setting("MEAL_PLAN_GENERATION_MODE", "per_day")
+    if mode not in MEAL_PLAN_MODES:
+        raise ValueError(f"Unknown meal plan generation mode: {mode}")
+    has_message = bool(user_message and user_message.strip())
+    if mode == "auto" or (mode == "catalog" and has_message):
+        return "per_day" if has_message else "catalog"
+    return mode
+
+
+async def iter_meal_plan_days(user_details_dict: Dict[str, Any], user_message: Optional[str] = None, mode: Optional[str] = None, user_id: Optional[str] = None):
+    """
+    Generate a weekly meal plan, yielding each day as soon as it is ready.
+
+    Days arrive in completion order, not weekday order. Closing the generator
+    early cancels the day generations that are still running. When "auto"
+    picks the catalog but no catalog meal fits the profile, the days are
+    generated with the LLM instead.
+
+    Args:
+        user_details_dict: Dictionary containing user health data
+        user_message: Optional message from user with specific meal preferences
+        mode: Generation mode, defaults to MEAL_PLAN_GENERATION_MODE
+        user_id: Optional id of the user, used to scope cached responses
+
+    Yields:
+        (day name, day meals) tuples
+    """
+    requested_mode = mode or get_setting("MEAL_PLAN_GENERATION_MODE", "per_day")
+    mode = resolve_meal_plan_mode(requested_mode, user_message)
+
+    print(f"Starting meal plan generation ({mode})...")
+
+    if mode == "catalog":
+        try:
+            week = get_meal_catalog().build_week(user_details_dict, get_setting("MEAL_CATALOG_REGION"))
+        except ValueError as e:
+            # An explicit catalog request gets the error; "auto" can still use the LLM
+            if requested_mode != "auto":
+                raise
+            print(f"Meal catalog cannot serve this profile ({str(e)}); generating per day", file=sys.stderr)
+            mark_degraded(f"meal catalog: {str(e)}")
+            mode = "per_day"
+        else:
+            for day in WEEK_DAYS:
+                yield day, week[day]
+            return
+
+    archetype = None if user_message else match_archetype(user_details_dict)
+    if archetype is None:
+        async for day, day_meals in iter_generated_days(user_details_dict, user_message, mode, user_id):
+            yield day, day_meals
+        return
+
+    shared_plan = get_archetype_plan(archetype, mode)
+    if shared_plan is not None:
+        print(f"Reusing the meal plan of archetype {archetype.id}")
+        for day in WEEK_DAYS:
+            yield day, shared_plan[day]
+        return
+
+    # Generate for the archetype's representative profile so every member can reuse the plan
+    budget = current_budget()
+    degraded_before = len(budget.degraded) if budget is not None else 0
+    generated = {}
+    async for day, day_meals in iter_generated_days(archetype.profile, None, mode):
+        generated[day] = day_meals
+        yield day, day_meals
+    # Fallback days are not worth sharing
+    if budget is None or len(budget.degraded) == degraded_before:
+        set_archetype_plan(archetype, mode, generated)
+
+
+async def iter_generated_days(user_details_dict: Dict[str, Any], user_message: Optional[str], mode: str, user_id: Optional[str] = None):
+    """Generate the days of a plan with the LLM in "per_day" or "single_shot" mode, in completion order."""
+    missing = list(WEEK_DAYS)
+    if mode == "single_shot":
+        week = await generate_week_meals(user_details_dict, user_message, user_id)
+        for day in WEEK_DAYS:
+            if day in week:
+                yield day, week[day]
+        missing = [day for day in WEEK_DAYS if day not in week]
+        if missing:
+            print(f"Repairing days: {', '.join(missing)}")
+
+    async def generate_keyed(day: str):
+        return day, await generate_day_limited(day, user_details_dict, user_message, user_id)
+
+    tasks = [asyncio.ensure_future(generate_keyed(day)) for day in missing]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def get_meal_plan_llm(user_details_dict: Dict[str, Any], user_message: Optional[str] = None, mode: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Generate a weekly meal plan.
+
+    In "per_day" mode all seven days are requested concurrently. In
+    "single_shot" mode the week is requested in one call and only the days
+    that come back missing or malformed are regenerated individually. In
+    "catalog" mode the week is assembled from the local meal catalog without
+    calling the LLM; "auto" picks it when there is no user message. Without
+    a user message, profiles that match a profile archetype reuse the plan
+    generated for their archetype (see app.utils.archetypes). The plan is
+    annotated with local nutrition estimates (see app.utils.nutrition).
+    Generated days are checked against the profile's diet, allergies and
+    medications, and only conflicting meals are re-requested. Day
+    generations share a process-wide concurrency cap (MEAL_PLAN_MAX_CONCURRENCY).
+    Concurrent identical requests from the same user are coalesced into one
+    generation.
     
     Args:
         user_details_dict: Dictionary containing user health data
         user_message: Optional message from user with specific meal preferences
+        mode: Generation mode, defaults to MEAL_PLAN_GENERATION_MODE
+        user_id: Optional id of the user, used to scope cached responses
     
     Returns:
-        A complete meal plan as a dictionary
+        A complete meal plan as a dictionary, in weekday order, plus a
+        "nutrition" section
     """
     try:
-        print("Starting step-by-step meal plan generation...")
-        
-        # Days of the week to generate meals for
-        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        
-        # Initialize the meal plan structure
-        meal_plan = {}
-        
-        # Generate meals for each day, one at a time
-        for day in days:
-            print(f"Step: Generating {day}'s meals...")
-            
-            # Generate the day's meals
-            day_meals = await generate_day_meal(day, user_details_dict, user_message)
-            
-            # Add to the meal plan
-            meal_plan[day] = day_meals
-            
-            print(f"Completed step: {day} added to meal plan")
+        requested_mode = mode
+        mode = resolve_meal_plan_mode(mode, user_message)
+
+        async def generate():
+            generated = {}
+            # The requested mode, so "auto" can leave the catalog when nothing fits
+            async for day, day_meals in iter_meal_plan_days(user_details_dict, user_message, requested_mode, user_id):
+                generated[day] = day_meals
+
+            # Rebuild in weekday order regardless of completion order
+            return {day: generated[day] for day in WEEK_DAYS}
+
+        # Double taps and retries from the same user share one generation
+        plan_key = make_cache_key("meal_plan", mode, {
+            "user_id": user_id,
+            "user_details": profile_digest(user_details_dict),
+            "user_message": user_message,
+        })
+        meal_plan = await coalesce(f"meal_plan:{plan_key}", generate)
         
         print("Meal plan generation completed successfully")
-        return meal_plan
+        return annotate_plan(meal_plan)
         
     except Exception as e:
         error_traceback = traceback.format_exc()
         print(f"ERROR: Meal plan generation failed: {str(e)}", file=sys.stderr)
         print(f"Traceback: {error_traceback}", file=sys.stderr)
+        mark_degraded("meal plan: fallback plan")
         
         # Create a basic meal plan structure in case of error
         basic_plan = {}
-        for day in ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]:
+        for day in WEEK_DAYS:
             basic_plan[day] = {
                 "Breakfast": "Simple breakfast with protein and fruit.",
                 "Lunch": "Simple lunch with protein and vegetables.",
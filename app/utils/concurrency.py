@@ -0,0 +1,78 @@
+"""
+Concurrency primitives shared by the LLM utilities.
+"""
+import asyncio
+import threading
+from typing import Optional
+
+
+class ConcurrencyLimiter:
+    """
+    Process-wide cap on concurrent coroutines.
+
+    Flask runs every async view in its own event loop, so an asyncio.Semaphore
+    would only bound a single request. This limiter keeps its counter behind a
+    thread lock and lets waiters poll with a short backoff, which works across
+    loops and threads in the same worker.
+    """
+
+    def __init__(self, limit: int, poll_interval: float = 0.005, max_poll_interval: float = 0.05):
+        self._limit = max(1, int(limit))
+        self._active = 0
+        self._lock = threading.Lock()
+        self._poll_interval = poll_interval
+        self._max_poll_interval = max_poll_interval
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def resize(self, limit: int) -> None:
+        """Change the cap; running holders are not interrupted."""
+        with self._lock:
+            self._limit = max(1, int(limit))
+
+    def try_acquire(self) -> bool:
+        """Take a slot without waiting."""
+        with self._lock:
+            if self._active < self._limit:
+                self._active += 1
+                return True
+            return False
+
+    async def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a free slot.
+
+        Args:
+            timeout: Maximum seconds to wait, or None to wait indefinitely
+
+        Returns:
+            True once a slot is held, False if the timeout expired
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        delay = self._poll_interval
+        while not self.try_acquire():
+            if deadline is not None and loop.time() >= deadline:
+                return False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self._max_poll_interval)
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            if self._active > 0:
+                self._active -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+        return False
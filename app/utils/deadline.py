@@ -0,0 +1,221 @@
+"""
+Deadline budgets and hedged requests for LLM calls.
+
+An endpoint opens a budget with budget_scope(). The budget travels in a
+context variable into every LLM call made for the request, including calls
+in tasks started with asyncio.gather. When a call would outlive the budget
+it raises DeadlineExceeded. The caller then falls back and marks the
+response as degraded.
+
+Optionally, a call that runs past a percentile of recently observed
+latency for the same prompt is hedged. A duplicate is started and the first
+successful result wins.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from app.utils.settings import get_setting
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's time budget runs out before an LLM call completes."""
+
+
+class Budget:
+    """Time budget of one request, plus the reasons its response is degraded."""
+
+    def __init__(self, seconds: Optional[float]):
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.degraded: List[str] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None for an unbounded budget."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def mark_degraded(self, reason: str) -> None:
+        with self._lock:
+            self.degraded.append(reason)
+
+    @property
+    def is_degraded(self) -> bool:
+        return bool(self.degraded)
+
+
+_budget: contextvars.ContextVar[Optional[Budget]] = contextvars.ContextVar("request_budget", default=None)
+
+
+def current_budget() -> Optional[Budget]:
+    return _budget.get()
+
+
+@contextmanager
+def budget_scope(seconds: Optional[float]) -> Iterator[Budget]:
+    """Give the LLM calls made inside the block a shared time budget."""
+    budget = Budget(seconds)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+def budget_context(budget: Budget) -> contextvars.Context:
+    """
+    Build a context carrying a budget, for code driven outside the view.
+
+    Streaming responses keep running after the view returns, so they run
+    their async generator in this context (see iterate_async).
+    """
+    context = contextvars.copy_context()
+    context.run(_budget.set, budget)
+    return context
+
+
+def mark_degraded(reason: str) -> None:
+    """Record that part of the current response is a fallback."""
+    budget = _budget.get()
+    if budget is not None:
+        budget.mark_degraded(reason)
+
+
+def remaining_or_raise() -> Optional[float]:
+    """Seconds left in the current budget; raise if it is already used up."""
+    budget = _budget.get()
+    remaining = budget.remaining() if budget is not None else None
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded("Request time budget exhausted")
+    return remaining
+
+
+class LatencyTracker:
+    """Recent successful call latencies per prompt, used to decide when to hedge."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def count_hedge(self, won: bool = False) -> None:
+        with self._lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedges += 1
+
+    def percentile(self, name: str, percentile: float, min_samples: int) -> Optional[float]:
+        """Latency percentile for a prompt, or None until enough calls were observed."""
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+        if len(samples) < min_samples:
+            return None
+        return float(np.percentile(samples, percentile))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {name: len(samples) for name, samples in self._samples.items()}
+            return {"samples": counts, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+
+latency = LatencyTracker()
+
+
+def hedge_delay(name: str) -> Optional[float]:
+    """When to start a hedged duplicate of a call, or None to not hedge."""
+    if not get_setting("LLM_HEDGE_ENABLED", False):
+        return None
+    return latency.percentile(
+        name,
+        float(get_setting("LLM_HEDGE_PERCENTILE", 95)),
+        int(get_setting("LLM_HEDGE_MIN_SAMPLES", 20)),
+    )
+
+
+async def call_with_deadline(name: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run an LLM call within the current budget, hedging it if it runs slow.
+
+    Args:
+        name: Prompt name the latency statistics are kept under
+        factory: Callable returning a fresh awaitable for the call
+
+    Returns:
+        The result of the first attempt to succeed
+    """
+    timeout = remaining_or_raise()
+    delay = hedge_delay(name)
+    started = time.monotonic()
+
+    if delay is None or (timeout is not None and delay >= timeout):
+        try:
+            result = await asyncio.wait_for(factory(), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{name} call exceeded the request time budget")
+        latency.record(name, time.monotonic() - started)
+        return result
+
+    primary = asyncio.ensure_future(factory())
+    attempts = {primary: started}
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if not done:
+            latency.count_hedge()
+            hedge = asyncio.ensure_future(factory())
+            attempts[hedge] = time.monotonic()
+
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = None if timeout is None else timeout - (time.monotonic() - started)
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    latency.record(name, time.monotonic() - attempts[task])
+                    if task is not primary:
+                        latency.count_hedge(won=True)
+                    return task.result()
+                error = task.exception()
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(f"{name} call exceeded the request time budget")
+    finally:
+        for task in attempts:
+            task.cancel()
+
+
+async def stream_with_deadline(agen: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """Relay an async stream, raising DeadlineExceeded if the budget runs out between chunks."""
+    iterator = agen.__aiter__()
+    try:
+        while True:
+            timeout = remaining_or_raise()
+            try:
+                item = await asyncio.wait_for(iterator.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("Stream exceeded the request time budget")
+            yield item
+    finally:
+        close = getattr(iterator, "aclose", None)
+        if close is not None:
+            await close()
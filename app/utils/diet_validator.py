@@ -0,0 +1,195 @@
+"""
+Local diet and allergen constraint validator.
+
+Generated meals are checked against the user's dietType, the allergies
+mentioned in medicalHistory/medications, and foods that interact with the
+listed medications. Forbidden ingredients of every diet and allergy group are
+compiled into one Aho-Corasick automaton, so a day is checked in a single
+pass per meal. Phrases that make an ingredient safe ("no cheese", "vegan
+mayo", "gluten-free bread", "almond milk" for a dairy allergy) are
+recognised so compliant meals are not sent back for repair.
+"""
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from app.utils.aho_corasick import AhoCorasick
+from app.utils.meal_catalog import DIET_LEVELS, detect_allergens, diet_level
+
+ANIMAL_GROUPS = ("meat", "fish", "shellfish", "egg", "dairy", "honey")
+
+# Groups each diet excludes, by DIET_LEVELS name
+DIET_EXCLUSIONS = {
+    "vegan": ANIMAL_GROUPS,
+    "vegetarian": ("meat", "fish", "shellfish", "egg"),
+    "eggetarian": ("meat", "fish", "shellfish"),
+    "pescatarian": ("meat",),
+    "non_vegetarian": (),
+}
+
+# Medicines whose effect is changed by a food, and the group of that food
+MEDICATION_INTERACTIONS = {
+    "grapefruit": ("statin", "atorvastatin", "simvastatin", "lovastatin", "felodipine", "nifedipine",
+                   "cyclosporine", "buspirone", "amiodarone"),
+}
+
+# Forbidden ingredient phrases per group; allergen groups use meal_catalog.ALLERGEN_WORDS names
+GROUP_TERMS = {
+    "meat": (
+        "chicken", "turkey", "beef", "steak", "pork", "bacon", "ham", "sausage", "sausages", "salami", "pepperoni",
+        "prosciutto", "chorizo", "lamb", "mutton", "goat", "veal", "venison", "duck", "liver", "keema", "mince",
+        "meatballs", "meat", "gelatin", "bone broth", "jerky",
+    ),
+    "fish": (
+        "fish", "salmon", "tuna", "sardine", "sardines", "mackerel", "cod", "tilapia", "trout", "anchovy",
+        "anchovies", "halibut", "haddock", "pomfret", "rohu", "hilsa", "fish sauce", "worcestershire",
+    ),
+    "shellfish": (
+        "shrimp", "prawn", "prawns", "crab", "lobster", "oyster", "oysters", "mussels", "clams", "scallops",
+        "squid", "calamari", "oyster sauce",
+    ),
+    "egg": (
+        "egg", "eggs", "omelette", "omelet", "frittata", "mayonnaise", "mayo", "meringue", "quiche", "shakshuka",
+        "egg bhurji", "custard", "egg noodles",
+    ),
+    "dairy": (
+        "milk", "cheese", "cheddar", "mozzarella", "parmesan", "feta", "ricotta", "paneer", "cottage cheese",
+        "yogurt", "yoghurt", "greek yogurt", "curd", "dahi", "raita", "lassi", "buttermilk", "butter", "ghee",
+        "cream", "sour cream", "ice cream", "whey", "kheer", "khoa", "kefir", "custard", "pesto",
+        "goat cheese", "goat's cheese", "goats cheese", "goat milk", "goat's milk", "goats milk", "goat yogurt",
+    ),
+    "honey": ("honey",),
+    "peanut": ("peanut", "peanuts", "groundnut", "groundnuts", "peanut butter", "peanut oil", "satay"),
+    "tree_nuts": (
+        "almond", "almonds", "walnut", "walnuts", "cashew", "cashews", "pistachio", "pistachios", "hazelnut",
+        "hazelnuts", "pecan", "pecans", "macadamia", "pine nuts", "nuts", "mixed nuts", "trail mix", "pesto",
+        "praline", "marzipan", "almond milk", "almond butter", "almond flour", "cashew cream", "nut butter",
+        "cashew milk", "cashew butter", "cashew cheese", "almond yogurt", "walnut butter", "hazelnut butter",
+        "pistachio butter", "macadamia butter",
+    ),
+    "gluten": (
+        "wheat", "whole wheat", "bread", "toast", "sourdough", "roti", "rotis", "chapati", "chapatis", "paratha",
+        "naan", "pasta", "spaghetti", "penne", "macaroni", "noodles", "egg noodles", "udon", "ramen", "couscous",
+        "barley", "rye", "semolina", "suji", "rava", "upma", "seitan", "bulgur", "tortilla", "pita", "bagel",
+        "croissant", "muffin", "crackers", "pancakes", "flour", "cream of wheat",
+    ),
+    "soy": (
+        "soy", "soya", "tofu", "tempeh", "edamame", "miso", "soy sauce", "soy milk", "soya chunks", "soybeans",
+        "tamari", "bean curd", "soy yogurt", "soy mince", "soy butter",
+    ),
+    "sesame": ("sesame", "sesame oil", "tahini", "til", "hummus"),
+    "grapefruit": ("grapefruit", "grapefruit juice", "pomelo"),
+}
+
+# Phrases that contain a forbidden word but belong to no group, or to fewer groups
+SAFE_PHRASES = (
+    "coconut milk", "oat milk", "rice milk", "coconut yogurt", "coconut cream", "rice noodles", "corn tortilla",
+    "rice flour", "chickpea flour", "besan", "cocoa butter", "butter beans", "butter bean", "coconut butter",
+    "sunflower seed butter", "sunflower butter", "pumpkin seed butter", "seed butter", "apple butter",
+    "plant butter", "oat yogurt", "nice cream", "milk thistle",
+)
+
+# Qualifiers right before an ingredient and the groups they clear
+QUALIFIERS = {
+    "vegan": ANIMAL_GROUPS, "plant-based": ANIMAL_GROUPS, "plant based": ANIMAL_GROUPS, "meatless": ("meat",),
+    "mock": ("meat", "fish", "shellfish"), "dairy-free": ("dairy",), "dairy free": ("dairy",),
+    "lactose-free": ("dairy",), "lactose free": ("dairy",), "egg-free": ("egg",), "eggless": ("egg",),
+    "gluten-free": ("gluten",), "gluten free": ("gluten",), "nut-free": ("peanut", "tree_nuts"),
+    "soy-free": ("soy",), "veggie": ("meat", "fish", "shellfish"), "vegetarian": ("meat", "fish", "shellfish"),
+}
+QUALIFIER_BEFORE = re.compile(rf"\b({'|'.join(re.escape(q) for q in QUALIFIERS)})\s+(?:[a-z-]+\s+)?$")
+NEGATION_BEFORE = re.compile(r"\b(no|without|skip|minus|free of|instead of|replace|replacing|swap)\s+(?:[a-z-]+\s+)?$")
+
+# Readable names for repair instructions
+GROUP_LABELS = {
+    "meat": "meat", "fish": "fish", "shellfish": "shellfish", "egg": "eggs", "dairy": "dairy", "honey": "honey",
+    "peanut": "peanut allergy", "tree_nuts": "tree nut allergy", "gluten": "gluten intolerance",
+    "soy": "soy allergy", "sesame": "sesame allergy", "grapefruit": "medication interaction",
+}
+
+
+def build_terms() -> Dict[str, Tuple[str, ...]]:
+    """Map every phrase to the groups it belongs to."""
+    terms: Dict[str, List[str]] = {phrase: [] for phrase in SAFE_PHRASES}
+    for group, phrases in GROUP_TERMS.items():
+        for phrase in phrases:
+            terms.setdefault(phrase, []).append(group)
+    return {phrase: tuple(groups) for phrase, groups in terms.items()}
+
+
+def forbidden_groups(user_details_dict: Dict[str, Any]) -> FrozenSet[str]:
+    """
+    Ingredient groups a profile must not be served.
+
+    Args:
+        user_details_dict: Dictionary containing user health data
+
+    Returns:
+        Group names from the diet, detected allergies and medication interactions
+    """
+    details = user_details_dict or {}
+    groups = set(DIET_EXCLUSIONS[DIET_LEVELS[diet_level(details.get("dietType"))]])
+    groups.update(detect_allergens(details.get("medicalHistory"), details.get("medications")))
+    medications = str(details.get("medications") or "").lower()
+    for group, medicines in MEDICATION_INTERACTIONS.items():
+        if any(re.search(rf"\b{re.escape(medicine)}", medications) for medicine in medicines):
+            groups.add(group)
+    return frozenset(groups)
+
+
+class DietValidator:
+    """Forbidden-ingredient automaton shared by every request."""
+
+    def __init__(self, terms: Optional[Dict[str, Tuple[str, ...]]] = None):
+        self.matcher = AhoCorasick((terms or build_terms()).items())
+
+    def check_meal(self, text: str, forbidden: Iterable[str]) -> List[Tuple[str, str]]:
+        """
+        Find forbidden ingredients in one meal description.
+
+        Args:
+            text: Meal description
+            forbidden: Group names to enforce
+
+        Returns:
+            (matched phrase, group) pairs, in text order
+        """
+        forbidden = set(forbidden)
+        if not forbidden or not text:
+            return []
+        lowered = text.lower()
+        violations = []
+        for start, end, groups in self.matcher.find(lowered):
+            hits = [group for group in groups if group in forbidden]
+            if not hits:
+                continue
+            before = lowered[max(0, start - 30):start]
+            if NEGATION_BEFORE.search(before):
+                continue
+            qualifier = QUALIFIER_BEFORE.search(before)
+            if qualifier is not None:
+                hits = [group for group in hits if group not in QUALIFIERS[qualifier.group(1)]]
+            violations.extend((lowered[start:end], group) for group in hits)
+        return violations
+
+    def check_day(self, day_meals: Dict[str, str], forbidden: Iterable[str]) -> Dict[str, List[Tuple[str, str]]]:
+        """Violations per meal slot of one day; slots without violations are left out."""
+        forbidden = frozenset(forbidden)
+        violations = {}
+        for slot, description in (day_meals or {}).items():
+            found = self.check_meal(str(description), forbidden)
+            if found:
+                violations[slot] = found
+        return violations
+
+
+def describe_violations(violations: Dict[str, List[Tuple[str, str]]]) -> str:
+    """Instruction listing the ingredients a repair must avoid."""
+    found = {}
+    for pairs in violations.values():
+        for phrase, group in pairs:
+            found.setdefault(phrase, GROUP_LABELS.get(group, group))
+    listed = ", ".join(f"{phrase} ({label})" for phrase, label in found.items())
+    return f"Must not contain these ingredients, which conflict with the user's diet, allergies or medications: {listed}."
+
+
+validator = DietValidator()
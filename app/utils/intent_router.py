@@ -0,0 +1,285 @@
+"""
+Local intent router for trivial chat turns.
+
+Greetings, thanks, "ok" and questions about the assistant itself do not need
+an LLM round trip. Short messages are classified locally: anchored regex
+rules catch the common phrasings, and a small softmax model over hashed
+n-gram features catches the variations. Confident matches are answered from
+templates tailored with the user's details; everything else falls through
+to the LLM. Every decision is logged with its confidence so the thresholds
+can be tuned.
+"""
+import json
+import re
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.profile import canonical_value, is_yes
+from app.utils.semantic_cache import embed, normalize_question
+from app.utils.settings import get_setting
+
+OTHER = "other"
+
+# Anchored rules over normalized text; a full match routes with confidence 1.0
+RULES = {
+    "greeting": r"(hi+|hello+|hey+|hiya|yo|namaste|good (morning|afternoon|evening))( there| harmonia| again)?",
+    "thanks": r"((ok(ay)? )?(thanks|thank you|thx|ty|many thanks)( (so|very) much| a lot| a ton)?|(that|this) (was|is) (very |really )?helpful)",
+    "acknowledgement": r"(ok(ay)?|k|cool|great|nice|got it|alright|sounds good|understood|i see|noted|perfect)",
+    "goodbye": r"(bye+|goodbye|see (you|ya)( later| soon)?|good night|gn|take care|talk (to you )?later|ttyl)",
+    "capabilities": r"(help|what can you do|who are you|what are you|what do you do|how can you help( me)?|what can i ask( you)?)",
+    "meal_plan_help": r"(how (do|can) i (get|make|create|generate) (a |my )?meal plan|where is my meal plan|meal plan( please)?)",
+}
+_RULES = {intent: re.compile(rf"^(?:{pattern})$") for intent, pattern in RULES.items()}
+
+# Seed examples the linear model is trained on at first use
+EXAMPLES = {
+    "greeting": [
+        "hi", "hello", "hey there", "hello there how are you", "hi how are you", "good morning",
+        "hey how is it going", "hi again", "hello harmonia", "heyy", "good evening to you", "hi there friend",
+        "hello how are you doing today", "morning", "hey hey",
+    ],
+    "thanks": [
+        "thanks", "thank you", "thank you so much", "thanks a lot", "thanks for the help", "that was helpful thanks",
+        "thank you that helps", "great thanks", "cool thank you", "thanks for your advice", "appreciate it",
+        "much appreciated", "thank you very much for the tips", "ok thanks", "that helps a lot thanks",
+    ],
+    "acknowledgement": [
+        "ok", "okay", "got it", "alright", "sounds good", "makes sense", "i see", "understood", "cool",
+        "nice", "perfect", "ok got it", "fine", "sure", "alright then",
+    ],
+    "goodbye": [
+        "bye", "goodbye", "see you later", "good night", "take care", "talk to you later", "bye for now",
+        "see you soon", "thats all for today bye", "i have to go now", "catch you later", "gotta go bye",
+    ],
+    "capabilities": [
+        "what can you do", "who are you", "how can you help me", "what can i ask you", "help",
+        "what are you able to do", "what kind of questions can you answer", "what is this app for",
+        "are you a bot", "what do you know about", "how does this work", "can you help me",
+    ],
+    "meal_plan_help": [
+        "how do i get a meal plan", "can i get a meal plan", "where do i find my meal plan", "how to create meal plan",
+        "i want a meal plan", "make me a meal plan", "how does the meal planner work", "generate my meal plan",
+        "where is the meal planner", "can you create a diet plan for me",
+    ],
+    OTHER: [
+        "why is my period late", "i have severe cramps what should i do", "what foods help with pcos",
+        "is it normal to bleed for 8 days", "how can i reduce bloating before my period",
+        "what should i eat when i have heavy bleeding", "i feel tired all the time", "can stress delay my period",
+        "what are the symptoms of pcos", "is spotting between periods normal", "how much iron do i need",
+        "i have acne around my period", "what exercise is good for cramps", "how do i track ovulation",
+        "my cycle is irregular", "can i drink coffee during my period", "what vitamins should i take",
+        "i am feeling anxious before my period", "how can i sleep better", "what is a normal cycle length",
+        "thanks but my cramps are still bad", "ok but why is my period late", "hi i have a question about pcos",
+        "hello my period is late", "i see but what about iron", "what can i eat for breakfast with pcos",
+        "help my cramps are unbearable", "who should i see for pcos", "good morning i feel dizzy today",
+        "is it ok to exercise on my period", "okay what foods have iron", "thank you what about magnesium",
+    ],
+}
+
+INTENTS = list(EXAMPLES)
+
+
+class IntentModel:
+    """Softmax regression over hashed n-gram features."""
+
+    def __init__(self, dim: int = 512, iterations: int = 300, learning_rate: float = 2.0, l2: float = 1e-3):
+        self.dim = dim
+        texts = [(normalize_question(text), intent) for intent, examples in EXAMPLES.items() for text in examples]
+        features = np.stack([embed(text, dim) for text, _ in texts])
+        labels = np.array([INTENTS.index(intent) for _, intent in texts])
+        targets = np.eye(len(INTENTS), dtype=np.float32)[labels]
+
+        self.weights = np.zeros((dim, len(INTENTS)), dtype=np.float32)
+        self.bias = np.zeros(len(INTENTS), dtype=np.float32)
+        for _ in range(iterations):
+            probabilities = self._softmax(features @ self.weights + self.bias)
+            error = (probabilities - targets) / len(texts)
+            self.weights -= learning_rate * (features.T @ error + l2 * self.weights)
+            self.bias -= learning_rate * error.sum(axis=0)
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return shifted / shifted.sum(axis=-1, keepdims=True)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Most likely intent of normalized text and its probability."""
+        probabilities = self._softmax(embed(text, self.dim) @ self.weights + self.bias)
+        best = int(probabilities.argmax())
+        return INTENTS[best], float(probabilities[best])
+
+
+def profile_topics(user_details_dict: Dict[str, Any]) -> List[str]:
+    """Chat topics suggested by the user's details, most specific first."""
+    details = user_details_dict or {}
+    topics = []
+    if is_yes(details.get("pcosDiagnosis")):
+        topics.append("managing PCOS symptoms")
+    if is_yes(details.get("heavyBleeding")):
+        topics.append("iron-rich foods for heavy periods")
+    if is_yes(details.get("severeCramps")):
+        topics.append("easing cramps")
+    if is_yes(details.get("fatigue")):
+        topics.append("boosting your energy")
+    if is_yes(details.get("sleepDisturbances")):
+        topics.append("sleeping better")
+    if canonical_value(details.get("stressLevels")) in ("high", "very high", "severe"):
+        topics.append("managing stress")
+    if canonical_value(details.get("periodRegularity")) in ("irregular", "no"):
+        topics.append("understanding your irregular cycle")
+    return topics
+
+
+def join_topics(topics: List[str]) -> str:
+    return topics[0] if len(topics) == 1 else f"{', '.join(topics[:-1])} or {topics[-1]}"
+
+
+def render_reply(intent: str, user_details_dict: Dict[str, Any], seed: int) -> str:
+    """Template answer for an intent, tailored with the user's details."""
+    details = user_details_dict or {}
+    topics = profile_topics(details)[:2]
+    topic = join_topics(topics) if topics else "your cycle, diet or well-being"
+    diet = canonical_value(details.get("dietType"))
+    diet_phrase = f"your {diet} diet" if diet else "your diet"
+
+    if intent == "greeting":
+        opener = ("Hello!", "Hi there!", "Hey!")[seed % 3]
+        return (f"{opener} I'm here to help with your menstrual health, diet and well-being. "
+                f"We could talk about {topic}. What's on your mind today?")
+    if intent == "thanks":
+        return (f"You're welcome! Feel free to ask anything else about {topic}. "
+                "If you have any serious concerns, please consult a doctor.")
+    if intent == "acknowledgement":
+        return f"Great! Let me know if there's anything else you'd like to know about {topic}."
+    if intent == "goodbye":
+        closing = "Remember to keep up your iron-rich foods." if is_yes(details.get("heavyBleeding")) else \
+            "Come back anytime you have questions."
+        return f"Take care! {closing}"
+    if intent == "capabilities":
+        return ("I can answer questions about your menstrual cycle, symptoms, diet and overall well-being, "
+                f"tailored to the details in your profile, such as {diet_phrase}"
+                f"{' and ' + topics[0] if topics else ''}. I can also help you build a weekly meal plan "
+                "from the meal planner. For anything serious, please consult a doctor.")
+    if intent == "meal_plan_help":
+        return (f"You can get a personalized weekly meal plan from the meal planner. It takes {diet_phrase} "
+                "and your health details into account, and you can add preferences such as cuisines or "
+                "ingredients to avoid. If you don't like a day or a meal, you can regenerate just that part.")
+    raise ValueError(f"No template for intent: {intent}")
+
+
+class IntentRouter:
+    """Classify chat turns and answer the trivial ones locally."""
+
+    def __init__(self, threshold: float = 0.8, max_words: int = 8, log_path: Optional[str] = None):
+        self.threshold = threshold
+        self.max_words = max_words
+        self.log_path = log_path
+        self.model = IntentModel()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {}
+
+    def classify(self, text: str, awaiting_answer: bool = False) -> Tuple[str, float, str]:
+        """
+        Classify a message.
+
+        Args:
+            text: The user's message
+            awaiting_answer: The assistant's last message asked a question
+
+        Returns:
+            (intent, confidence, source); intent is "other" for LLM turns
+        """
+        normalized = normalize_question(text)
+        if not normalized:
+            return OTHER, 1.0, "empty"
+        if len(normalized.split()) > self.max_words:
+            return OTHER, 1.0, "length"
+
+        for intent, rule in _RULES.items():
+            if rule.match(normalized):
+                intent, confidence, source = intent, 1.0, "rule"
+                break
+        else:
+            intent, confidence = self.model.predict(normalized)
+            source = "model"
+
+        # "ok" or "sure" can be the answer to the assistant's question
+        if awaiting_answer and intent == "acknowledgement":
+            return OTHER, confidence, "awaiting_answer"
+        return intent, confidence, source
+
+    def route(self, text: str, user_details_dict: Dict[str, Any], history: Optional[str] = None) -> Optional[str]:
+        """
+        Answer a trivial message locally.
+
+        Args:
+            text: The user's message
+            user_details_dict: Dictionary containing user health data
+            history: Optional rendered conversation memory
+
+        Returns:
+            The templated reply, or None to send the message to the LLM
+        """
+        awaiting_answer = bool(history) and history.rstrip().endswith("?")
+        intent, confidence, source = self.classify(text, awaiting_answer)
+        local = intent != OTHER and confidence >= self.threshold
+        self._log(text, intent, confidence, source, local)
+        if not local:
+            return None
+        return render_reply(intent, user_details_dict, zlib.crc32(text.encode("utf-8")))
+
+    def _log(self, text: str, intent: str, confidence: float, source: str, local: bool) -> None:
+        route = "local" if local else "llm"
+        key = f"{route}:{intent}"
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+        print(f"Intent router: {route} intent={intent} confidence={confidence:.3f} source={source}")
+        if self.log_path:
+            record = {"ts": time.time(), "route": route, "intent": intent, "confidence": round(confidence, 4),
+                      "source": source, "words": len(text.split()), "text": text[:200]}
+            try:
+                with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print(f"Intent router log write failed: {str(e)}", file=sys.stderr)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._stats)
+        local = sum(count for key, count in counts.items() if key.startswith("local:"))
+        total = sum(counts.values())
+        return {"decisions": counts, "local_rate": local / total if total else 0.0,
+                "threshold": self.threshold, "max_words": self.max_words}
+
+
+_router: Optional[IntentRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_intent_router() -> Optional[IntentRouter]:
+    """Return the process-wide intent router, or None when routing is disabled."""
+    global _router
+    if not get_setting("INTENT_ROUTER_ENABLED", True):
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = IntentRouter(
+                    threshold=float(get_setting("INTENT_ROUTER_THRESHOLD", 0.8)),
+                    max_words=int(get_setting("INTENT_ROUTER_MAX_WORDS", 8)),
+                    log_path=get_setting("INTENT_ROUTER_LOG_PATH"),
+                )
+    return _router
+
+
+def route_intent(text: str, user_details_dict: Dict[str, Any], history: Optional[str] = None) -> Optional[str]:
+    """Templated reply for a trivial message, or None when it needs the LLM."""
+    router = get_intent_router()
+    if router is None:
+        return None
+    return router.route(text, user_details_dict, history)
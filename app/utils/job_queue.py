@@ -0,0 +1,256 @@
+"""
+Background job queue for meal plan generation.
+
+A meal plan takes several LLM calls, and holding a WSGI worker for all of
+them starves every other blueprint. Endpoints can instead enqueue a
+MealPlanJob row and return 202. A small pool of worker threads in each
+process claims jobs from the database and writes the resulting MealPlan.
+
+Claims are conditional UPDATEs, so several processes can share one queue.
+A claimed job becomes visible again once its visibility timeout passes.
+Failed attempts are retried with exponential backoff, up to max_attempts.
+"""
+import asyncio
+import os
+import sys
+import threading
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, or_
+
+from app.extensions import db
+from app.models.meal_plan import MealPlan
+from app.models.meal_plan_job import JobStatus, MealPlanJob
+from app.models.user_detail import UserDetail
+from app.utils.chatbot import get_meal_plan_llm
+from app.utils.settings import get_setting
+
+
+def enqueue_meal_plan_job(user_id: str, user_message: Optional[str] = None, mode: Optional[str] = None,
+                          reuse_running: bool = True) -> MealPlanJob:
+    """
+    Queue a meal plan generation for a user.
+
+    A pending job with the same parameters is reused, so double taps and
+    client retries do not queue duplicate work.
+
+    Args:
+        user_id: Id of the user the plan is for
+        user_message: Optional message from user with specific meal preferences
+        mode: Generation mode, defaults to MEAL_PLAN_GENERATION_MODE
+        reuse_running: Also reuse a job that is already running; running jobs
+            have read the user's details, so pass False after they change
+
+    Returns:
+        The queued (or already pending) job
+    """
+    pending_statuses = [JobStatus.QUEUED, JobStatus.RUNNING] if reuse_running else [JobStatus.QUEUED]
+    pending = MealPlanJob.query.filter(
+        MealPlanJob.user_id == user_id,
+        MealPlanJob.status.in_(pending_statuses),
+        MealPlanJob.user_message.is_(None) if user_message is None else MealPlanJob.user_message == user_message,
+        MealPlanJob.mode.is_(None) if mode is None else MealPlanJob.mode == mode,
+    ).first()
+    if pending:
+        return pending
+
+    job = MealPlanJob(
+        user_id=user_id,
+        user_message=user_message,
+        mode=mode,
+        max_attempts=int(get_setting("JOB_QUEUE_MAX_ATTEMPTS", 3)),
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    if _pool is not None:
+        _pool.wake()
+    return job
+
+
+def schedule_meal_plan_refresh(user_id: str) -> Optional[MealPlanJob]:
+    """
+    Speculatively queue a plan for a user whose details were created or changed.
+
+    Only runs when MEAL_PLAN_SPECULATIVE_REGENERATION is enabled, so that the
+    next meal planner visit finds a fresh plan instead of blocking on one.
+
+    Returns:
+        The queued job, or None when speculative regeneration is disabled
+    """
+    if not get_setting("MEAL_PLAN_SPECULATIVE_REGENERATION", False):
+        return None
+    return enqueue_meal_plan_job(user_id, reuse_running=False)
+
+
+def find_pending_job(user_id: str) -> Optional[MealPlanJob]:
+    """The user's queued or running job for a plan without a message, if any."""
+    return MealPlanJob.query.filter(
+        MealPlanJob.user_id == user_id,
+        MealPlanJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]),
+        MealPlanJob.user_message.is_(None),
+    ).order_by(MealPlanJob.created_at.desc()).first()
+
+
+def claim_next_job(worker_id: str, visibility_timeout: float) -> Optional[str]:
+    """
+    Claim the oldest available job for a worker.
+
+    Returns:
+        The claimed job's id, or None when nothing is available
+    """
+    now = datetime.now()
+    candidates: List[MealPlanJob] = MealPlanJob.query.filter(or_(
+        and_(MealPlanJob.status == JobStatus.QUEUED, MealPlanJob.available_at <= now),
+        # Running jobs whose worker died or stalled past the visibility timeout
+        and_(MealPlanJob.status == JobStatus.RUNNING, MealPlanJob.locked_until < now),
+    )).order_by(MealPlanJob.available_at).limit(5).all()
+
+    for job in candidates:
+        # Only one worker's conditional update can match the snapshot it read
+        snapshot = MealPlanJob.query.filter_by(id=job.id, status=job.status, attempts=job.attempts)
+        if job.attempts >= job.max_attempts:
+            snapshot.update({
+                "status": JobStatus.FAILED,
+                "locked_until": None,
+                "error": job.error or "Job timed out",
+            }, synchronize_session=False)
+            db.session.commit()
+            continue
+
+        claimed = snapshot.update({
+            "status": JobStatus.RUNNING,
+            "attempts": job.attempts + 1,
+            "locked_until": now + timedelta(seconds=visibility_timeout),
+            "worker_id": worker_id,
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return job.id
+    return None
+
+
+def process_job(job_id: str, worker_id: str, retry_backoff: float) -> None:
+    """Run one claimed job and record its outcome."""
+    job = MealPlanJob.query.filter_by(id=job_id).first()
+    attempts, max_attempts = job.attempts, job.max_attempts
+    owned = MealPlanJob.query.filter_by(id=job_id, worker_id=worker_id, attempts=attempts, status=JobStatus.RUNNING)
+
+    try:
+        user_details = UserDetail.query.filter_by(user_id=job.user_id).first()
+        if not user_details:
+            owned.update({"status": JobStatus.FAILED, "locked_until": None,
+                          "error": "User details not found"}, synchronize_session=False)
+            db.session.commit()
+            return
+
+        meal_plan_data = asyncio.run(
+            get_meal_plan_llm(user_details.to_dict(), job.user_message, job.mode, job.user_id)
+        )
+        if isinstance(meal_plan_data, dict) and "error" in meal_plan_data:
+            raise RuntimeError(meal_plan_data["error"])
+
+        # Deactivate previous meal plans
+        MealPlan.query.filter_by(user_id=job.user_id, is_active=True).update({"is_active": False})
+
+        new_meal_plan = MealPlan(
+            user_id=job.user_id,
+            plan_data=meal_plan_data
+        )
+        db.session.add(new_meal_plan)
+        db.session.flush()
+
+        # Another worker took over if our visibility timeout expired
+        if not owned.update({"status": JobStatus.SUCCEEDED, "plan_id": new_meal_plan.id,
+                             "locked_until": None, "error": None}, synchronize_session=False):
+            db.session.rollback()
+            return
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        error_traceback = traceback.format_exc()
+        print(f"ERROR in meal plan job {job_id} (attempt {attempts}): {str(e)}", file=sys.stderr)
+        print(f"Traceback: {error_traceback}", file=sys.stderr)
+
+        if attempts < max_attempts:
+            delay = retry_backoff * (2 ** (attempts - 1))
+            outcome = {"status": JobStatus.QUEUED, "available_at": datetime.now() + timedelta(seconds=delay)}
+        else:
+            outcome = {"status": JobStatus.FAILED}
+        owned.update({**outcome, "locked_until": None, "error": str(e)}, synchronize_session=False)
+        db.session.commit()
+
+
+class MealPlanWorkerPool:
+    """Worker threads that process queued meal plan jobs; the thread count caps concurrency."""
+
+    def __init__(self, app, workers: int = 2, poll_interval: float = 1.0,
+                 visibility_timeout: float = 300.0, retry_backoff: float = 10.0):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.retry_backoff = retry_backoff
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._prefix = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, args=(f"{self._prefix}-{index}",),
+                name=f"meal-plan-worker-{index}", daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self) -> None:
+        """Let idle workers pick up a new job without waiting for the next poll."""
+        self._wakeup.set()
+
+    def _run(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            job_id = None
+            try:
+                with self.app.app_context():
+                    job_id = claim_next_job(worker_id, self.visibility_timeout)
+                    if job_id:
+                        process_job(job_id, worker_id, self.retry_backoff)
+            except Exception as e:
+                # Typically the database is unreachable or not migrated yet
+                message = str(e).splitlines()[0] if str(e) else repr(e)
+                print(f"ERROR in meal plan worker {worker_id}: {message}", file=sys.stderr)
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+_pool: Optional[MealPlanWorkerPool] = None
+
+
+def init_job_queue(app) -> Optional[MealPlanWorkerPool]:
+    """Start this process's worker pool when JOB_QUEUE_WORKERS is positive."""
+    global _pool
+    workers = int(app.config.get("JOB_QUEUE_WORKERS", 0))
+    if workers <= 0 or _pool is not None:
+        return _pool
+    _pool = MealPlanWorkerPool(
+        app,
+        workers=workers,
+        poll_interval=float(app.config.get("JOB_QUEUE_POLL_INTERVAL", 1.0)),
+        visibility_timeout=float(app.config.get("JOB_QUEUE_VISIBILITY_TIMEOUT", 300)),
+        retry_backoff=float(app.config.get("JOB_QUEUE_RETRY_BACKOFF", 10)),
+    )
+    _pool.start()
+    return _pool
@@ -0,0 +1,184 @@
+"""
+Incremental, tolerant JSON extraction from LLM output.
+
+Models wrap JSON in prose and code fences and add trailing commas, single
+quotes or Python literals. A strict parser rejects all of that and wastes a
+completed call. JsonObjectExtractor finds balanced objects in a token stream
+as soon as they close, so the caller can validate and stop the stream early.
+repair_json() fixes the common defects before parsing.
+"""
+import json
+from typing import Any, List, Optional
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JsonObjectExtractor:
+    """Find top-level {...} objects in text that arrives in chunks."""
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._quote: Optional[str] = None
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Add a chunk of output.
+
+        Args:
+            chunk: Newly received text
+
+        Returns:
+            The text of every object that was completed by this chunk
+        """
+        self._text += chunk
+        found = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._depth == 0:
+                # Outside objects only an opening brace matters; apostrophes in prose are not quotes
+                if char == "{":
+                    self._start = i
+                    self._depth = 1
+                continue
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == self._quote:
+                    self._quote = None
+            elif char in ("\"", "'"):
+                self._quote = char
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    found.append(text[self._start:i + 1])
+                    self._start = None
+        self._pos = len(text)
+        return found
+
+    def pending(self) -> Optional[str]:
+        """Text of the object still open at the end of the stream, if any."""
+        return self._text[self._start:] if self._start is not None else None
+
+
+def repair_json(text: str, close: bool = False) -> str:
+    """
+    Fix common defects in model-written JSON.
+
+    Converts single-quoted strings to double-quoted ones, drops trailing
+    commas and maps Python literals (True/False/None) to JSON.
+
+    Args:
+        text: JSON-like text
+        close: Also close any unclosed brackets. A truncated string is
+            dropped, with its key when it is a value, instead of being
+            closed, so a cut-off value never passes as a complete one
+
+    Returns:
+        The repaired text
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    quote: Optional[str] = None
+    # Output offsets where each string started, to drop a truncated one
+    string_starts: List[int] = []
+    i, n = 0, len(text)
+    while i < n:
+        char = text[i]
+        if quote is not None:
+            if char == "\\" and i + 1 < n:
+                escaped = text[i + 1]
+                # \' is not a valid JSON escape
+                out.append("'" if escaped == "'" else char + escaped)
+                i += 2
+                continue
+            if char == quote:
+                out.append("\"")
+                quote = None
+            elif char == "\"":
+                # A double quote inside a single-quoted string
+                out.append("\\\"")
+            else:
+                out.append(char)
+            i += 1
+            continue
+
+        if char in ("\"", "'"):
+            quote = char
+            string_starts.append(len(out))
+            out.append("\"")
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+            out.append(char)
+        elif char in ("}", "]"):
+            if stack:
+                stack.pop()
+            out.append(char)
+        elif char == ",":
+            j = i + 1
+            while j < n and text[j].isspace():
+                j += 1
+            # Trailing comma before a closer (or at the very end)
+            if j < n and text[j] not in "}]":
+                out.append(char)
+        elif char.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(char)
+        i += 1
+
+    if close:
+        if quote is not None:
+            del out[string_starts.pop():]
+        while out and out[-1].isspace():
+            out.pop()
+        # A key whose value was cut off goes too
+        if out and out[-1] == ":" and string_starts:
+            del out[string_starts.pop():]
+        # Drop a dangling comma left by the truncation
+        while out and (out[-1].isspace() or out[-1] == ","):
+            out.pop()
+        out.extend(reversed(stack))
+    return "".join(out)
+
+
+def loads_tolerant(text: str, close: bool = False) -> Any:
+    """Parse JSON, repairing common defects if the strict parse fails."""
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        return json.loads(repair_json(text, close=close), strict=False)
+
+
+def extract_json_object(text: str) -> Any:
+    """
+    Parse the first JSON object found anywhere in a complete model reply.
+
+    Raises:
+        ValueError: If no object can be recovered
+    """
+    extractor = JsonObjectExtractor()
+    for candidate in extractor.feed(text):
+        try:
+            return loads_tolerant(candidate)
+        except ValueError:
+            continue
+    pending = extractor.pending()
+    if pending is not None:
+        return loads_tolerant(pending, close=True)
+    raise ValueError("No JSON object found in model output")
@@ -0,0 +1,286 @@
+"""
+LLM backend selection.
+
+LLM_BACKEND picks the chat model every prompt chain is bound to:
+
+- "groq": the Groq API
+- "local": the same client pointed at a local stand-in server
+  (see app.utils.llm_standin) for offline load tests
+- "record": the Groq client, saving every response as a cassette
+- "replay": answers only from recorded cassettes, without network access
+
+Every backend that reaches a server goes through the upstream guard
+(see app.utils.upstream_guard).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import weakref
+from typing import Any, AsyncIterator, Dict, Iterator, List, Mapping, Optional
+
+import httpx
+from pydantic import SecretStr
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_groq import ChatGroq
+
+from app.utils.upstream_guard import GuardedChatModel, create_upstream_guard
+
+LLM_BACKENDS = ("groq", "local", "record", "replay")
+
+# Configuration warnings already printed by this process
+_warned = set()
+
+
+class LoopLocalAsyncClient(httpx.AsyncClient):
+    """
+    httpx.AsyncClient that keeps a separate connection pool per event loop.
+
+    Flask runs every async view on a fresh event loop, so a single shared
+    AsyncClient would try to reuse keep-alive connections that belong to a
+    loop that has already been closed. Requests are delegated to a client
+    owned by the running loop; clients of finished loops are dropped with them.
+    """
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._client_kwargs = kwargs
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._loop_lock = threading.Lock()
+
+    def _loop_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._loop_lock:
+            client = self._loop_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(**self._client_kwargs)
+                self._loop_clients[loop] = client
+            return client
+
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        return await self._loop_client().send(request, **kwargs)
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when no cassette matches a request."""
+
+
+class MissingApiKeyError(RuntimeError):
+    """Raised when a backend that calls Groq is used without GROQ_API_KEY."""
+
+
+class UnconfiguredChatModel(BaseChatModel):
+    """
+    Stand-in for a backend that cannot be built, failing every call with the reason.
+
+    The app still starts, so migrations and other CLI commands work without
+    an API key, but no request silently reaches Groq unauthenticated.
+    """
+
+    reason: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "unconfigured"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        raise MissingApiKeyError(self.reason)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        raise MissingApiKeyError(self.reason)
+
+
+class CassetteStore:
+    """Recorded responses stored as one JSON file per request hash."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, messages: List[BaseMessage]) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": [[m.type, m.content] for m in messages]},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def load(self, key: str) -> Optional[str]:
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                return json.load(f)["content"]
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, messages: List[BaseMessage], content: str) -> None:
+        record = {
+            "messages": [{"type": m.type, "content": m.content} for m in messages],
+            "content": content,
+        }
+        tmp_path = f"{self._file(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self._file(key))
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    Chat model that records responses from an inner model or replays them.
+
+    In "record" mode every call goes to the inner model and its reply is
+    stored; in "replay" mode replies come only from the cassette store.
+    """
+
+    inner: Optional[BaseChatModel] = None
+    store: Any
+    mode: str = "replay"
+    model_name: str = "llama3-8b-8192"
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.mode}"
+
+    def _key(self, messages: List[BaseMessage]) -> str:
+        return CassetteStore.key(self.model_name, messages)
+
+    def _replay(self, key: str) -> str:
+        content = self.store.load(key)
+        if content is None:
+            raise CassetteMissError(f"No recorded response for request {key[:12]}")
+        return content
+
+    @staticmethod
+    def _result(content: str) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages)
+        if self.mode == "replay":
+            return self._result(self._replay(key))
+        response = self.inner.invoke(messages, stop=stop, **kwargs)
+        self.store.save(key, messages, response.content)
+        return self._result(response.content)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages)
+        if self.mode == "replay":
+            return self._result(self._replay(key))
+        response = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+        self.store.save(key, messages, response.content)
+        return self._result(response.content)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages)
+        if self.mode == "replay":
+            for token in re.findall(r"\S+\s*|\s+", self._replay(key)):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            return
+        parts = []
+        for chunk in self.inner.stream(messages, stop=stop, **kwargs):
+            parts.append(chunk.content)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk.content))
+        self.store.save(key, messages, "".join(parts))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._key(messages)
+        if self.mode == "replay":
+            for token in re.findall(r"\S+\s*|\s+", self._replay(key)):
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            return
+        parts = []
+        async for chunk in self.inner.astream(messages, stop=stop, **kwargs):
+            parts.append(chunk.content)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk.content))
+        # Only complete streams are recorded
+        self.store.save(key, messages, "".join(parts))
+
+
+def guard_enabled(config: Mapping[str, Any]) -> bool:
+    # os.environ carries strings, Flask config carries the parsed bool
+    return str(config.get("LLM_GUARD_ENABLED", True)).lower() not in ("false", "0", "no")
+
+
+def create_groq_llm(config: Mapping[str, Any], base_url: Optional[str] = None) -> BaseChatModel:
+    """
+    Build a ChatGroq client from config, optionally against another base URL.
+
+    Unless LLM_GUARD_ENABLED is off, the client is wrapped in the upstream
+    guard (rate limits, retries, circuit breaker) and the SDK's own retries
+    are disabled so the guard's policy is the only one in effect.
+    """
+    kwargs: Dict[str, Any] = {
+        "api_key": SecretStr(config.get("GROQ_API_KEY") or "standin"),
+        "model": config.get("LLM_MODEL", "llama3-8b-8192"),
+        "http_async_client": LoopLocalAsyncClient(
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            follow_redirects=True,
+        ),
+    }
+    if base_url:
+        kwargs["base_url"] = base_url
+    if not guard_enabled(config):
+        return ChatGroq(**kwargs)
+
+    return GuardedChatModel(
+        inner=ChatGroq(max_retries=0, **kwargs),
+        guard=create_upstream_guard(config),
+        model_name=kwargs["model"],
+        completion_tokens=int(config.get("LLM_COMPLETION_TOKEN_ESTIMATE", 400)),
+    )
+
+
+def create_llm(config: Mapping[str, Any]) -> BaseChatModel:
+    """
+    Build the chat model selected by LLM_BACKEND.
+
+    Args:
+        config: Flask config (or any mapping with the same keys)
+
+    Returns:
+        A LangChain chat model
+    """
+    backend = config.get("LLM_BACKEND", "groq")
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {backend}")
+
+    if backend in ("groq", "record") and not config.get("GROQ_API_KEY"):
+        reason = f"GROQ_API_KEY is not set; it is required by the {backend} LLM backend"
+        if reason not in _warned:
+            _warned.add(reason)
+            print(f"WARNING: {reason}, LLM calls will fail", file=sys.stderr)
+        return UnconfiguredChatModel(reason=reason)
+
+    if backend == "local":
+        return create_groq_llm(config, config.get("LLM_LOCAL_BASE_URL", "http://127.0.0.1:8089"))
+
+    if backend in ("record", "replay"):
+        store = CassetteStore(config.get("LLM_CASSETTE_PATH", "cassettes"))
+        inner = create_groq_llm(config) if backend == "record" else None
+        return CassetteChatModel(
+            inner=inner,
+            store=store,
+            mode=backend,
+            model_name=config.get("LLM_MODEL", "llama3-8b-8192"),
+        )
+
+    return create_groq_llm(config)
@@ -0,0 +1,304 @@
+"""
+Content-addressed cache for LLM responses.
+
+Responses are keyed on a canonical hash of (template version, model, inputs).
+The first tier is a bounded in-process LRU with TTL; the second tier is a
+SQLite file shared by every gunicorn worker on the host.
+"""
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.utils.semantic_cache import get_semantic_cache
+from app.utils.settings import get_setting
+
+# Sentinel returned on cache misses, since None can be a cached value
+MISS = object()
+
+
+def make_cache_key(template_version: str, model: str, inputs: Dict[str, Any]) -> str:
+    """
+    Build a canonical cache key.
+
+    Args:
+        template_version: Version or content hash of the prompt template
+        model: Model name the response came from
+        inputs: Prompt input variables
+
+    Returns:
+        A hex SHA-256 digest of the canonical JSON encoding
+    """
+    payload = json.dumps(
+        {"template": template_version, "model": model, "inputs": inputs},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """Bounded in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max(1, int(max_entries))
+        # key -> (expires_at, scope, value), least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            expires_at, _, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float, scope: Optional[str] = None) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, scope, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_scope(self, scope: str) -> int:
+        with self._lock:
+            keys = [key for key, (_, entry_scope, _) in self._entries.items() if entry_scope == scope]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteTier:
+    """Cache tier stored in a SQLite file shared by all workers on the host."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, max_entries: int = 20000):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " scope TEXT,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_scope ON llm_cache (scope)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_created ON llm_cache (created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        """Return (value, scope, remaining ttl) or MISS."""
+        row = self._connect().execute(
+            "SELECT value, scope, expires_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return MISS
+        remaining = row[2] - time.time()
+        if remaining <= 0:
+            return MISS
+        return json.loads(row[0]), row[1], remaining
+
+    def set(self, key: str, value: Any, ttl: float, scope: Optional[str] = None) -> None:
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, scope, value, expires_at, created_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, scope, json.dumps(value), now + ttl, now),
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        """Drop expired rows and trim the oldest rows beyond max_entries."""
+        conn = self._connect()
+        conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def invalidate_scope(self, scope: str) -> int:
+        cursor = self._connect().execute("DELETE FROM llm_cache WHERE scope = ?", (scope,))
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM llm_cache")
+
+
+class LLMCache:
+    """Two-tier LLM response cache with hit/miss counters."""
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024, shared_path: Optional[str] = None,
+                 shared_max_entries: int = 20000, memory_ttl: float = 300):
+        self.ttl = ttl
+        # Invalidations only reach this worker's memory tier, so entries there
+        # live at most memory_ttl before being re-read from the shared tier
+        self.memory_ttl = min(ttl, memory_ttl)
+        self.memory = MemoryTier(max_entries)
+        self.shared = None
+        if shared_path:
+            try:
+                self.shared = SQLiteTier(shared_path, shared_max_entries)
+            except sqlite3.Error as e:
+                print(f"LLM cache: shared tier disabled ({str(e)})", file=sys.stderr)
+        self._stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "sets": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> Any:
+        """Look a key up in memory, then in the shared tier; returns MISS if absent."""
+        value = self.memory.get(key)
+        if value is not MISS:
+            self._count("memory_hits")
+            # Callers may mutate the result, so never hand out the cached object
+            return copy.deepcopy(value)
+
+        if self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except sqlite3.Error as e:
+                self._count("errors")
+                print(f"LLM cache read failed: {str(e)}", file=sys.stderr)
+                entry = MISS
+            if entry is not MISS:
+                value, scope, remaining = entry
+                self._count("shared_hits")
+                self.memory.set(key, copy.deepcopy(value), min(remaining, self.memory_ttl), scope)
+                return value
+
+        self._count("misses")
+        return MISS
+
+    def set(self, key: str, value: Any, scope: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        """
+        Store a value in both tiers.
+
+        Args:
+            key: Cache key from make_cache_key
+            value: JSON-serializable response
+            scope: Owner of the entry (usually the user id) for invalidation
+            ttl: Lifetime in seconds, defaults to the cache TTL
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, copy.deepcopy(value), min(ttl, self.memory_ttl), scope)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, ttl, scope)
+            except sqlite3.Error as e:
+                self._count("errors")
+                print(f"LLM cache write failed: {str(e)}", file=sys.stderr)
+        self._count("sets")
+
+    def invalidate_scope(self, scope: str) -> int:
+        """Remove every entry owned by a scope from both tiers."""
+        removed = self.memory.invalidate_scope(scope)
+        if self.shared is not None:
+            try:
+                removed += self.shared.invalidate_scope(scope)
+            except sqlite3.Error as e:
+                self._count("errors")
+                print(f"LLM cache invalidation failed: {str(e)}", file=sys.stderr)
+        return removed
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for this worker."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["shared_enabled"] = self.shared is not None
+        return stats
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Return the process-wide LLM cache, or None when caching is disabled."""
+    global _cache
+    if not get_setting("LLM_CACHE_ENABLED", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache(
+                    ttl=float(get_setting("LLM_CACHE_TTL", 3600)),
+                    max_entries=int(get_setting("LLM_CACHE_MAX_ENTRIES", 1024)),
+                    shared_path=get_setting(
+                        "LLM_CACHE_PATH",
+                        os.path.join(tempfile.gettempdir(), "harmonia_llm_cache.sqlite3"),
+                    ),
+                    shared_max_entries=int(get_setting("LLM_CACHE_SHARED_MAX_ENTRIES", 20000)),
+                    memory_ttl=float(get_setting("LLM_CACHE_MEMORY_TTL", 300)),
+                )
+    return _cache
+
+
+def invalidate_user_cache(user_id: str) -> int:
+    """
+    Drop every cached LLM response generated for a user.
+
+    Covers the exact-match tiers and the semantic answer cache.
+
+    Args:
+        user_id: Id of the user whose entries should be removed
+
+    Returns:
+        Number of entries removed across tiers
+    """
+    if not user_id:
+        return 0
+    cache = get_llm_cache()
+    semantic_cache = get_semantic_cache()
+    removed = cache.invalidate_scope(str(user_id)) if cache is not None else 0
+    if semantic_cache is not None:
+        removed += semantic_cache.invalidate_scope(str(user_id))
+    return removed
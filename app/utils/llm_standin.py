@@ -0,0 +1,233 @@
+"""
+Local stand-in for the Groq/OpenAI chat completions API.
+
+Serves POST .../chat/completions (streaming and non-streaming) with
+configurable latency, jitter, error rate and token rate, so the app can be
+load-tested and benchmarked without calling the real provider.
+
+Run it with:
+    python -m app.utils.llm_standin --port 8089 --latency 0.4 --jitter 0.1
+
+and point the app at it with LLM_BACKEND=local and LLM_LOCAL_BASE_URL.
+"""
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Request markers of the batched day meal prompt ("[r1] Day: Monday")
+BATCH_REQUEST = re.compile(r"^\[(r\d+)\] Day:", re.MULTILINE)
+
+BREAKFASTS = [
+    "Overnight oats with chia seeds, berries and a spoon of almond butter",
+    "Spinach and mushroom omelette with whole grain toast",
+    "Greek yogurt parfait with walnuts, flaxseed and sliced banana",
+    "Vegetable poha with peanuts and a glass of orange juice",
+]
+LUNCHES = [
+    "Quinoa salad with chickpeas, cucumber, tomato and lemon-tahini dressing",
+    "Brown rice with rajma curry and a side of sauteed spinach",
+    "Grilled chicken wrap with hummus and mixed greens",
+    "Lentil soup with a whole wheat roti and carrot salad",
+]
+DINNERS = [
+    "Baked salmon with roasted sweet potato and steamed broccoli",
+    "Tofu and vegetable stir-fry with buckwheat noodles",
+    "Palak paneer with millet roti and cucumber raita",
+    "Turkey and bean chili with a side of avocado",
+]
+CHAT_REPLY = (
+    "Thanks for sharing that. Staying hydrated, eating iron-rich foods such as "
+    "spinach, lentils and seeds, and gentle exercise like walking or yoga can help. "
+    "How long have you been noticing this? If you have any serious concerns, "
+    "please consult a doctor."
+)
+
+
+def fake_day(rng: random.Random) -> Dict[str, str]:
+    return {
+        "Breakfast": rng.choice(BREAKFASTS),
+        "Lunch": rng.choice(LUNCHES),
+        "Dinner": rng.choice(DINNERS),
+    }
+
+
+def fake_completion(prompt: str, rng: random.Random) -> str:
+    """Produce a plausible reply shaped like what the prompt asks for."""
+    if "JSON" not in prompt:
+        return CHAT_REPLY
+    request_ids = BATCH_REQUEST.findall(prompt)
+    if request_ids:
+        return json.dumps({request_id: fake_day(rng) for request_id in request_ids})
+    if "7-day" in prompt:
+        return json.dumps({day: fake_day(rng) for day in DAYS})
+    days_requested = [day for day in DAYS if re.search(rf'"{day}"', prompt)]
+    if len(days_requested) > 1:
+        return json.dumps({day: fake_day(rng) for day in days_requested})
+    return json.dumps(fake_day(rng))
+
+
+def split_tokens(text: str) -> List[str]:
+    """Split text into word-sized chunks that rejoin to the original."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class StandinConfig:
+    """Behaviour knobs for the stand-in server."""
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.1, error_rate: float = 0.0,
+                 tokens_per_second: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.rng = random.Random(seed)
+
+
+def make_handler(config: StandinConfig):
+    """Build a request handler class bound to a config."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "standin", "object": "model"}]})
+            else:
+                self._send_json(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Not found"}})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+
+            delay = max(0.0, config.latency + config.rng.uniform(-config.jitter, config.jitter))
+            time.sleep(delay)
+
+            if config.rng.random() < config.error_rate:
+                status = config.rng.choice([429, 500, 503])
+                self._send_json(status, {"error": {"message": "Simulated upstream error", "type": "standin_error"}})
+                return
+
+            messages = body.get("messages") or []
+            prompt = "\n".join(str(m.get("content", "")) for m in messages)
+            text = fake_completion(prompt, config.rng)
+            model = body.get("model", "standin")
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            usage = {
+                "prompt_tokens": len(prompt) // 4 + 1,
+                "completion_tokens": len(text) // 4 + 1,
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+            if body.get("stream"):
+                self._stream(completion_id, model, text, usage)
+                return
+
+            if config.tokens_per_second > 0:
+                time.sleep(usage["completion_tokens"] / config.tokens_per_second)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        def _stream(self, completion_id: str, model: str, text: str, usage: Dict[str, int]) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def send(delta: Dict[str, Any], finish_reason: Optional[str] = None, extra: Optional[Dict] = None):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                if extra:
+                    chunk.update(extra)
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                send({"role": "assistant", "content": ""})
+                tokens = split_tokens(text)
+                for token in tokens:
+                    if config.tokens_per_second > 0:
+                        # Word chunks stand for roughly 1.3 tokens
+                        time.sleep(1.3 / config.tokens_per_second)
+                    send({"content": token})
+                send({}, finish_reason="stop", extra={"x_groq": {"usage": usage}})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Client cancelled the stream
+                pass
+
+    return Handler
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8089, **kwargs) -> ThreadingHTTPServer:
+    """Create (but do not start) a stand-in server."""
+    server = ThreadingHTTPServer((host, port), make_handler(StandinConfig(**kwargs)))
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Groq chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds before the first byte")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Uniform +/- seconds added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429/5xx")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Generation speed, 0 for instant")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port,
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        tokens_per_second=args.tokens_per_second, seed=args.seed,
+    )
+    print(f"LLM stand-in listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Local meal catalog and vectorized scorer.
+
+An LLM-free meal plan generator for common profiles. Meals come from a JSON
+catalog (app/data/meal_catalog.json) with diet type, allergens, nutrients,
+iron/folate/low-GI flags and region. The catalog is loaded once into NumPy
+arrays, so a week is scored and assembled in well under a millisecond.
+"""
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.profile import is_yes
+from app.utils.settings import get_setting
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "meal_catalog.json")
+
+WEEK_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+SLOTS = {"breakfast": "Breakfast", "lunch": "Lunch", "dinner": "Dinner"}
+
+# Diets from most to least restrictive; a profile allows its own level and below
+DIET_LEVELS = ["vegan", "vegetarian", "eggetarian", "pescatarian", "non_vegetarian"]
+
+# Allergen -> words that mention it in free-text medical history or medications
+ALLERGEN_WORDS = {
+    "peanut": ("peanut", "groundnut"),
+    "tree_nuts": ("tree nut", "almond", "walnut", "cashew", "nut allergy"),
+    "dairy": ("dairy", "lactose", "milk"),
+    "gluten": ("gluten", "celiac", "coeliac", "wheat"),
+    "egg": ("egg",),
+    "soy": ("soy", "soya"),
+    "fish": ("fish",),
+    "shellfish": ("shellfish", "prawn", "shrimp", "crab"),
+    "sesame": ("sesame",),
+}
+
+# dietType values that include meat; checked before and after the vegetarian words
+NON_VEG_DIET = re.compile(r"\bnon[\s-]*veg")
+MEAT_DIET = re.compile(
+    r"\b(omnivor\w*|meat|chicken|carnivor\w*|keto|paleo|flexitarian|mixed|anything|everything|none|"
+    r"no restrictions?|regular|normal)\b"
+)
+
+# Mentions only count as an allergy or intolerance with one of these in the same sentence
+ALLERGY_CONTEXT = re.compile(r"\b(allerg\w*|intoleran\w*|celiac|coeliac|anaphyla\w*|sensitiv\w*|avoid\w*)\b")
+# A restriction written as "<food>-free" is its own context
+FREE_AFTER = re.compile(r"^[\s-]*free\b")
+# Negations shortly before a mention ("no egg allergy", "not allergic to eggs")
+ALLERGY_NEGATION = re.compile(r"\b(no|not|never|without|negative|denies)\b(?:\W+\w+){0,3}\W*$")
+TOLERANT_AFTER = re.compile(r"^\W*(tolerant|tolerates?|tolerated|is fine|ok)\b")
+# "No allergies except peanuts": the exception is not negated
+EXCEPTION = re.compile(r"\b(?:except|apart from|other than|besides)\b")
+SENTENCE_SPLIT = re.compile(r"[.;\n!?]|\bbut\b|\bhowever\b|\balthough\b")
+# Supplements and remedies named after a food they do not expose the user to
+SUPPLEMENT_PHRASES = re.compile(
+    r"\b(omega[\s-]*3 fish oil|fish oil|cod liver oil|krill oil|milk thistle|soy isoflavones?|eggshell calcium)\b"
+)
+
+# Scored features, in column order
+FEATURES = ("iron_rich", "folate_rich", "low_gi", "protein", "fiber", "sugar", "calories")
+
+
+def diet_level(diet_type: Optional[str]) -> int:
+    """
+    Map a free-text dietType to the most permissive allowed DIET_LEVELS index.
+
+    Only diets that clearly include meat map to non_vegetarian; anything
+    unrecognised ("Jain", "sattvic", a typo) is treated as vegetarian, so an
+    unknown restriction is never served meat or eggs.
+    """
+    text = (diet_type or "").lower()
+    if "vegan" in text:
+        return DIET_LEVELS.index("vegan")
+    if NON_VEG_DIET.search(text):
+        return DIET_LEVELS.index("non_vegetarian")
+    if "egg" in text:
+        return DIET_LEVELS.index("eggetarian")
+    if "pesc" in text or "fish" in text:
+        return DIET_LEVELS.index("pescatarian")
+    if "veg" in text:
+        return DIET_LEVELS.index("vegetarian")
+    if MEAT_DIET.search(text):
+        return DIET_LEVELS.index("non_vegetarian")
+    return DIET_LEVELS.index("vegetarian")
+
+
+def is_reported(sentence: str, start: int, end: int, has_context: bool) -> bool:
+    """Whether the food mentioned at sentence[start:end] is reported as an allergy or intolerance."""
+    # Only the comma-separated part around the mention can negate it
+    part_start = sentence.rfind(",", 0, start) + 1
+    part_end = sentence.find(",", end)
+    before = EXCEPTION.split(sentence[part_start:start])[-1]
+    after = sentence[end:part_end if part_end != -1 else len(sentence)]
+    if ALLERGY_NEGATION.search(before) or TOLERANT_AFTER.match(after):
+        return False
+    return has_context or bool(FREE_AFTER.match(after))
+
+
+def detect_allergens(*texts: Optional[str]) -> List[str]:
+    """
+    Allergens reported in free text (medical history, medications, preferences).
+
+    A food word only counts with allergy context in the same sentence
+    ("allergic to", "intolerance", "celiac", "avoid", "dairy-free") and not
+    when negated next to it ("no egg allergy", "lactose tolerant").
+    Supplements named after a food ("fish oil", "milk thistle") are ignored.
+    """
+    text = SUPPLEMENT_PHRASES.sub(" ", " ".join(t for t in texts if t).lower())
+    found = set()
+    for sentence in SENTENCE_SPLIT.split(text):
+        has_context = bool(ALLERGY_CONTEXT.search(sentence))
+        for allergen, words in ALLERGEN_WORDS.items():
+            if allergen in found:
+                continue
+            if any(
+                is_reported(sentence, match.start(), match.end(), has_context)
+                for word in words
+                for match in re.finditer(rf"\b{re.escape(word)}(?:s|es)?\b", sentence)
+            ):
+                found.add(allergen)
+    return [allergen for allergen in ALLERGEN_WORDS if allergen in found]
+
+
+def profile_weights(user_details_dict: Dict[str, Any]) -> np.ndarray:
+    """Feature weights for a profile, aligned with FEATURES."""
+    details = user_details_dict or {}
+    weights = dict(iron_rich=0.2, folate_rich=0.2, low_gi=0.2, protein=0.3, fiber=0.3, sugar=-0.2, calories=0.0)
+    if is_yes(details.get("heavyBleeding")):
+        weights["iron_rich"] += 1.0
+    if is_yes(details.get("fatigue")):
+        weights["iron_rich"] += 0.4
+        weights["protein"] += 0.3
+    if is_yes(details.get("pcosDiagnosis")):
+        weights["low_gi"] += 0.8
+        weights["fiber"] += 0.4
+        weights["sugar"] -= 0.6
+    if is_yes(details.get("sugarCravings")):
+        weights["sugar"] -= 0.5
+        weights["protein"] += 0.3
+        weights["fiber"] += 0.2
+    if is_yes(details.get("weightGain")):
+        weights["calories"] -= 0.4
+        weights["fiber"] += 0.2
+    return np.array([weights[name] for name in FEATURES], dtype=np.float32)
+
+
+class MealCatalog:
+    """Meals as NumPy arrays, scored against a profile in one matrix product."""
+
+    def __init__(self, meals: List[Dict[str, Any]]):
+        self.meals = meals
+        self.names = [meal["name"] for meal in meals]
+        self.slots = np.array([list(SLOTS).index(meal["slot"]) for meal in meals])
+        self.diets = np.array([DIET_LEVELS.index(meal["diet"]) for meal in meals])
+        self.regions = np.array([meal.get("region", "global") for meal in meals])
+        self.allergens = np.array(
+            [[allergen in meal.get("allergens", ()) for allergen in ALLERGEN_WORDS] for meal in meals],
+            dtype=bool,
+        ).reshape(len(meals), len(ALLERGEN_WORDS))
+
+        raw = np.array([
+            [
+                meal.get("iron_rich", False), meal.get("folate_rich", False), meal.get("low_gi", False),
+                meal["nutrients"]["protein_g"], meal["nutrients"]["fiber_g"],
+                meal["nutrients"]["sugar_g"], meal["nutrients"]["calories"],
+            ]
+            for meal in meals
+        ], dtype=np.float32).reshape(len(meals), len(FEATURES))
+        # Scale every column to [0, 1] so weights are comparable
+        span = raw.max(axis=0) - raw.min(axis=0)
+        self.features = (raw - raw.min(axis=0)) / np.where(span > 0, span, 1)
+
+    @classmethod
+    def load(cls, path: str = CATALOG_PATH) -> "MealCatalog":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["meals"])
+
+    def allowed(self, user_details_dict: Dict[str, Any], extra_text: Optional[str] = None) -> np.ndarray:
+        """Mask of meals that fit the profile's diet and detected allergies."""
+        details = user_details_dict or {}
+        mask = self.diets <= diet_level(details.get("dietType"))
+        excluded = detect_allergens(details.get("medicalHistory"), details.get("medications"), extra_text)
+        if excluded:
+            columns = [list(ALLERGEN_WORDS).index(allergen) for allergen in excluded]
+            mask &= ~self.allergens[:, columns].any(axis=1)
+        return mask
+
+    def score(self, user_details_dict: Dict[str, Any], region: Optional[str] = None) -> np.ndarray:
+        """Score every meal for a profile; higher is a better fit."""
+        scores = self.features @ profile_weights(user_details_dict)
+        if region:
+            scores = scores + 0.3 * (self.regions == region.lower())
+        return scores
+
+    def build_week(self, user_details_dict: Dict[str, Any], region: Optional[str] = None,
+                   extra_text: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+        """
+        Assemble a week of meals for a profile.
+
+        Each slot takes its seven best-scoring allowed meals, cycling through
+        them when fewer than seven fit. Top meals are spread across the week
+        instead of front-loaded on Monday.
+
+        Args:
+            user_details_dict: Dictionary containing user health data
+            region: Optional cuisine region to favour
+            extra_text: Optional free text to scan for allergies
+
+        Returns:
+            A MealPlan-shaped dictionary keyed by day name
+
+        Raises:
+            ValueError: If a slot has no meal that fits the profile
+        """
+        scores = np.where(self.allowed(user_details_dict, extra_text), self.score(user_details_dict, region), -np.inf)
+        week = {day: {} for day in WEEK_DAYS}
+        for slot_index, label in enumerate(SLOTS.values()):
+            slot_scores = np.where(self.slots == slot_index, scores, -np.inf)
+            ranked = np.argsort(-slot_scores, kind="stable")
+            ranked = ranked[np.isfinite(slot_scores[ranked])][:len(WEEK_DAYS)]
+            if len(ranked) == 0:
+                raise ValueError(f"No {label.lower()} in the catalog fits this profile")
+            # Offset each slot so the best breakfast, lunch and dinner land on different days
+            for day_index, day in enumerate(WEEK_DAYS):
+                week[day][label] = self.names[ranked[(day_index + slot_index * 2) % len(ranked)]]
+        return week
+
+
+_catalog: Optional[MealCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_meal_catalog() -> MealCatalog:
+    """Return the process-wide meal catalog, loading it on first use."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = MealCatalog.load(get_setting("MEAL_CATALOG_PATH") or CATALOG_PATH)
+    return _catalog
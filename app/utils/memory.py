@@ -0,0 +1,222 @@
+"""
+Token-bounded conversation memory.
+
+Each chat request reads the chat's rolling summary plus the most recent
+messages that fit in a token budget. Messages that fall out of the window are
+folded into the summary incrementally, so prompts stay bounded no matter how
+long the conversation gets. Folding runs on a background thread after the
+response, so the summary call never delays a chat turn.
+"""
+import asyncio
+import sys
+import threading
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app.extensions import db
+from app.models.chat import Chat, Message, SenderType
+from app.utils.model_router import invoke_prompt
+from app.utils.prompts import estimate_tokens, registry as prompts
+from app.utils.settings import get_setting
+
+
+# Detached snapshot of a Message, safe to use after the session commits or closes
+MemoryMessage = namedtuple("MemoryMessage", ["id", "sent_by", "content", "created_at"])
+
+
+class ConversationMemory:
+    """A chat's summary, the recent window and the messages waiting to be folded."""
+
+    def __init__(self, summary: Optional[str], window: List[MemoryMessage], overflow: List[MemoryMessage]):
+        self.summary = summary
+        self.window = window
+        self.overflow = overflow
+
+    @property
+    def overflow_tokens(self) -> int:
+        return sum(estimate_tokens(message.content) for message in self.overflow)
+
+    def is_empty(self) -> bool:
+        return not self.summary and not self.window and not self.overflow
+
+    def unfolded(self, token_budget: Optional[int] = None) -> List[MemoryMessage]:
+        """
+        The newest overflow messages that fit in a token budget, oldest first.
+
+        Overflow is only folded once it reaches CHAT_MEMORY_SUMMARY_TRIGGER
+        tokens, so until then these turns are in neither the summary nor the
+        window and are rendered alongside the window instead.
+
+        Args:
+            token_budget: Tokens to spend on overflow, defaults to CHAT_MEMORY_SUMMARY_TRIGGER
+        """
+        if token_budget is None:
+            token_budget = int(get_setting("CHAT_MEMORY_SUMMARY_TRIGGER", 400))
+        kept, used = [], 0
+        for message in reversed(self.overflow):
+            tokens = estimate_tokens(message.content)
+            if used + tokens > token_budget:
+                break
+            kept.append(message)
+            used += tokens
+        return list(reversed(kept))
+
+    def render(self) -> str:
+        """Render the memory as prompt text; empty when there is no history."""
+        if self.is_empty():
+            return ""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier messages: {self.summary}")
+        recent = self.unfolded() + self.window
+        if recent:
+            parts.append("Recent messages:")
+            parts.extend(format_message(message) for message in recent)
+        return "\n".join(parts)
+
+
+def format_message(message: MemoryMessage) -> str:
+    speaker = "User" if message.sent_by == SenderType.USER else "Assistant"
+    return f"{speaker}: {message.content}"
+
+
+def load_memory(chat: Chat, token_budget: Optional[int] = None) -> ConversationMemory:
+    """
+    Load the summary and the most recent messages that fit in a token budget.
+
+    Only messages after the summary cursor (created_at, id) are read, and
+    folding keeps that set small, so this never scans the full history of a
+    long chat. The id breaks ties between messages with the same timestamp.
+
+    Args:
+        chat: The chat to load memory for
+        token_budget: Token budget for the recent window, defaults to CHAT_MEMORY_TOKEN_BUDGET
+
+    Returns:
+        The chat's conversation memory
+    """
+    if token_budget is None:
+        token_budget = int(get_setting("CHAT_MEMORY_TOKEN_BUDGET", 1200))
+
+    query = Message.query.filter(Message.chat_id == chat.id)
+    if chat.summary_until is not None:
+        after_cursor = Message.created_at > chat.summary_until
+        if chat.summary_until_id is not None:
+            after_cursor = or_(after_cursor, and_(Message.created_at == chat.summary_until,
+                                                  Message.id > chat.summary_until_id))
+        query = query.filter(after_cursor)
+    newest_first = [
+        MemoryMessage(message_id, sent_by, content or "", created_at)
+        for message_id, sent_by, content, created_at in query.with_entities(
+            Message.id, Message.sent_by, Message.content, Message.created_at
+        ).order_by(Message.created_at.desc(), Message.id.desc())
+    ]
+
+    window, used = [], 0
+    for index, message in enumerate(newest_first):
+        tokens = estimate_tokens(message.content)
+        if used + tokens > token_budget:
+            overflow = list(reversed(newest_first[index:]))
+            return ConversationMemory(chat.summary, list(reversed(window)), overflow)
+        window.append(message)
+        used += tokens
+    return ConversationMemory(chat.summary, list(reversed(window)), [])
+
+
+async def summarize(summary: Optional[str], messages: List[MemoryMessage], max_words: Optional[int] = None) -> str:
+    """
+    Fold messages into a running summary with one LLM call.
+
+    Args:
+        summary: The current summary, if any
+        messages: Messages to fold in, oldest first
+        max_words: Length limit for the new summary, defaults to CHAT_SUMMARY_MAX_WORDS
+
+    Returns:
+        The updated summary
+    """
+    if max_words is None:
+        max_words = int(get_setting("CHAT_SUMMARY_MAX_WORDS", 150))
+    response = await invoke_prompt(prompts.get("chat_summary"), {
+        "summary": summary or "None yet.",
+        "messages": "\n".join(format_message(message) for message in messages),
+        "max_words": max_words,
+    })
+    return response.content.strip()
+
+
+async def fold_overflow(chat: Chat, memory: ConversationMemory) -> bool:
+    """
+    Fold the messages that fell out of the window into the chat's summary.
+
+    Folding waits until the overflow reaches CHAT_MEMORY_SUMMARY_TRIGGER tokens
+    so the summary call is amortized over several turns. The caller commits.
+
+    Args:
+        chat: The chat whose summary is updated
+        memory: Memory loaded for the current request
+
+    Returns:
+        True if the summary was updated
+    """
+    trigger = int(get_setting("CHAT_MEMORY_SUMMARY_TRIGGER", 400))
+    if not memory.overflow or memory.overflow_tokens < trigger:
+        return False
+    try:
+        chat.summary = await summarize(memory.summary, memory.overflow)
+        chat.summary_until = memory.overflow[-1].created_at
+        chat.summary_until_id = memory.overflow[-1].id
+        return True
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"ERROR folding chat summary: {str(e)}", file=sys.stderr)
+        print(f"Traceback: {error_traceback}", file=sys.stderr)
+        return False
+
+
+# One fold at a time per process; chats already queued are not queued twice
+_fold_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-memory-fold")
+_pending_folds = set()
+_pending_lock = threading.Lock()
+
+
+def schedule_fold(chat_id: str) -> bool:
+    """
+    Fold a chat's overflow into its summary in the background.
+
+    The chat and its memory are re-read on the worker thread, in its own app
+    context, so the fold sees the messages the request just committed.
+
+    Args:
+        chat_id: Id of the chat
+
+    Returns:
+        True if a fold was queued, False if one is already pending
+    """
+    app = current_app._get_current_object()
+    with _pending_lock:
+        if chat_id in _pending_folds:
+            return False
+        _pending_folds.add(chat_id)
+    _fold_executor.submit(_run_fold, app, chat_id)
+    return True
+
+
+def _run_fold(app, chat_id: str) -> None:
+    try:
+        with app.app_context():
+            chat = Chat.query.filter_by(id=chat_id).first()
+            if chat is not None and asyncio.run(fold_overflow(chat, load_memory(chat))):
+                db.session.commit()
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        print(f"ERROR folding chat summary in the background: {str(e)}", file=sys.stderr)
+        print(f"Traceback: {error_traceback}", file=sys.stderr)
+    finally:
+        with _pending_lock:
+            _pending_folds.discard(chat_id)
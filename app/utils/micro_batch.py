@@ -0,0 +1,151 @@
+"""
+Cross-request micro-batching of small LLM calls.
+
+Under load many tiny completions start at once, each paying the request
+overhead and the prompt preamble. A MicroBatcher collects items submitted
+within a short window (or until a batch is full) and runs them as one
+batched call, then hands every caller its own result.
+
+Flask runs every async view on its own event loop and thread, so items are
+handed back through thread-safe concurrent.futures.Future objects. The first
+caller of a batch (the leader) waits for the window to close and runs the
+batch on its own loop. Callers whose item failed, or whose batch never ran
+because the leader went away, get BatchItemError and are expected to fall
+back to an individual call.
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class BatchItemError(Exception):
+    """Raised to a caller whose item could not be answered by its batch."""
+
+
+class _Batch:
+    """Items collected in one batching window."""
+
+    def __init__(self):
+        self.items: List[Tuple[Any, concurrent.futures.Future]] = []
+        self.full: concurrent.futures.Future = concurrent.futures.Future()
+
+
+class MicroBatcher:
+    """
+    Collect concurrent submissions into batched calls.
+
+    Args:
+        run_batch: Coroutine function taking a list of items and returning one
+            result per item, in order; an Exception in place of a result fails
+            only that item
+        max_items: Largest batch; a full batch runs immediately
+        max_wait: Seconds the leader waits for more items
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Awaitable[List[Any]]], max_items: int = 7,
+                 max_wait: float = 0.025):
+        self.run_batch = run_batch
+        self.max_items = max(1, int(max_items))
+        self.max_wait = max_wait
+        self._open: Optional[_Batch] = None
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "batched_items": 0, "singles": 0, "item_failures": 0, "batch_failures": 0}
+
+    def configure(self, max_items: int, max_wait: float) -> None:
+        """Change the batch size and window; open batches keep their settings."""
+        with self._lock:
+            self.max_items = max(1, int(max_items))
+            self.max_wait = max_wait
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Add an item to the open batch and wait for its result.
+
+        Args:
+            item: Input of one call
+
+        Returns:
+            The item's result from the batched call
+
+        Raises:
+            BatchItemError: If the item was alone in its window, failed
+                validation or its batch failed; call it individually instead
+        """
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            batch.items.append((item, future))
+            if len(batch.items) >= self.max_items:
+                # Later submissions start a new batch
+                self._open = None
+                if not batch.full.done():
+                    batch.full.set_result(True)
+            max_wait = self.max_wait
+
+        if leader:
+            await self._lead(batch, max_wait)
+        # shield: a caller going away must not cancel the shared batch
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def _lead(self, batch: _Batch, max_wait: float) -> None:
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(batch.full)), max_wait)
+            except asyncio.TimeoutError:
+                pass
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+                items = list(batch.items)
+
+            if len(items) == 1:
+                self._count("singles")
+                self._fail(items, BatchItemError("No other requests to batch with"))
+                return
+
+            self._count("batches")
+            self._count("batched_items", len(items))
+            try:
+                results = await self.run_batch([item for item, _ in items])
+            except Exception as e:
+                self._count("batch_failures")
+                self._fail(items, BatchItemError(f"Batched call failed: {str(e)}"))
+                return
+
+            for (_, future), result in zip(items, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self._count("item_failures")
+                    future.set_exception(BatchItemError(str(result)))
+                else:
+                    future.set_result(result)
+            self._fail(items, BatchItemError("Batched call returned too few results"))
+        finally:
+            # The leader was cancelled or failed: release everyone still waiting
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._fail(batch.items, BatchItemError("Batch was abandoned by its leader"))
+
+    @staticmethod
+    def _fail(items: List[Tuple[Any, concurrent.futures.Future]], error: BatchItemError) -> None:
+        for _, future in items:
+            if not future.done():
+                future.set_exception(error)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mean_batch_size"] = stats["batched_items"] / stats["batches"] if stats["batches"] else 0.0
+        stats["max_items"] = self.max_items
+        stats["max_wait_ms"] = self.max_wait * 1000
+        return stats
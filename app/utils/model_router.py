@@ -0,0 +1,352 @@
+"""
+Cost and latency tiered model routing.
+
+Every prompt call is routed to a model tier picked from cheap features of
+the call: the prompt it renders, the length and medical complexity of the
+user's text, profile flags such as a PCOS diagnosis or medications, and the
+latency recently observed on each tier. Short chat turns and meal prompts
+stay on the fast model; only complex medical questions pay for the large one.
+
+Each tier has its own process-wide concurrency limit. A tier that fails,
+or has no free slot within MODEL_TIER_QUEUE_TIMEOUT, hands the call over to
+the next tier. The fast tier always uses the chains bound in the prompt
+registry, so rebinding the registry rebinds the fast tier too.
+"""
+import re
+import sys
+import threading
+import time
+from collections import ChainMap
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+from app.utils.concurrency import ConcurrencyLimiter
+from app.utils.deadline import DeadlineExceeded, current_budget, latency
+from app.utils.llm_backends import create_llm
+from app.utils.profile import is_yes
+from app.utils.prompts import RegisteredPrompt
+
+FAST = "fast"
+LARGE = "large"
+
+# Terms that suggest a question needs clinical reasoning rather than general advice
+MEDICAL_TERMS = re.compile(
+    r"\b(medications?|medicines?|dos(e|age)|side effects?|interactions?|diagnos\w*|endometriosis|fibroids?|"
+    r"pcos|pcod|thyroid|insulin|metformin|contracepti\w*|birth control|hormon\w*|infertil\w*|fertility|"
+    r"pregnan\w*|miscarriage|clots?|an(a)?emi\w*|cysts?|surgery|ovulat\w*|amenorrh\w*|menopaus\w*|"
+    r"blood tests?|lab results?|supplements?)\b"
+)
+# Phrasings that ask for an explanation or a decision rather than a fact
+REASONING_TERMS = re.compile(r"\b(why|explain|difference between|compare|should i|is it safe|could it be|what causes)\b")
+
+
+def complexity(text: str, user_details_dict: Optional[Dict[str, Any]] = None) -> Tuple[float, List[str]]:
+    """
+    Score how much a message would benefit from the large model.
+
+    Args:
+        text: The user's message
+        user_details_dict: Dictionary containing user health data
+
+    Returns:
+        (score, reasons) where each reason names a feature that added to the score
+    """
+    lowered = (text or "").lower()
+    score, reasons = 0.0, []
+    words = len(lowered.split())
+    if words > 40:
+        score += 1.0
+        reasons.append("long")
+    medical = len(set(match.group(0) for match in MEDICAL_TERMS.finditer(lowered)))
+    if medical:
+        score += min(medical, 2)
+        reasons.append(f"medical_terms={medical}")
+    if REASONING_TERMS.search(lowered):
+        score += 0.5
+        reasons.append("reasoning")
+    if lowered.count("?") > 1:
+        score += 0.5
+        reasons.append("multiple_questions")
+
+    details = user_details_dict or {}
+    if is_yes(details.get("medications")):
+        score += 1.0
+        reasons.append("medications")
+    if is_yes(details.get("pcosDiagnosis")):
+        score += 0.5
+        reasons.append("pcos")
+    return score, reasons
+
+
+class ModelTier:
+    """One model with its own concurrency limit and latency statistics."""
+
+    def __init__(self, name: str, model_name: str, llm=None, max_concurrency: int = 8):
+        self.name = name
+        self.model_name = model_name
+        # None uses the chains bound in the prompt registry
+        self.llm = llm
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        self._chains: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0, "failovers_out": 0, "queue_timeouts": 0}
+
+    def chain(self, prompt: RegisteredPrompt):
+        if self.llm is None:
+            return prompt.chain
+        with self._lock:
+            chain = self._chains.get(prompt.version)
+            if chain is None:
+                chain = self._chains[prompt.version] = prompt.build_chain(self.llm)
+            return chain
+
+    @property
+    def latency_key(self) -> str:
+        return f"tier:{self.name}"
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        guard = getattr(self.llm, "guard", None)
+        stats.update({
+            "model": self.model_name,
+            "active": self.limiter.active,
+            "max_concurrency": self.limiter.limit,
+            "p90_seconds": latency.percentile(self.latency_key, 90, 5),
+            "guard": guard.stats() if guard is not None else None,
+        })
+        return stats
+
+
+class ModelRouter:
+    """
+    Pick a model tier per call and fail over between tiers.
+
+    Args:
+        tiers: Tiers by name; must contain "fast", may contain "large"
+        threshold: Complexity score at which a call goes to the large tier
+        min_words: Messages shorter than this always stay on the fast tier
+        large_prompts: Prompt names allowed to use the large tier
+        max_large_latency: Recent large-tier p90 latency in seconds above which
+            calls stay on the fast tier
+        queue_timeout: Seconds to wait for a tier's concurrency slot before
+            handing the call to the next tier
+    """
+
+    def __init__(self, tiers: Dict[str, ModelTier], threshold: float = 2.0, min_words: int = 6,
+                 large_prompts: Tuple[str, ...] = ("chat",), max_large_latency: float = 8.0,
+                 queue_timeout: float = 2.0):
+        self.tiers = tiers
+        self.threshold = threshold
+        self.min_words = min_words
+        self.large_prompts = tuple(large_prompts)
+        self.max_large_latency = max_large_latency
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._decisions: Dict[str, int] = {}
+
+    def select(self, prompt: RegisteredPrompt, text: str = "",
+               user_details_dict: Optional[Dict[str, Any]] = None) -> List[ModelTier]:
+        """
+        Order the tiers for a call, preferred tier first.
+
+        Args:
+            prompt: Registered prompt being called
+            text: The user's message, if the call answers one
+            user_details_dict: Dictionary containing user health data
+
+        Returns:
+            Tiers to try in order
+        """
+        large = self.tiers.get(LARGE)
+        preferred, reason = FAST, "default"
+        if large is not None and prompt.name in self.large_prompts:
+            score, reasons = complexity(text, user_details_dict)
+            if len((text or "").split()) < self.min_words:
+                reason = "short"
+            elif score < self.threshold:
+                reason = f"score={score:.1f}"
+            else:
+                preferred, reason = LARGE, f"score={score:.1f} ({', '.join(reasons)})"
+                slow = latency.percentile(large.latency_key, 90, 5)
+                budget = current_budget()
+                remaining = budget.remaining() if budget is not None else None
+                if slow is not None and (slow > self.max_large_latency or (remaining is not None and slow > remaining)):
+                    preferred, reason = FAST, f"large tier slow (p90 {slow:.1f}s)"
+                elif large.limiter.active >= large.limiter.limit:
+                    preferred, reason = FAST, "large tier saturated"
+
+        key = f"{prompt.name}:{preferred}"
+        with self._lock:
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        if prompt.name in self.large_prompts:
+            print(f"Model router: {prompt.name} -> {preferred} ({reason})")
+        return [self.tiers[preferred]] + [tier for name, tier in self.tiers.items() if name != preferred]
+
+    async def _acquire(self, tier: ModelTier, last: bool) -> bool:
+        # The last tier waits as long as the request budget allows
+        if await tier.limiter.acquire(None if last else self.queue_timeout):
+            return True
+        tier.count("queue_timeouts")
+        return False
+
+    def _failover(self, tier: ModelTier, prompt: RegisteredPrompt, error: Exception) -> None:
+        tier.count("failures")
+        tier.count("failovers_out")
+        print(f"Model tier {tier.name} failed for {prompt.name}, failing over: {str(error)}", file=sys.stderr)
+
+    async def ainvoke(self, prompt: RegisteredPrompt, inputs: Dict[str, Any], tiers: List[ModelTier]) -> Any:
+        """Invoke a prompt on the first tier that answers."""
+        error: Optional[Exception] = None
+        for index, tier in enumerate(tiers):
+            last = index == len(tiers) - 1
+            if not await self._acquire(tier, last):
+                continue
+            started = time.monotonic()
+            try:
+                tier.count("calls")
+                result = await tier.chain(prompt).ainvoke(inputs)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                error = e
+                if last:
+                    tier.count("failures")
+                    raise
+                self._failover(tier, prompt, e)
+                continue
+            finally:
+                tier.limiter.release()
+            latency.record(tier.latency_key, time.monotonic() - started)
+            return result
+        raise error or RuntimeError(f"No model tier available for {prompt.name}")
+
+    async def astream(self, prompt: RegisteredPrompt, inputs: Dict[str, Any],
+                      tiers: List[ModelTier]) -> AsyncIterator[Any]:
+        """Stream a prompt from the first tier that starts answering; failover stops at the first chunk."""
+        error: Optional[Exception] = None
+        for index, tier in enumerate(tiers):
+            last = index == len(tiers) - 1
+            if not await self._acquire(tier, last):
+                continue
+            started = time.monotonic()
+            stream = tier.chain(prompt).astream(inputs)
+            try:
+                tier.count("calls")
+                try:
+                    first = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    error = e
+                    if last:
+                        tier.count("failures")
+                        raise
+                    self._failover(tier, prompt, e)
+                    continue
+                latency.record(tier.latency_key, time.monotonic() - started)
+                yield first
+                async for chunk in stream:
+                    yield chunk
+                return
+            finally:
+                await stream.aclose()
+                tier.limiter.release()
+        raise error or RuntimeError(f"No model tier available for {prompt.name}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions = dict(self._decisions)
+        return {
+            "decisions": decisions,
+            "threshold": self.threshold,
+            "tiers": {name: tier.stats() for name, tier in self.tiers.items()},
+        }
+
+
+_router: Optional[ModelRouter] = None
+
+
+def is_enabled(config: Mapping[str, Any], name: str, default: bool) -> bool:
+    # os.environ carries strings, Flask config carries the parsed bool
+    return str(config.get(name, default)).lower() not in ("false", "0", "no")
+
+
+def init_model_router(config: Mapping[str, Any]) -> Optional[ModelRouter]:
+    """
+    Build the process-wide model router from config.
+
+    The fast tier uses the registry's chains (LLM_MODEL); the large tier gets
+    its own client for LLM_LARGE_MODEL, with its own upstream guard quota.
+
+    Args:
+        config: Flask config or any mapping with the MODEL_* and LLM_* keys
+
+    Returns:
+        The router, or None when routing is disabled
+    """
+    global _router
+    if not is_enabled(config, "MODEL_ROUTING_ENABLED", True):
+        _router = None
+        return None
+
+    tiers = {FAST: ModelTier(FAST, config.get("LLM_MODEL", "llama3-8b-8192"),
+                             max_concurrency=int(config.get("MODEL_TIER_FAST_MAX_CONCURRENCY", 16)))}
+    large_model = config.get("LLM_LARGE_MODEL", "llama3-70b-8192")
+    if large_model and large_model != tiers[FAST].model_name:
+        large_config = ChainMap({"LLM_MODEL": large_model, "LLM_GUARD_NAME": f"llm:{large_model}"}, config)
+        tiers[LARGE] = ModelTier(LARGE, large_model, llm=create_llm(large_config),
+                                 max_concurrency=int(config.get("MODEL_TIER_LARGE_MAX_CONCURRENCY", 4)))
+
+    _router = ModelRouter(
+        tiers,
+        threshold=float(config.get("MODEL_ROUTING_THRESHOLD", 2.0)),
+        min_words=int(config.get("MODEL_ROUTING_MIN_WORDS", 6)),
+        max_large_latency=float(config.get("MODEL_ROUTING_MAX_LARGE_LATENCY", 8.0)),
+        queue_timeout=float(config.get("MODEL_TIER_QUEUE_TIMEOUT", 2.0)),
+    )
+    return _router
+
+
+def get_model_router() -> Optional[ModelRouter]:
+    return _router
+
+
+async def invoke_prompt(prompt: RegisteredPrompt, inputs: Dict[str, Any], text: str = "",
+                        user_details_dict: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Invoke a prompt on the tier chosen for it.
+
+    Args:
+        prompt: Registered prompt to call
+        inputs: Prompt input variables
+        text: The user's message, if the call answers one
+        user_details_dict: Dictionary containing user health data
+
+    Returns:
+        The chain's output
+    """
+    router = _router
+    if router is None:
+        return await prompt.chain.ainvoke(inputs)
+    return await router.ainvoke(prompt, inputs, router.select(prompt, text, user_details_dict))
+
+
+async def stream_prompt(prompt: RegisteredPrompt, inputs: Dict[str, Any], text: str = "",
+                        user_details_dict: Optional[Dict[str, Any]] = None) -> AsyncIterator[Any]:
+    """Stream a prompt from the tier chosen for it; see invoke_prompt."""
+    router = _router
+    if router is None:
+        stream = prompt.chain.astream(inputs)
+    else:
+        stream = router.astream(prompt, inputs, router.select(prompt, text, user_details_dict))
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
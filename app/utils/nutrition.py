@@ -0,0 +1,158 @@
+"""
+Local nutrition estimates for meal plans.
+
+Meal prompts return only dish descriptions; asking the LLM for nutrition
+as well would lengthen every completion. Instead, each description is
+scanned once with an Aho-Corasick automaton over a bundled ingredient table
+(app/data/nutrition_table.json). Calories, protein, iron and folate are
+summed per meal, per day and as a daily average, without any LLM tokens.
+Values are rough per-serving estimates, not a dietary analysis.
+"""
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.utils.aho_corasick import AhoCorasick
+from app.utils.settings import get_setting
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "nutrition_table.json")
+
+WEEK_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+NUTRIENTS = ("calories", "protein_g", "iron_mg", "folate_mcg")
+
+# Count right before an ingredient, optionally with one word in between ("2 boiled eggs")
+COUNT_BEFORE = re.compile(r"\b(\d{1,2}|a|an|one|two|three|four|five|six|half)\s+(?:[a-z-]+\s+)?$")
+COUNT_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "half": 0.5}
+
+
+def empty_totals() -> Dict[str, float]:
+    return {nutrient: 0.0 for nutrient in NUTRIENTS}
+
+
+def round_totals(totals: Dict[str, float]) -> Dict[str, float]:
+    rounded = {nutrient: round(value, 1) for nutrient, value in totals.items()}
+    rounded["calories"] = int(round(totals["calories"]))
+    return rounded
+
+
+class NutritionTable:
+    """Ingredient nutrient table compiled into one multi-pattern matcher."""
+
+    def __init__(self, ingredients: List[Dict[str, Any]], version: Any = None):
+        self.ingredients = ingredients
+        self.version = version
+        self.matcher = AhoCorasick(
+            (phrase, index)
+            for index, ingredient in enumerate(ingredients)
+            for phrase in [ingredient["name"], *ingredient.get("aliases", ())]
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "NutritionTable":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ingredients"], data.get("version"))
+
+    def portions(self, text: str, start: int, ingredient: Dict[str, Any]) -> float:
+        """Servings of an ingredient mentioned at `start`."""
+        default = ingredient.get("default_count")
+        match = COUNT_BEFORE.search(text[max(0, start - 24):start].lower())
+        if match is None:
+            return float(default or 1)
+        word = match.group(1)
+        count = float(word) if word.isdigit() else COUNT_WORDS[word]
+        if default is None:
+            # Servings are not pieces: only a half scales them ("half an avocado")
+            return 0.5 if word == "half" else 1.0
+        return min(count, 6.0)
+
+    def annotate_meal(self, text: str) -> Dict[str, Any]:
+        """
+        Estimate the nutrients of one meal description.
+
+        Each ingredient counts once per meal, however often it is mentioned.
+
+        Args:
+            text: Meal description
+
+        Returns:
+            Rounded nutrient totals plus the matched ingredient names
+        """
+        totals = empty_totals()
+        seen: Dict[int, None] = {}
+        for start, _, index in self.matcher.find(text or ""):
+            if index in seen:
+                continue
+            seen[index] = None
+            ingredient = self.ingredients[index]
+            servings = self.portions(text, start, ingredient)
+            for nutrient in NUTRIENTS:
+                totals[nutrient] += ingredient[nutrient] * servings
+        annotated = round_totals(totals)
+        annotated["ingredients"] = [self.ingredients[index]["name"] for index in seen]
+        return annotated
+
+    def annotate_plan(self, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Estimate nutrients per meal, per day and per average day of a plan.
+
+        Args:
+            plan_data: Meal plan keyed by day name, each day keyed by meal
+
+        Returns:
+            The nutrition section for the plan
+        """
+        days = {}
+        week_totals = empty_totals()
+        for day in WEEK_DAYS:
+            meals = plan_data.get(day)
+            if not isinstance(meals, dict):
+                continue
+            annotated = {slot: self.annotate_meal(str(description)) for slot, description in meals.items()}
+            day_totals = empty_totals()
+            for meal in annotated.values():
+                for nutrient in NUTRIENTS:
+                    day_totals[nutrient] += meal[nutrient]
+            for nutrient in NUTRIENTS:
+                week_totals[nutrient] += day_totals[nutrient]
+            days[day] = {"meals": annotated, "total": round_totals(day_totals)}
+
+        average = {nutrient: value / len(days) for nutrient, value in week_totals.items()} if days else week_totals
+        return {
+            "estimated": True,
+            "table_version": self.version,
+            "days": days,
+            "daily_average": round_totals(average),
+        }
+
+
+_table: Optional[NutritionTable] = None
+_table_lock = threading.Lock()
+
+
+def get_nutrition_table() -> NutritionTable:
+    """Return the process-wide nutrition table, loading it on first use."""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = NutritionTable.load(get_setting("NUTRITION_TABLE_PATH") or TABLE_PATH)
+    return _table
+
+
+def annotate_plan(plan_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Attach nutrition estimates to a meal plan.
+
+    Args:
+        plan_data: Meal plan keyed by day name
+
+    Returns:
+        A copy of the plan with a "nutrition" section, or the plan unchanged
+        when annotation is disabled
+    """
+    if not get_setting("MEAL_PLAN_NUTRITION_ENABLED", True):
+        return plan_data
+    return {**plan_data, "nutrition": get_nutrition_table().annotate_plan(plan_data)}
@@ -0,0 +1,125 @@
+"""
+Compact profile digest for prompts.
+
+UserDetail.to_dict() has 26 verbose camelCase keys, including empty optional
+fields and createdAt, and used to be serialized into every prompt. The digest
+keeps only the fields that affect advice, with short canonical keys and
+values, and is built once per distinct profile and reused by every prompt.
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# Profile field -> short key used in the digest, in digest order
+DIGEST_FIELDS = (
+    ("age", "age"),
+    ("height", "height_cm"),
+    ("weight", "weight_kg"),
+    ("dietType", "diet"),
+    ("periodRegularity", "cycle"),
+    ("periodDuration", "period_days"),
+    ("exerciseFrequency", "exercise"),
+    ("processedFoodConsumption", "processed_food"),
+    ("waterIntake", "water"),
+    ("sleepHours", "sleep_hours"),
+    ("stressLevels", "stress"),
+    ("medicalHistory", "history"),
+    ("medications", "meds"),
+    ("fertilityTreatments", "fertility"),
+)
+
+# Yes/no symptom fields, listed together and only when present
+SYMPTOM_FIELDS = (
+    ("heavyBleeding", "heavy bleeding"),
+    ("severeCramps", "severe cramps"),
+    ("pcosDiagnosis", "pcos"),
+    ("hirsutism", "hirsutism"),
+    ("hairLoss", "hair loss"),
+    ("acneSkinIssues", "acne"),
+    ("weightGain", "weight gain"),
+    ("fatigue", "fatigue"),
+    ("sugarCravings", "sugar cravings"),
+    ("sleepDisturbances", "sleep issues"),
+    ("mentalHealthIssues", "mental health issues"),
+)
+
+# Fields whose changes make an existing meal plan stale
+MEAL_PLAN_FIELDS = (
+    "age", "height", "weight", "dietType", "pcosDiagnosis", "heavyBleeding", "weightGain",
+    "fatigue", "sugarCravings", "medicalHistory", "medications", "fertilityTreatments",
+)
+
+# Answers that carry no information for the prompt
+EMPTY_VALUES = frozenset({"", "none", "n/a", "na", "null", "-"})
+NEGATIVE_VALUES = frozenset({"no", "false", "never", "not diagnosed"})
+
+
+def canonical_value(value: Any) -> str:
+    """Lowercase and collapse whitespace; empty answers become ""."""
+    text = " ".join(str(value).split()).lower() if value is not None else ""
+    return "" if text in EMPTY_VALUES else text
+
+
+def is_yes(value: Any) -> bool:
+    """True for an answer that is neither empty nor negative."""
+    text = canonical_value(value)
+    return bool(text) and text not in NEGATIVE_VALUES
+
+
+def build_digest(profile: Tuple[Tuple[str, Any], ...]) -> str:
+    """Build the digest text from the profile's (field, value) pairs."""
+    values = dict(profile)
+    parts = []
+    for field, key in DIGEST_FIELDS:
+        value = canonical_value(values.get(field))
+        if value:
+            parts.append(f"{key}={value}")
+
+    symptoms = []
+    for field, label in SYMPTOM_FIELDS:
+        value = canonical_value(values.get(field))
+        if not value or value in NEGATIVE_VALUES:
+            continue
+        # Keep graded answers ("sometimes", "mild") next to the symptom
+        symptoms.append(label if value in ("yes", "true") else f"{label} ({value})")
+    parts.append(f"symptoms={', '.join(symptoms) if symptoms else 'none reported'}")
+    return "; ".join(parts)
+
+
+def changed_fields(old: Dict[str, Any], new: Dict[str, Any], fields: Tuple[str, ...] = MEAL_PLAN_FIELDS) -> List[str]:
+    """
+    Fields whose canonical value differs between two versions of a profile.
+
+    Args:
+        old: Details before the update (UserDetail.to_dict())
+        new: Details after the update
+        fields: Fields to compare, defaults to the meal-plan relevant ones
+
+    Returns:
+        Names of the changed fields, in the order given
+    """
+    return [field for field in fields if canonical_value(old.get(field)) != canonical_value(new.get(field))]
+
+
+@lru_cache(maxsize=1024)
+def _cached_digest(profile: Tuple[Tuple[str, Any], ...]) -> str:
+    return build_digest(profile)
+
+
+def profile_digest(user_details_dict: Optional[Dict[str, Any]]) -> str:
+    """
+    Return the compact prompt digest of a user's details.
+
+    Digests are memoized by profile content, so each version of a UserDetail
+    row is digested once and an edit naturally produces a new digest.
+
+    Args:
+        user_details_dict: Dictionary containing user health data (UserDetail.to_dict())
+
+    Returns:
+        The digest, e.g. "age=25; diet=vegetarian; ...; symptoms=fatigue"
+    """
+    if not user_details_dict:
+        return "No details provided."
+    fields = [field for field, _ in DIGEST_FIELDS] + [field for field, _ in SYMPTOM_FIELDS]
+    profile = tuple((field, user_details_dict.get(field)) for field in fields)
+    return _cached_digest(profile)
@@ -0,0 +1,213 @@
+"""
+Prompt and chain registry.
+
+Every prompt is compiled once at import time and tagged with a version
+derived from its content, so cache keys and A/B comparisons can refer to a
+stable identifier. Chains are rebuilt only when the registry is bound to a
+new LLM.
+"""
+import hashlib
+import threading
+from typing import Any, Dict
+
+from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import JsonOutputParser
+
+# Rough characters-per-token ratio for English text on Llama tokenizers
+CHARS_PER_TOKEN = 4
+
+CHAT_TEMPLATE = """You are an AI menstrual health assistant for women. Provide expert advice on health, diet, and well-being based on the user's input and details:
+            
+            Conversation so far: {history}
+
+            User Input: {user_input}
+            User Details: {user_details}
+
+            Ask questions to the user to get more information about their menstrual health.
+            If the user is not comfortable with answering a question, ask them to skip it.
+
+            Tailor the response to the user's details.
+            If the user is not pregnant, do not mention pregnancy or childbirth.
+            If the user is pregnant, do not mention menstruation.
+
+            At last always prescribe to the user to consult a doctor if they have any serious concerns.
+
+            """
+
+DAY_MEAL_TEMPLATE = """You are a nutrition expert specializing in women's health. Create a healthy meal plan for {day} considering these user details:
+
+{user_details}
+
+Additional preferences: {user_message}
+
+Consider the following when creating meals:
+- If the user is in their menstrual phase, include iron-rich foods
+- If the user is pregnant, focus on folate, calcium, and protein
+- If the user has any food allergies or restrictions, avoid those ingredients
+- Include a good balance of proteins, healthy fats, and complex carbohydrates
+- Keep meals practical and relatively easy to prepare
+
+Return a JSON object with the following structure:
+{{"Breakfast": "detailed breakfast description", 
+  "Lunch": "detailed lunch description", 
+  "Dinner": "detailed dinner description"}}
+
+  ONLY RETURN THE JSON OBJECT, NO OTHER TEXT.
+"""
+
+DAY_MEAL_BATCH_TEMPLATE = """You are a nutrition expert specializing in women's health. Create a healthy meal plan for each of the following requests. Each request names a day, the user's details and their preferences; requests are independent of each other.
+
+{requests}
+
+Consider the following when creating meals:
+- If the user is in their menstrual phase, include iron-rich foods
+- If the user is pregnant, focus on folate, calcium, and protein
+- If the user has any food allergies or restrictions, avoid those ingredients
+- Include a good balance of proteins, healthy fats, and complex carbohydrates
+- Keep meals practical and relatively easy to prepare
+
+Return a JSON object with one key per request id, each with the following structure:
+{{"r1": {{"Breakfast": "detailed breakfast description",
+         "Lunch": "detailed lunch description",
+         "Dinner": "detailed dinner description"}},
+  "r2": {{...}}}}
+
+  ONLY RETURN THE JSON OBJECT, NO OTHER TEXT.
+"""
+
+DAY_MEAL_REVISION_TEMPLATE = """You are a nutrition expert specializing in women's health. A user wants to change part of their meal plan for {day}. Their details:
+
+{user_details}
+
+Additional preferences: {user_message}
+
+Current meals for {day}:
+{current_meals}
+
+Replace the {replace} with different meals. Keep every other meal exactly as it is.
+
+Consider the following when creating meals:
+- If the user is in their menstrual phase, include iron-rich foods
+- If the user is pregnant, focus on folate, calcium, and protein
+- If the user has any food allergies or restrictions, avoid those ingredients
+- Include a good balance of proteins, healthy fats, and complex carbohydrates
+- Keep meals practical and relatively easy to prepare
+
+Return a JSON object with the following structure:
+{{"Breakfast": "detailed breakfast description",
+  "Lunch": "detailed lunch description",
+  "Dinner": "detailed dinner description"}}
+
+  ONLY RETURN THE JSON OBJECT, NO OTHER TEXT.
+"""
+
+CHAT_SUMMARY_TEMPLATE = """You maintain a running summary of a conversation between a user and a menstrual health assistant.
+
+Current summary:
+{summary}
+
+New messages to fold into the summary:
+{messages}
+
+Write an updated summary in at most {max_words} words. Keep symptoms, health facts, preferences and advice already given; drop greetings and small talk.
+ONLY RETURN THE SUMMARY, NO OTHER TEXT.
+"""
+
+WEEK_MEAL_TEMPLATE = """You are a nutrition expert specializing in women's health. Create a healthy 7-day meal plan (Monday to Sunday) considering these user details:
+
+{user_details}
+
+Additional preferences: {user_message}
+
+Consider the following when creating meals:
+- If the user is in their menstrual phase, include iron-rich foods
+- If the user is pregnant, focus on folate, calcium, and protein
+- If the user has any food allergies or restrictions, avoid those ingredients
+- Include a good balance of proteins, healthy fats, and complex carbohydrates
+- Keep meals practical and relatively easy to prepare
+- Vary the meals across the week
+
+Return a JSON object with one key per day of the week, each with the following structure:
+{{"Monday": {{"Breakfast": "detailed breakfast description",
+             "Lunch": "detailed lunch description",
+             "Dinner": "detailed dinner description"}},
+  "Tuesday": {{...}}, ..., "Sunday": {{...}}}}
+
+  ONLY RETURN THE JSON OBJECT, NO OTHER TEXT.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheaply estimate the token count of a piece of text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class RegisteredPrompt:
+    """A compiled prompt, its version tag and the chain bound to the current LLM."""
+
+    def __init__(self, name: str, template: str, input_variables, json_output: bool = False):
+        self.name = name
+        self.prompt = PromptTemplate(input_variables=list(input_variables), template=template)
+        self.parser = JsonOutputParser() if json_output else None
+        digest = hashlib.sha256(
+            "\x00".join([template, *sorted(input_variables), str(json_output)]).encode("utf-8")
+        ).hexdigest()
+        self.version = f"{name}@{digest[:12]}"
+        # Length of the template text once its placeholders are removed
+        self._static_chars = len(self.prompt.format(**{var: "" for var in input_variables}))
+        self.chain = None
+
+    def build_chain(self, llm):
+        """Build a chain of this prompt against an LLM without binding it."""
+        chain = self.prompt | llm
+        return chain | self.parser if self.parser is not None else chain
+
+    def bind(self, llm) -> None:
+        """Build the chain for an LLM."""
+        self.chain = self.build_chain(llm)
+
+    def estimate_tokens(self, inputs: Dict[str, Any]) -> int:
+        """Estimate the rendered prompt size without rendering it."""
+        chars = self._static_chars + sum(len(str(value)) for value in inputs.values())
+        return chars // CHARS_PER_TOKEN + 1
+
+
+class PromptRegistry:
+    """Named prompts compiled once and shared by every request."""
+
+    def __init__(self):
+        self._prompts: Dict[str, RegisteredPrompt] = {}
+        self._lock = threading.Lock()
+        self.llm = None
+
+    def register(self, name: str, template: str, input_variables, json_output: bool = False) -> RegisteredPrompt:
+        entry = RegisteredPrompt(name, template, input_variables, json_output)
+        with self._lock:
+            if self.llm is not None:
+                entry.bind(self.llm)
+            self._prompts[name] = entry
+        return entry
+
+    def bind(self, llm) -> None:
+        """Rebuild every chain against an LLM."""
+        with self._lock:
+            self.llm = llm
+            for entry in self._prompts.values():
+                entry.bind(llm)
+
+    def get(self, name: str) -> RegisteredPrompt:
+        return self._prompts[name]
+
+    def versions(self) -> Dict[str, str]:
+        """Return the version tag of every registered prompt."""
+        return {name: entry.version for name, entry in self._prompts.items()}
+
+
+registry = PromptRegistry()
+registry.register("chat", CHAT_TEMPLATE, ["history", "user_input", "user_details"])
+registry.register("chat_summary", CHAT_SUMMARY_TEMPLATE, ["summary", "messages", "max_words"])
+# Meal prompts return raw text; app.utils.json_stream extracts the JSON while streaming
+registry.register("day_meal", DAY_MEAL_TEMPLATE, ["day", "user_details", "user_message"])
+registry.register("week_meal", WEEK_MEAL_TEMPLATE, ["user_details", "user_message"])
+registry.register("day_meal_batch", DAY_MEAL_BATCH_TEMPLATE, ["requests"])
+registry.register("day_meal_revision", DAY_MEAL_REVISION_TEMPLATE, ["day", "user_details", "user_message", "current_meals", "replace"])
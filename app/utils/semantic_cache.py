@@ -0,0 +1,349 @@
+"""
+Semantic near-duplicate answer cache for the health chat.
+
+Questions are normalized and embedded locally as hashed word and character
+n-gram vectors. Answers are stored in an in-memory vector index partitioned
+by profile digest, so a paraphrase of an earlier question from a user with
+the same prompt-relevant details can reuse the stored answer without an LLM
+call. Each answer remembers the user it was generated for, so clearing that
+user's cache or updating their details drops it.
+"""
+import atexit
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.utils.profile import profile_digest
+from app.utils.settings import get_setting
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    text = _NON_WORD.sub(" ", (text or "").lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+def profile_bucket(user_details_dict: Dict[str, Any]) -> str:
+    """
+    Build the profile bucket a question is indexed under.
+
+    This is the same digest the chat prompt is built from, so answers are
+    only shared between profiles the LLM could not tell apart anyway.
+    """
+    return profile_digest(user_details_dict)
+
+
+def embed(text: str, dim: int = 1024) -> np.ndarray:
+    """
+    Embed normalized text as an L2-normalized hashed n-gram vector.
+
+    Word unigrams and bigrams carry most of the weight; character trigrams
+    make the vector tolerant to typos and inflections. crc32 is used instead
+    of hash() so vectors are stable across processes and restarts.
+
+    Args:
+        text: Normalized question text
+        dim: Vector dimension
+
+    Returns:
+        A float32 vector of length dim
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    words = text.split()
+    features = [(w, 1.0) for w in words]
+    features += [(f"{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features += [(f"#{padded[i:i + 3]}", 0.5) for i in range(len(padded) - 2)]
+
+    for feature, weight in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        # The top bit picks a sign so collisions tend to cancel out
+        vector[h % dim] += weight if h & 0x80000000 else -weight
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class _Bucket:
+    """Vectors and answers for one profile bucket."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self.last_used: List[float] = []
+        self.scopes: List[Optional[str]] = []
+
+
+class SemanticCache:
+    """In-memory nearest-neighbour answer cache with eviction and persistence."""
+
+    def __init__(self, threshold: float = 0.85, dim: int = 1024, max_per_bucket: int = 500,
+                 max_entries: int = 5000, path: Optional[str] = None, save_every: int = 50):
+        self.threshold = threshold
+        self.dim = dim
+        self.max_per_bucket = max(1, int(max_per_bucket))
+        self.max_entries = max(1, int(max_entries))
+        self.path = path
+        self.save_every = save_every
+        self._buckets: Dict[str, _Bucket] = {}
+        self._lock = threading.RLock()
+        self._dirty = 0
+        # Removals since the last save, so merging with the file does not bring entries back
+        self._dropped_scopes: Set[str] = set()
+        self._cleared = False
+        self._stats = {"hits": 0, "misses": 0, "inserts": 0, "evictions": 0}
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return sum(len(bucket.answers) for bucket in self._buckets.values())
+
+    def lookup(self, question: str, user_details_dict: Dict[str, Any], threshold: Optional[float] = None) -> Optional[str]:
+        """
+        Find a stored answer for a near-duplicate question.
+
+        Args:
+            question: Raw user question
+            user_details_dict: Profile used to choose the bucket
+            threshold: Cosine similarity required for a hit, defaults to the cache threshold
+
+        Returns:
+            The stored answer, or None on a miss
+        """
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        threshold = self.threshold if threshold is None else threshold
+        vector = embed(normalized, self.dim)
+        with self._lock:
+            bucket = self._buckets.get(profile_bucket(user_details_dict))
+            if bucket is None or not bucket.answers:
+                self._stats["misses"] += 1
+                return None
+            scores = bucket.vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                self._stats["misses"] += 1
+                return None
+            bucket.last_used[best] = time.time()
+            self._stats["hits"] += 1
+            return bucket.answers[best]
+
+    def add(self, question: str, user_details_dict: Dict[str, Any], answer: str, scope: Optional[str] = None) -> None:
+        """
+        Store an answer under the question's vector and profile bucket.
+
+        Args:
+            question: Raw user question
+            user_details_dict: Profile used to choose the bucket
+            answer: Generated answer
+            scope: User the answer was generated for, used by invalidate_scope
+        """
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        vector = embed(normalized, self.dim)
+        key = profile_bucket(user_details_dict)
+        with self._lock:
+            bucket = self._buckets.setdefault(key, _Bucket(self.dim))
+            if bucket.answers and float(np.max(bucket.vectors @ vector)) >= 0.999:
+                return
+            if len(bucket.answers) >= self.max_per_bucket:
+                self._evict(bucket, int(np.argmin(bucket.last_used)))
+            bucket.vectors = np.vstack([bucket.vectors, vector[None, :]])
+            bucket.questions.append(normalized)
+            bucket.answers.append(answer)
+            bucket.last_used.append(time.time())
+            bucket.scopes.append(scope)
+            self._stats["inserts"] += 1
+
+            while len(self) > self.max_entries:
+                self._evict_global_lru()
+
+            self._dirty += 1
+            if self.path and self._dirty >= self.save_every:
+                self.save()
+
+    def _evict(self, bucket: _Bucket, index: int) -> None:
+        bucket.vectors = np.delete(bucket.vectors, index, axis=0)
+        del bucket.questions[index]
+        del bucket.answers[index]
+        del bucket.last_used[index]
+        del bucket.scopes[index]
+        self._stats["evictions"] += 1
+
+    def _evict_global_lru(self) -> None:
+        oldest_key, oldest_index, oldest_time = None, None, None
+        for key, bucket in self._buckets.items():
+            if not bucket.last_used:
+                continue
+            index = int(np.argmin(bucket.last_used))
+            if oldest_time is None or bucket.last_used[index] < oldest_time:
+                oldest_key, oldest_index, oldest_time = key, index, bucket.last_used[index]
+        if oldest_key is None:
+            return
+        bucket = self._buckets[oldest_key]
+        self._evict(bucket, oldest_index)
+        if not bucket.answers:
+            del self._buckets[oldest_key]
+
+    def invalidate_scope(self, scope: str) -> int:
+        """
+        Drop every answer generated for a user.
+
+        Args:
+            scope: User id the answers were stored with
+
+        Returns:
+            Number of entries removed
+        """
+        removed = 0
+        with self._lock:
+            for key in list(self._buckets):
+                bucket = self._buckets[key]
+                for index in reversed(range(len(bucket.answers))):
+                    if bucket.scopes[index] == scope:
+                        self._evict(bucket, index)
+                        removed += 1
+                if not bucket.answers:
+                    del self._buckets[key]
+            self._dropped_scopes.add(scope)
+            if self.path:
+                self.save()
+        return removed
+
+    def save(self) -> None:
+        """
+        Merge the index into the file on disk and replace it atomically.
+
+        Workers share one file, so entries saved by other workers are kept
+        unless this worker has them too or has since dropped their scope.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            keys, rows, meta = [], [], []
+            for key, bucket in self._buckets.items():
+                for i in range(len(bucket.answers)):
+                    keys.append(key)
+                    rows.append(bucket.vectors[i])
+                    meta.append({
+                        "q": bucket.questions[i],
+                        "a": bucket.answers[i],
+                        "t": bucket.last_used[i],
+                        "s": bucket.scopes[i],
+                    })
+            if not self._cleared:
+                known = set(zip(keys, (entry["q"] for entry in meta)))
+                for key, row, entry in self._read():
+                    if (key, entry["q"]) in known or entry.get("s") in self._dropped_scopes:
+                        continue
+                    keys.append(key)
+                    rows.append(row)
+                    meta.append(entry)
+            if len(meta) > self.max_entries:
+                newest = sorted(range(len(meta)), key=lambda i: meta[i]["t"], reverse=True)[:self.max_entries]
+                keys, rows, meta = [keys[i] for i in newest], [rows[i] for i in newest], [meta[i] for i in newest]
+
+            matrix = np.vstack(rows) if rows else np.zeros((0, self.dim), dtype=np.float32)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    np.savez_compressed(
+                        f,
+                        vectors=matrix,
+                        buckets=np.array(keys, dtype=str),
+                        meta=np.array(json.dumps(meta)),
+                    )
+                os.replace(tmp_path, self.path)
+                self._dirty = 0
+                self._dropped_scopes = set()
+                self._cleared = False
+            except OSError as e:
+                print(f"Semantic cache save failed: {str(e)}", file=sys.stderr)
+
+    def _read(self) -> List[Tuple[str, np.ndarray, Dict[str, Any]]]:
+        """(bucket, vector, meta) entries of the saved index, ignoring files from another dimension."""
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                matrix = data["vectors"]
+                keys = [str(k) for k in data["buckets"]]
+                meta = json.loads(str(data["meta"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Semantic cache load failed: {str(e)}", file=sys.stderr)
+            return []
+        if matrix.shape[1:] != (self.dim,):
+            return []
+        return list(zip(keys, matrix, meta))
+
+    def load(self) -> None:
+        """Load a previously saved index."""
+        entries = self._read()
+        with self._lock:
+            self._buckets = {}
+            for key, row, entry in entries:
+                bucket = self._buckets.setdefault(key, _Bucket(self.dim))
+                bucket.vectors = np.vstack([bucket.vectors, row[None, :]])
+                bucket.questions.append(entry["q"])
+                bucket.answers.append(entry["a"])
+                bucket.last_used.append(entry["t"])
+                bucket.scopes.append(entry.get("s"))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets = {}
+            self._cleared = True
+            self._dirty += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self)
+            stats["buckets"] = len(self._buckets)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["threshold"] = self.threshold
+        return stats
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, or None when it is disabled."""
+    global _cache
+    if not get_setting("SEMANTIC_CACHE_ENABLED", False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache(
+                    threshold=float(get_setting("SEMANTIC_CACHE_THRESHOLD", 0.85)),
+                    dim=int(get_setting("SEMANTIC_CACHE_DIM", 1024)),
+                    max_per_bucket=int(get_setting("SEMANTIC_CACHE_MAX_PER_BUCKET", 500)),
+                    max_entries=int(get_setting("SEMANTIC_CACHE_MAX_ENTRIES", 5000)),
+                    path=get_setting(
+                        "SEMANTIC_CACHE_PATH",
+                        os.path.join(tempfile.gettempdir(), "harmonia_semantic_cache.npz"),
+                    ),
+                )
+                atexit.register(_cache.save)
+    return _cache
@@ -0,0 +1,22 @@
+"""
+Application settings helpers for utility modules.
+"""
+from typing import Any
+
+from flask import current_app, has_app_context
+
+
+def get_setting(name: str, default: Any = None) -> Any:
+    """
+    Read a configuration value from the active Flask app.
+
+    Args:
+        name: Configuration key to look up
+        default: Value returned when the key is unset or no app context is active
+
+    Returns:
+        The configured value or the default
+    """
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
@@ -0,0 +1,197 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests.
+
+Concurrent callers with the same key await one shared upstream call instead
+of each starting their own. Flask runs every async view on its own event loop
+and thread, so in-flight calls are tracked with thread-safe
+concurrent.futures.Future objects that any loop can await.
+
+Across workers on one host, an optional SQLite lease makes a second worker
+wait for the first to finish. The caller's factory is expected to check the
+shared LLM cache first, so the waiting worker then picks up the stored result.
+"""
+import asyncio
+import concurrent.futures
+import copy
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.utils.settings import get_setting
+
+# Result handed to followers when the leader was cancelled: retry the call
+_RETRY = object()
+
+
+class SQLiteLease:
+    """Expiring per-key leases stored in a SQLite file shared by all workers on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS single_flight_lease ("
+            " key TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def try_acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """Take the lease for a key unless another owner holds an unexpired one."""
+        conn = self._connect()
+        conn.execute("DELETE FROM single_flight_lease WHERE key = ? AND expires_at <= ?", (key, time.time()))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO single_flight_lease (key, owner, expires_at) VALUES (?, ?, ?)",
+            (key, owner, time.time() + ttl),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, key: str, owner: str) -> None:
+        self._connect().execute("DELETE FROM single_flight_lease WHERE key = ? AND owner = ?", (key, owner))
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key.
+
+    The first caller (the leader) runs the call; callers arriving while it is
+    in flight wait for its result and get their own deep copy of it. If the
+    leader is cancelled, a waiting caller takes over the call.
+    """
+
+    def __init__(self, lease: Optional[SQLiteLease] = None, lease_ttl: float = 120.0, poll_interval: float = 0.2):
+        self.lease = lease
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self.leaders = 0
+        self.coalesced = 0
+        self.lease_waits = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run factory() once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the call; equal keys must mean interchangeable results
+            factory: Callable returning the awaitable that does the work
+
+        Returns:
+            The call's result (a private copy for every caller but the leader)
+        """
+        while True:
+            with self._lock:
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = concurrent.futures.Future()
+                    self._inflight[key] = flight
+                    self.leaders += 1
+
+            if not leader:
+                # shield: a follower going away must not cancel the shared call
+                result = await asyncio.shield(asyncio.wrap_future(flight))
+                if result is _RETRY:
+                    continue
+                with self._lock:
+                    self.coalesced += 1
+                return copy.deepcopy(result)
+
+            return await self._lead(key, flight, factory)
+
+    async def _lead(self, key: str, flight: concurrent.futures.Future, factory: Callable[[], Awaitable[Any]]) -> Any:
+        leased = False
+        try:
+            leased = await self._acquire_lease(key)
+            result = await factory()
+        except asyncio.CancelledError:
+            self._finish(key, flight, result=_RETRY)
+            raise
+        except BaseException as e:
+            self._finish(key, flight, exception=e)
+            raise
+        finally:
+            if leased:
+                self.lease.release(key, self._owner)
+        self._finish(key, flight, result=result)
+        return result
+
+    def _finish(self, key: str, flight: concurrent.futures.Future, result: Any = None,
+                exception: Optional[BaseException] = None) -> None:
+        # Unregister first so late arrivals start a fresh call
+        with self._lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        if exception is not None:
+            flight.set_exception(exception)
+        else:
+            flight.set_result(result)
+
+    async def _acquire_lease(self, key: str) -> bool:
+        """Wait until no other worker runs this key; give up waiting after lease_ttl."""
+        if self.lease is None:
+            return False
+        deadline = time.monotonic() + self.lease_ttl
+        waited = False
+        while not self.lease.try_acquire(key, self._owner, self.lease_ttl):
+            if not waited:
+                waited = True
+                with self._lock:
+                    self.lease_waits += 1
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "lease_waits": self.lease_waits,
+                "cross_worker": self.lease is not None,
+            }
+
+
+_flights: Optional[SingleFlight] = None
+_flights_lock = threading.Lock()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Return the process-wide single-flight group, or None when coalescing is disabled."""
+    global _flights
+    if not get_setting("SINGLE_FLIGHT_ENABLED", True):
+        return None
+    if _flights is None:
+        with _flights_lock:
+            if _flights is None:
+                lease_path = get_setting("SINGLE_FLIGHT_LEASE_PATH", None)
+                _flights = SingleFlight(
+                    lease=SQLiteLease(lease_path) if lease_path else None,
+                    lease_ttl=float(get_setting("SINGLE_FLIGHT_LEASE_TTL", 120)),
+                    poll_interval=float(get_setting("SINGLE_FLIGHT_POLL_INTERVAL", 0.2)),
+                )
+    return _flights
+
+
+async def coalesce(key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Run factory() through the single-flight group, or directly when disabled."""
+    flights = get_single_flight()
+    if flights is None:
+        return await factory()
+    return await flights.do(key, factory)
@@ -0,0 +1,70 @@
+"""
+Helpers for streaming responses (Server-Sent Events and NDJSON).
+"""
+import asyncio
+import contextvars
+import json
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+# Headers that stop proxies from buffering a streamed response
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(data: Any, event: Optional[str] = None) -> str:
+    """
+    Format a Server-Sent Events message.
+
+    Args:
+        data: JSON-serializable payload
+        event: Optional event name
+
+    Returns:
+        The encoded event, terminated by a blank line
+    """
+    message = f"event: {event}\n" if event else ""
+    return f"{message}data: {json.dumps(data)}\n\n"
+
+
+def format_ndjson(data: Any) -> str:
+    """Format one newline-delimited JSON record."""
+    return json.dumps(data) + "\n"
+
+
+def iterate_async(agen_factory: Callable[[], AsyncIterator[Any]],
+                  context: Optional[contextvars.Context] = None) -> Iterator[Any]:
+    """
+    Drive an async generator from a synchronous WSGI response iterator.
+
+    The generator runs on a private event loop. When the client disconnects
+    the WSGI server closes this iterator, which closes the async generator so
+    any upstream request it holds is cancelled.
+
+    Every step runs in the same context, so context variables set up before
+    streaming (such as the request's time budget) are visible throughout.
+
+    Args:
+        agen_factory: Callable returning the async generator to drive
+        context: Context to run in, defaults to a copy of the current one
+
+    Yields:
+        Items produced by the async generator
+    """
+    context = context if context is not None else contextvars.copy_context()
+    loop = asyncio.new_event_loop()
+    agen = context.run(agen_factory)
+    try:
+        while True:
+            try:
+                item = context.run(loop.run_until_complete, agen.__anext__())
+            except StopAsyncIteration:
+                break
+            yield item
+    finally:
+        try:
+            context.run(loop.run_until_complete, agen.aclose())
+            context.run(loop.run_until_complete, loop.shutdown_asyncgens())
+        finally:
+            loop.close()
@@ -0,0 +1,470 @@
+"""
+Upstream guard for LLM calls: rate limiting, retries and a circuit breaker.
+
+Every call to the provider goes through one UpstreamGuard:
+
+- A token bucket on requests per minute and one on tokens per minute keep
+  the app under the provider's quota instead of bouncing off 429s.
+- 429, 5xx and connection errors are retried with exponential backoff and
+  full jitter, honouring Retry-After when the provider sends one.
+- A circuit breaker opens after consecutive upstream failures and fails fast
+  for a cooldown period, then lets a single probe call through.
+
+Bucket levels and breaker state live in a SQLite file, so all workers on a
+host share one quota and one view of provider health.
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.utils.prompts import estimate_tokens
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailableError(RuntimeError):
+    """Raised without calling the provider while it is unhealthy or over quota."""
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status of a provider error, if it carries one."""
+    code = getattr(exc, "status_code", None)
+    if code is None and isinstance(getattr(exc, "response", None), httpx.Response):
+        code = exc.response.status_code
+    return code
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether an error means the provider is throttling or unhealthy."""
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    # Connection errors and timeouts (groq.APIConnectionError wraps these too)
+    return isinstance(exc, (httpx.TransportError, ConnectionError, TimeoutError)) or \
+        type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the provider asked us to wait, from a Retry-After header."""
+    response = getattr(exc, "response", None)
+    if not isinstance(response, httpx.Response):
+        return None
+    try:
+        return max(0.0, float(response.headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+class SharedGuardState:
+    """Token buckets and breaker state in a SQLite file shared by all workers on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS upstream_bucket ("
+            " name TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS upstream_breaker ("
+            " name TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " failures INTEGER NOT NULL,"
+            " opened_until REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def _level(conn: sqlite3.Connection, name: str, capacity: float, per_second: float, now: float) -> float:
+        row = conn.execute("SELECT tokens, updated_at FROM upstream_bucket WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row[0] + (now - row[1]) * per_second)
+
+    def take(self, costs: Dict[str, float], limits: Dict[str, float]) -> float:
+        """
+        Take from several per-minute buckets at once, or from none of them.
+
+        Args:
+            costs: Amount to take from each bucket
+            limits: Per-minute limit (and burst capacity) of each bucket
+
+        Returns:
+            0 if taken, else seconds until every bucket can cover its cost
+        """
+        def run(conn):
+            now = time.time()
+            levels, wait = {}, 0.0
+            for name, cost in costs.items():
+                capacity = limits[name]
+                levels[name] = self._level(conn, name, capacity, capacity / 60.0, now)
+                # A cost above capacity waits for a full bucket instead of forever
+                needed = min(cost, capacity) - levels[name]
+                if needed > 0:
+                    wait = max(wait, needed / (capacity / 60.0))
+            if wait > 0:
+                return wait
+            for name, cost in costs.items():
+                conn.execute(
+                    "INSERT OR REPLACE INTO upstream_bucket (name, tokens, updated_at) VALUES (?, ?, ?)",
+                    (name, levels[name] - cost, now),
+                )
+            return 0.0
+        return self._transaction(run)
+
+    def levels(self, limits: Dict[str, float]) -> Dict[str, float]:
+        conn = self._connect()
+        now = time.time()
+        return {name: round(self._level(conn, name, capacity, capacity / 60.0, now), 1)
+                for name, capacity in limits.items()}
+
+    def _breaker(self, conn: sqlite3.Connection, name: str):
+        row = conn.execute(
+            "SELECT state, failures, opened_until FROM upstream_breaker WHERE name = ?", (name,)
+        ).fetchone()
+        return row if row is not None else (BREAKER_CLOSED, 0, 0.0)
+
+    def _set_breaker(self, conn: sqlite3.Connection, name: str, state: str, failures: int, opened_until: float) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO upstream_breaker (name, state, failures, opened_until) VALUES (?, ?, ?, ?)",
+            (name, state, failures, opened_until),
+        )
+
+    def allow(self, name: str, cooldown: float) -> bool:
+        """Whether a call may go out; after the cooldown one caller becomes the probe."""
+        # Lock-free fast path for the common, healthy case
+        if self._breaker(self._connect(), name)[0] == BREAKER_CLOSED:
+            return True
+
+        def run(conn):
+            state, failures, opened_until = self._breaker(conn, name)
+            if state == BREAKER_CLOSED:
+                return True
+            if time.time() < opened_until:
+                return False
+            # Cooldown over (or the last probe timed out): this caller probes
+            self._set_breaker(conn, name, BREAKER_HALF_OPEN, failures, time.time() + cooldown)
+            return True
+        return self._transaction(run)
+
+    def record(self, name: str, success: bool, threshold: int, cooldown: float) -> str:
+        """Record a call outcome and return the resulting breaker state."""
+        def run(conn):
+            state, failures, _ = self._breaker(conn, name)
+            if success:
+                if state != BREAKER_CLOSED or failures:
+                    self._set_breaker(conn, name, BREAKER_CLOSED, 0, 0.0)
+                return BREAKER_CLOSED
+            failures += 1
+            if state == BREAKER_HALF_OPEN or failures >= threshold:
+                self._set_breaker(conn, name, BREAKER_OPEN, failures, time.time() + cooldown)
+                return BREAKER_OPEN
+            self._set_breaker(conn, name, state, failures, 0.0)
+            return state
+        return self._transaction(run)
+
+    def breaker(self, name: str) -> Dict[str, Any]:
+        state, failures, opened_until = self._breaker(self._connect(), name)
+        return {
+            "state": state,
+            "consecutive_failures": failures,
+            "retry_in": round(max(0.0, opened_until - time.time()), 1) if state != BREAKER_CLOSED else 0.0,
+        }
+
+
+class UpstreamGuard:
+    """Rate limiter, retry policy and circuit breaker in front of one provider."""
+
+    def __init__(self, state: SharedGuardState, name: str = "llm", requests_per_minute: float = 30,
+                 tokens_per_minute: float = 30000, max_wait: float = 30.0, max_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 20.0, failure_threshold: int = 5,
+                 cooldown: float = 30.0):
+        self.state = state
+        self.name = name
+        # A limit of 0 disables that bucket
+        self.limits = {
+            f"{name}:requests": float(requests_per_minute),
+            f"{name}:tokens": float(tokens_per_minute),
+        }
+        self.limits = {bucket: limit for bucket, limit in self.limits.items() if limit > 0}
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retries": 0,
+            "throttled": 0, "throttle_wait_seconds": 0.0, "rejected": 0,
+        }
+
+    def count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def _costs(self, tokens: int) -> Dict[str, float]:
+        costs = {f"{self.name}:requests": 1.0, f"{self.name}:tokens": float(tokens)}
+        return {bucket: cost for bucket, cost in costs.items() if bucket in self.limits}
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        """Delay before retry number `attempt` (1-based): Retry-After, else full-jitter backoff."""
+        hinted = retry_after(exc)
+        if hinted is not None:
+            return min(hinted, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def _admit(self) -> None:
+        if not self.state.allow(self.name, self.cooldown):
+            self.count("rejected")
+            raise UpstreamUnavailableError("LLM provider is unavailable (circuit open), try again shortly")
+
+    def _reserve(self, tokens: int, waited: float) -> float:
+        """Take quota or return how long to sleep; raise once max_wait is used up."""
+        if not self.limits:
+            return 0.0
+        wait = self.state.take(self._costs(tokens), self.limits)
+        if wait > 0:
+            if waited + wait > self.max_wait:
+                self.count("rejected")
+                raise UpstreamUnavailableError("LLM request quota exhausted, try again shortly")
+            if waited == 0:
+                self.count("throttled")
+            self.count("throttle_wait_seconds", wait)
+        return wait
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait for the circuit and the rate limits to allow one call."""
+        self._admit()
+        waited = 0.0
+        while True:
+            wait = self._reserve(tokens, waited)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def acquire_sync(self, tokens: int) -> None:
+        self._admit()
+        waited = 0.0
+        while True:
+            wait = self._reserve(tokens, waited)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+            waited += wait
+
+    def record(self, success: bool) -> None:
+        self.count("succeeded" if success else "failed")
+        self.state.record(self.name, success, self.failure_threshold, self.cooldown)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], tokens: int) -> Any:
+        """
+        Run an upstream call under the rate limits, retry policy and breaker.
+
+        Args:
+            fn: Callable returning a fresh awaitable for each attempt
+            tokens: Estimated tokens the call consumes
+
+        Returns:
+            The call's result
+        """
+        self.count("calls")
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self.record(False)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.count("retries")
+                await asyncio.sleep(self.backoff(attempt, e))
+                continue
+            self.record(True)
+            return result
+
+    def call_sync(self, fn: Callable[[], Any], tokens: int) -> Any:
+        self.count("calls")
+        attempt = 0
+        while True:
+            self.acquire_sync(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self.record(False)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.count("retries")
+                time.sleep(self.backoff(attempt, e))
+                continue
+            self.record(True)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        counters["throttle_wait_seconds"] = round(counters["throttle_wait_seconds"], 2)
+        return {
+            "worker": counters,
+            "breaker": self.state.breaker(self.name),
+            "buckets": {
+                bucket: {"available": level, "per_minute": self.limits[bucket]}
+                for bucket, level in self.state.levels(self.limits).items()
+            },
+        }
+
+
+def estimate_call_tokens(messages: List[BaseMessage], completion_tokens: int) -> int:
+    """Prompt tokens of a request plus the expected completion length."""
+    return sum(estimate_tokens(str(message.content)) for message in messages) + completion_tokens
+
+
+class GuardedChatModel(BaseChatModel):
+    """Chat model that sends every call to an inner model through an UpstreamGuard."""
+
+    inner: BaseChatModel
+    guard: Any
+    model_name: str = "llama3-8b-8192"
+    completion_tokens: int = 400
+
+    @property
+    def _llm_type(self) -> str:
+        return f"guarded-{self.inner._llm_type}"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = estimate_call_tokens(messages, self.completion_tokens)
+        return self.guard.call_sync(lambda: self.inner._generate(messages, stop=stop, **kwargs), tokens)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = estimate_call_tokens(messages, self.completion_tokens)
+        return await self.guard.call(lambda: self.inner._agenerate(messages, stop=stop, **kwargs), tokens)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tokens = estimate_call_tokens(messages, self.completion_tokens)
+        self.guard.count("calls")
+        attempt = 0
+        while True:
+            self.guard.acquire_sync(tokens)
+            started = False
+            try:
+                for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+                    if not started:
+                        # The provider has answered; callers may close the stream
+                        # early (GeneratorExit, cancellation), so this is the success
+                        started = True
+                        self.guard.record(True)
+                    yield chunk
+            except Exception as e:
+                # Once text has been sent a retry would duplicate it
+                if started or not is_retryable(e):
+                    raise
+                self.guard.record(False)
+                attempt += 1
+                if attempt > self.guard.max_retries:
+                    raise
+                self.guard.count("retries")
+                time.sleep(self.guard.backoff(attempt, e))
+                continue
+            if not started:
+                self.guard.record(True)
+            return
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = estimate_call_tokens(messages, self.completion_tokens)
+        self.guard.count("calls")
+        attempt = 0
+        while True:
+            await self.guard.acquire(tokens)
+            started = False
+            try:
+                async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                    if not started:
+                        # The provider has answered; callers may close the stream
+                        # early (GeneratorExit, cancellation), so this is the success
+                        started = True
+                        self.guard.record(True)
+                    yield chunk
+            except Exception as e:
+                # Once text has been sent a retry would duplicate it
+                if started or not is_retryable(e):
+                    raise
+                self.guard.record(False)
+                attempt += 1
+                if attempt > self.guard.max_retries:
+                    raise
+                self.guard.count("retries")
+                await asyncio.sleep(self.guard.backoff(attempt, e))
+                continue
+            if not started:
+                self.guard.record(True)
+            return
+
+
+def create_upstream_guard(config) -> UpstreamGuard:
+    """Build the guard for the LLM provider from LLM_* config keys."""
+    return UpstreamGuard(
+        SharedGuardState(config.get(
+            "LLM_GUARD_STATE_PATH", os.path.join(tempfile.gettempdir(), "harmonia_llm_guard.sqlite3")
+        )),
+        # Models with their own provider quota get their own buckets and breaker
+        name=config.get("LLM_GUARD_NAME", "llm"),
+        requests_per_minute=float(config.get("LLM_RATE_LIMIT_RPM", 30)),
+        tokens_per_minute=float(config.get("LLM_RATE_LIMIT_TPM", 30000)),
+        max_wait=float(config.get("LLM_RATE_LIMIT_MAX_WAIT", 30)),
+        max_retries=int(config.get("LLM_MAX_RETRIES", 3)),
+        base_delay=float(config.get("LLM_RETRY_BASE_DELAY", 0.5)),
+        max_delay=float(config.get("LLM_RETRY_MAX_DELAY", 20)),
+        failure_threshold=int(config.get("LLM_BREAKER_FAILURE_THRESHOLD", 5)),
+        cooldown=float(config.get("LLM_BREAKER_COOLDOWN", 30)),
+    )
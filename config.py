@@ -2,6 +2,7 @@
 Configuration module for the Flask application.
 """
 import os
+import tempfile
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -27,6 +28,110 @@ class Config:
     # CORS settings
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*')
     
+    # LLM backend settings
+    LLM_BACKEND = os.environ.get('LLM_BACKEND', 'groq')  # groq, local, record or replay
+    LLM_MODEL = os.environ.get('LLM_MODEL', 'llama3-8b-8192')
+    LLM_LARGE_MODEL = os.environ.get('LLM_LARGE_MODEL', 'llama3-70b-8192')  # Used for complex chat questions
+    GROQ_API_KEY = os.environ.get('GROQ_API_KEY')  # Required by the groq and record backends
+    LLM_LOCAL_BASE_URL = os.environ.get('LLM_LOCAL_BASE_URL', 'http://127.0.0.1:8089')  # Stand-in server
+    LLM_CASSETTE_PATH = os.environ.get('LLM_CASSETTE_PATH', 'cassettes')  # Record/replay storage
+
+    # Chat memory settings
+    CHAT_MEMORY_TOKEN_BUDGET = int(os.environ.get('CHAT_MEMORY_TOKEN_BUDGET', 1200))  # Recent window size
+    CHAT_MEMORY_SUMMARY_TRIGGER = int(os.environ.get('CHAT_MEMORY_SUMMARY_TRIGGER', 400))  # Overflow tokens before folding
+    CHAT_SUMMARY_MAX_WORDS = int(os.environ.get('CHAT_SUMMARY_MAX_WORDS', 150))
+
+    # Automatic chat titles, replacing the "Chat <hex>" placeholder
+    CHAT_AUTO_TITLE_ENABLED = os.environ.get('CHAT_AUTO_TITLE_ENABLED', 'true').lower() == 'true'
+    CHAT_TITLE_MAX_TERMS = int(os.environ.get('CHAT_TITLE_MAX_TERMS', 4))  # Words per title
+    CHAT_TITLE_CORPUS_SIZE = int(os.environ.get('CHAT_TITLE_CORPUS_SIZE', 5000))  # Recent user messages the IDF is fitted on
+    CHAT_TITLE_REFIT_INTERVAL = float(os.environ.get('CHAT_TITLE_REFIT_INTERVAL', 3600))  # Seconds
+
+    # Upstream guard for LLM calls; shared by all workers on the host
+    LLM_GUARD_ENABLED = os.environ.get('LLM_GUARD_ENABLED', 'true').lower() == 'true'
+    LLM_GUARD_STATE_PATH = os.environ.get('LLM_GUARD_STATE_PATH', os.path.join(tempfile.gettempdir(), 'harmonia_llm_guard.sqlite3'))
+    LLM_RATE_LIMIT_RPM = float(os.environ.get('LLM_RATE_LIMIT_RPM', 30))  # Match your Groq plan, 0 to disable
+    LLM_RATE_LIMIT_TPM = float(os.environ.get('LLM_RATE_LIMIT_TPM', 30000))  # Match your Groq plan, 0 to disable
+    LLM_RATE_LIMIT_MAX_WAIT = float(os.environ.get('LLM_RATE_LIMIT_MAX_WAIT', 30))  # Fail instead of queueing longer
+    LLM_COMPLETION_TOKEN_ESTIMATE = int(os.environ.get('LLM_COMPLETION_TOKEN_ESTIMATE', 400))
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))
+    LLM_RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY', 0.5))
+    LLM_RETRY_MAX_DELAY = float(os.environ.get('LLM_RETRY_MAX_DELAY', 20))
+    LLM_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('LLM_BREAKER_FAILURE_THRESHOLD', 5))  # Consecutive failures
+    LLM_BREAKER_COOLDOWN = float(os.environ.get('LLM_BREAKER_COOLDOWN', 30))
+
+    # Request time budgets and hedged LLM calls
+    CHAT_DEADLINE_SECONDS = float(os.environ.get('CHAT_DEADLINE_SECONDS', 20))  # 0 for no deadline
+    MEAL_PLAN_DEADLINE_SECONDS = float(os.environ.get('MEAL_PLAN_DEADLINE_SECONDS', 45))  # 0 for no deadline
+    LLM_HEDGE_ENABLED = os.environ.get('LLM_HEDGE_ENABLED', 'false').lower() == 'true'
+    LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', 95))  # Hedge calls slower than this percentile
+    LLM_HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', 20))
+
+    # Model tier routing between LLM_MODEL (fast) and LLM_LARGE_MODEL (large)
+    MODEL_ROUTING_ENABLED = os.environ.get('MODEL_ROUTING_ENABLED', 'true').lower() == 'true'
+    MODEL_ROUTING_THRESHOLD = float(os.environ.get('MODEL_ROUTING_THRESHOLD', 2.0))  # Complexity score for the large tier
+    MODEL_ROUTING_MIN_WORDS = int(os.environ.get('MODEL_ROUTING_MIN_WORDS', 6))  # Shorter messages stay on the fast tier
+    MODEL_ROUTING_MAX_LARGE_LATENCY = float(os.environ.get('MODEL_ROUTING_MAX_LARGE_LATENCY', 8.0))  # Large-tier p90 seconds before falling back to fast
+    MODEL_TIER_FAST_MAX_CONCURRENCY = int(os.environ.get('MODEL_TIER_FAST_MAX_CONCURRENCY', 16))
+    MODEL_TIER_LARGE_MAX_CONCURRENCY = int(os.environ.get('MODEL_TIER_LARGE_MAX_CONCURRENCY', 4))
+    MODEL_TIER_QUEUE_TIMEOUT = float(os.environ.get('MODEL_TIER_QUEUE_TIMEOUT', 2.0))  # Seconds to wait for a slot before failing over
+
+    # Meal plan generation settings
+    MEAL_PLAN_MAX_CONCURRENCY = int(os.environ.get('MEAL_PLAN_MAX_CONCURRENCY', 7))
+    MEAL_PLAN_GENERATION_MODE = os.environ.get('MEAL_PLAN_GENERATION_MODE', 'per_day')  # per_day, single_shot, catalog or auto
+    DAY_MEAL_BATCH_ENABLED = os.environ.get('DAY_MEAL_BATCH_ENABLED', 'false').lower() == 'true'  # Batch concurrent day prompts into one call
+    DAY_MEAL_BATCH_MAX_ITEMS = int(os.environ.get('DAY_MEAL_BATCH_MAX_ITEMS', 7))
+    DAY_MEAL_BATCH_MAX_WAIT_MS = float(os.environ.get('DAY_MEAL_BATCH_MAX_WAIT_MS', 25))  # Window for collecting a batch
+    MEAL_CATALOG_PATH = os.environ.get('MEAL_CATALOG_PATH')  # Defaults to app/data/meal_catalog.json
+    MEAL_CATALOG_REGION = os.environ.get('MEAL_CATALOG_REGION')  # Cuisine favoured by the catalog scorer
+    MEAL_PLAN_NUTRITION_ENABLED = os.environ.get('MEAL_PLAN_NUTRITION_ENABLED', 'true').lower() == 'true'  # Local calorie/protein/iron/folate estimates
+    NUTRITION_TABLE_PATH = os.environ.get('NUTRITION_TABLE_PATH')  # Defaults to app/data/nutrition_table.json
+    DIET_VALIDATION_ENABLED = os.environ.get('DIET_VALIDATION_ENABLED', 'true').lower() == 'true'  # Check generated meals against diet and allergies
+    DIET_REPAIR_ATTEMPTS = int(os.environ.get('DIET_REPAIR_ATTEMPTS', 1))  # LLM retries per conflicting day before using catalog meals
+
+    # Profile archetypes; build the model with `flask archetypes build`
+    ARCHETYPE_SHARING_ENABLED = os.environ.get('ARCHETYPE_SHARING_ENABLED', 'true').lower() == 'true'
+    ARCHETYPE_MODEL_PATH = os.environ.get('ARCHETYPE_MODEL_PATH', os.path.join('instance', 'profile_archetypes.json'))
+    ARCHETYPE_MAX_CLUSTERS = int(os.environ.get('ARCHETYPE_MAX_CLUSTERS', 300))
+    ARCHETYPE_MIN_SIMILARITY = float(os.environ.get('ARCHETYPE_MIN_SIMILARITY', 0.9))  # Share of profile features that must match
+    ARCHETYPE_PLAN_TTL = int(os.environ.get('ARCHETYPE_PLAN_TTL', 604800))  # Seconds a shared plan stays fresh
+
+    # LLM response cache settings
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 3600))  # Seconds
+    LLM_CACHE_MEMORY_TTL = int(os.environ.get('LLM_CACHE_MEMORY_TTL', 300))  # Per-worker tier lifetime
+    LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 1024))
+    LLM_CACHE_SHARED_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_SHARED_MAX_ENTRIES', 20000))
+    LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'harmonia_llm_cache.sqlite3'))
+
+    # Semantic chat answer cache settings
+    SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.85))  # Cosine similarity for a hit
+    SEMANTIC_CACHE_DIM = int(os.environ.get('SEMANTIC_CACHE_DIM', 1024))
+    SEMANTIC_CACHE_MAX_PER_BUCKET = int(os.environ.get('SEMANTIC_CACHE_MAX_PER_BUCKET', 500))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', 5000))
+    SEMANTIC_CACHE_PATH = os.environ.get('SEMANTIC_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'harmonia_semantic_cache.npz'))
+
+    # Local intent router for greetings, thanks and questions about the assistant
+    INTENT_ROUTER_ENABLED = os.environ.get('INTENT_ROUTER_ENABLED', 'true').lower() == 'true'
+    INTENT_ROUTER_THRESHOLD = float(os.environ.get('INTENT_ROUTER_THRESHOLD', 0.8))  # Model probability needed to answer locally
+    INTENT_ROUTER_MAX_WORDS = int(os.environ.get('INTENT_ROUTER_MAX_WORDS', 8))  # Longer messages always go to the LLM
+    INTENT_ROUTER_LOG_PATH = os.environ.get('INTENT_ROUTER_LOG_PATH')  # Optional JSONL log of routing decisions
+
+    # Background meal plan job queue
+    JOB_QUEUE_WORKERS = int(os.environ.get('JOB_QUEUE_WORKERS', 0))  # Worker threads per process; opt-in, set on long-running servers
+    JOB_QUEUE_POLL_INTERVAL = float(os.environ.get('JOB_QUEUE_POLL_INTERVAL', 1.0))
+    JOB_QUEUE_VISIBILITY_TIMEOUT = float(os.environ.get('JOB_QUEUE_VISIBILITY_TIMEOUT', 300))  # Seconds before a stalled job is retried
+    JOB_QUEUE_MAX_ATTEMPTS = int(os.environ.get('JOB_QUEUE_MAX_ATTEMPTS', 3))
+    JOB_QUEUE_RETRY_BACKOFF = float(os.environ.get('JOB_QUEUE_RETRY_BACKOFF', 10))  # Doubles on every retry
+    MEAL_PLAN_SPECULATIVE_REGENERATION = os.environ.get('MEAL_PLAN_SPECULATIVE_REGENERATION', 'false').lower() == 'true'  # Queue a plan when details are added or change
+
+    # Single-flight coalescing of identical in-flight LLM requests
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+    SINGLE_FLIGHT_LEASE_PATH = os.environ.get('SINGLE_FLIGHT_LEASE_PATH')  # SQLite file to coalesce across workers; unset for per-worker only
+    SINGLE_FLIGHT_LEASE_TTL = float(os.environ.get('SINGLE_FLIGHT_LEASE_TTL', 120))  # Longest wait on another worker
+    SINGLE_FLIGHT_POLL_INTERVAL = float(os.environ.get('SINGLE_FLIGHT_POLL_INTERVAL', 0.2))
+
     # Connection pool settings
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_size': 5,
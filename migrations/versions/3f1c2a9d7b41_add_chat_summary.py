@@ -0,0 +1,28 @@
+"""Add rolling conversation summary to chat
+
+Revision ID: 3f1c2a9d7b41
+Revises: 188d0c4a3762
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b41'
+down_revision = '188d0c4a3762'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('summary', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('summary_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('chat', schema=None) as batch_op:
+        batch_op.drop_column('summary_until')
+        batch_op.drop_column('summary')
@@ -0,0 +1,46 @@
+"""Add meal plan job queue
+
+Revision ID: 7a2e9c4d1f60
+Revises: 3f1c2a9d7b41
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a2e9c4d1f60'
+down_revision = '3f1c2a9d7b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('meal_plan_job',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('user_message', sa.Text(), nullable=True),
+    sa.Column('mode', sa.String(length=20), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('worker_id', sa.String(length=64), nullable=True),
+    sa.Column('plan_id', sa.String(length=36), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('meal_plan_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_meal_plan_job_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('meal_plan_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_meal_plan_job_status'))
+
+    op.drop_table('meal_plan_job')
@@ -0,0 +1,41 @@
+"""Add staleness markers to meal plan
+
+Revision ID: b5d3e8f2a914
+Revises: 7a2e9c4d1f60
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d3e8f2a914'
+down_revision = '7a2e9c4d1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # meal_plan was created outside migrations on older databases
+    if not sa.inspect(op.get_bind()).has_table('meal_plan'):
+        op.create_table('meal_plan',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('user_id', sa.String(length=36), nullable=False),
+        sa.Column('plan_data', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    with op.batch_alter_table('meal_plan', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stale_since', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('stale_reason', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('meal_plan', schema=None) as batch_op:
+        batch_op.drop_column('stale_reason')
+        batch_op.drop_column('stale_since')
@@ -0,0 +1,26 @@
+"""Add the id of the last folded message to the chat summary cursor
+
+Revision ID: d4a7c1e93b28
+Revises: b5d3e8f2a914
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7c1e93b28'
+down_revision = 'b5d3e8f2a914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chat', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('summary_until_id', sa.String(length=36), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('chat', schema=None) as batch_op:
+        batch_op.drop_column('summary_until_id')